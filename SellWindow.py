@@ -1,6 +1,11 @@
 import sqlite3
 
-from database import connect_db
+from dataclasses import replace
+
+from checkout import PAYMENT_TYPES, CartLine, OversoldError, commit_cart
+from database import transaction
+from db_worker import get_executor
+from product_catalog import get_catalog
 
 try:
     from PyQt5.QtWidgets import (
@@ -18,9 +23,13 @@ try:
         QHBoxLayout,
         QTableWidget,
         QTableWidgetItem,
+        QDialog,
+        QDateEdit,
+        QCheckBox,
+        QFormLayout,
     )
     from PyQt5.QtGui import QFont, QIcon
-    from PyQt5.QtCore import Qt
+    from PyQt5.QtCore import Qt, QDate, QTimer
 except ModuleNotFoundError as e:
     # มักเกิดจากรันด้วย interpreter/venv ผิดตัว (เช่น PyCharmMiscProject\.venv)
     if getattr(e, "name", "") == "PyQt5":
@@ -31,19 +40,37 @@ except ModuleNotFoundError as e:
         ) from e
     raise
 
-from reportlab.lib.pagesizes import mm, portrait
-import os
 import sqlite3
-from datetime import datetime
 # (PyQt5 imports are consolidated above)
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A5
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfbase import pdfmetrics
 
-from paths import resource_path
+import clock
+from receipt_renderer import ReceiptPrinter, open_file, receipt_from_cart
+from reports import build_sales_report
+
+
+# ✅ ฟังก์ชันด้านล่างรันบน thread ของ DbExecutor (ห้ามแตะ widget)
+
+def checkout_job(conn, cart, payment):
+    return commit_cart(cart, db_path=conn, payment=payment)
+
+
+def load_catalog(conn):
+    # ✅ เช็ก catalog_version (+ โหลดใหม่ถ้าเปลี่ยน) บน thread อ่าน แล้วส่ง catalog กลับไปที่หน้าจอ
+    return get_catalog(conn)
+
+
+def lookup_barcode_job(conn, barcode):
+    return barcode, get_catalog(conn)
+
+
+def reset_daily_sales_job(conn, today):
+    with transaction(conn, immediate=True) as tx:
+        last_reset = tx.execute("SELECT last_reset FROM system_status").fetchone()
+        if last_reset is None or last_reset[0] != today:
+            tx.execute("UPDATE system_status SET daily_sales = 0, last_reset = ?", (today,))
+
+
+CATALOG_REFRESH_MS = 1000  # ✅ เช็กว่า main.py แก้สินค้า/รับสต็อกหรือยัง (query เดียวบน thread อ่าน)
 
 
 class SellWindow(QWidget):
@@ -57,9 +84,25 @@ class SellWindow(QWidget):
         self.sales_table.setColumnCount(5)
         self.sales_table.setHorizontalHeaderLabels(["สินค้า", "คงเหลือ", "จำนวน", "ราคาต่อหน่วย", "ราคารวม"])
 
+        # ✅ ตะกร้าแบบมีโครงสร้าง (1 CartLine ต่อ 1 แถวใน sales_table, ลำดับเดียวกัน)
+        self.cart = []
+        self.last_receipt_id = None  # ✅ เลขใบเสร็จของตะกร้าที่บันทึกแล้ว (None = ตะกร้ายังไม่ได้บันทึก)
+
+        # ✅ catalog สินค้าในหน่วยความจำ (ได้มาจาก DbExecutor) หน้าจอค้นจาก dict อย่างเดียว ไม่แตะ DB
+        self.catalog = None
+        self._catalog_pending = False
+        self.catalog_timer = QTimer(self)
+        self.catalog_timer.timeout.connect(self.refresh_catalog)
+        self.catalog_timer.start(CATALOG_REFRESH_MS)
+
+        # ✅ ฟอนต์/สไตล์ใบเสร็จโหลดครั้งเดียวตอนเปิดหน้าขาย ไม่ใช่ทุกครั้งที่กดปริ้น
+        self.receipt_printer = ReceiptPrinter(parent=self)
+        self.receipt_printer.warm()
+
         self.initUI()  # ✅ เรียก `initUI()` หลังสร้าง `sales_table`
         self.load_products()
         self.reset_daily_sales_if_needed()
+        self.refresh_catalog()
 
     def initUI(self):
         """สร้าง UI สำหรับขายสินค้า"""
@@ -122,6 +165,13 @@ class SellWindow(QWidget):
         self.price_label.setFont(QFont("Arial", 12, QFont.Bold))
         grid_layout.addWidget(self.price_label, 5, 0, 1, 2)  # ✅ วางในแถวที่ 5
 
+        # ✅ วิธีชำระเงิน (บันทึกลง sales.payment ใช้สรุปยอดในรายงานสิ้นวัน)
+        self.payment_type = QComboBox()
+        self.payment_type.addItems(PAYMENT_TYPES)
+        self.payment_type.setFont(font)
+        grid_layout.addWidget(QLabel("ชำระโดย:"), 6, 0)
+        grid_layout.addWidget(self.payment_type, 6, 1)
+
 
         # ✅ ใช้ QGroupBox แยกโซนข้อมูลสินค้า
         product_group = QGroupBox("📦 รายละเอียดสินค้า")
@@ -178,6 +228,12 @@ class SellWindow(QWidget):
         self.print_btn.clicked.connect(self.print_sales)
         layout.addWidget(self.print_btn)
 
+        # ✅ รายงานยอดขาย / ปริ้นใบเสร็จย้อนหลังทั้งช่วงวันที่ เป็น PDF ไฟล์เดียว
+        self.report_btn = QPushButton("📑 รายงานยอดขาย")
+        self.report_btn.setFont(QFont("Arial", 12))
+        self.report_btn.clicked.connect(self.open_sales_report)
+        layout.addWidget(self.report_btn)
+
         self.daily_sales_label = QLabel("📆 ยอดขายวันนี้: ฿0.00")
         layout.addWidget(self.daily_sales_label)
 
@@ -199,27 +255,46 @@ class SellWindow(QWidget):
         if not barcode:
             return
 
-        conn = self.connect_db()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT product FROM stock WHERE barcode = ?
-            UNION
-            SELECT product_name FROM product_categories WHERE barcode = ?
-        """, (barcode, barcode))
+        # ✅ ค้นจาก catalog ในหน่วยความจำ เช็กเวอร์ชันบน thread อ่านก่อน (สินค้าที่เพิ่งเพิ่มใน main.py ก็สแกนได้)
+        self.barcode_input.clear()
+        get_executor().read(lookup_barcode_job, barcode, on_result=self.on_barcode_looked_up)
 
-        product = cursor.fetchone()
-        conn.close()
+    def on_barcode_looked_up(self, result):
+        barcode, catalog = result
+        self.set_catalog(catalog)
+        product = catalog.lookup_barcode(barcode)
 
         if product:
-            self.product_input.setCurrentText(product[0])  # ✅ อัปเดตช่องเลือกสินค้า
+            if self.product_input.findText(product.name) < 0:
+                self.product_input.addItem(product.name)  # ✅ สินค้าใหม่ที่ dropdown ยังไม่มี
+            self.product_input.setCurrentText(product.name)  # ✅ อัปเดตช่องเลือกสินค้า
         else:
             QMessageBox.warning(self, "แจ้งเตือน", "❗ ไม่พบสินค้านี้!")
 
-        self.barcode_input.clear()
+    def refresh_catalog(self):
+        if self._catalog_pending:
+            return  # ✅ รอบก่อนยังไม่ได้ผล
+        self._catalog_pending = True
+        get_executor().read(load_catalog, on_result=self.on_catalog_loaded, on_error=self.on_catalog_failed)
+
+    def on_catalog_loaded(self, catalog):
+        self._catalog_pending = False
+        self.set_catalog(catalog)
+
+    def set_catalog(self, catalog):
+        if catalog is self.catalog:
+            return
+        if self.catalog is not None:
+            self.load_products()  # ✅ สินค้า/คงเหลือเปลี่ยนจากที่อื่น → dropdown ใหม่
+        self.catalog = catalog
+        self.update_price_display()  # ✅ ราคาอาจเปลี่ยน
 
-    def connect_db(self):
-        """เชื่อมต่อฐานข้อมูล (ใช้ helper กลางเพื่อ path ชัวร์)"""
-        return connect_db()
+    def on_catalog_failed(self, error):
+        self._catalog_pending = False
+        print(f"❌ โหลด catalog สินค้าไม่สำเร็จ: {error}")
+
+    def lookup_product(self, product_name):
+        return self.catalog.lookup_name(product_name) if self.catalog else None
 
     def delete_selected_product(self):
         """ลบสินค้าที่เลือกออกจากตารางขาย"""
@@ -233,6 +308,8 @@ class SellWindow(QWidget):
 
             if confirm == QMessageBox.Yes:
                 self.sales_table.removeRow(selected_row)  # ✅ ลบแถวที่เลือกออก
+                del self.cart[selected_row]
+                self.last_receipt_id = None
                 self.update_total_price()  # ✅ อัปเดตราคารวม
                 self.barcode_input.setFocus()  # ✅ โฟกัสกลับไปที่ช่องยิงบาร์โค้ด
                 print(f"🗑️ ลบสินค้า '{product_name}' ออกจากตะกร้าสำเร็จ!")
@@ -244,19 +321,17 @@ class SellWindow(QWidget):
 
         เรียงลำดับให้สินค้าที่ขายบ่อย (sold_quantity สูง) อยู่บนสุด
         """
-        conn = self.connect_db()
-        cursor = conn.cursor()
-        cursor.execute(
+        get_executor().query(
             """
             SELECT product
             FROM stock
             WHERE quantity > 0
             ORDER BY COALESCE(sold_quantity, 0) DESC, product COLLATE NOCASE ASC
-            """
+            """,
+            on_result=self.set_products,
         )
-        products = cursor.fetchall()
-        conn.close()
 
+    def set_products(self, products):
         current = self.product_input.currentText().strip() if self.product_input.currentText() else ""
         self.product_input.blockSignals(True)
         self.product_input.clear()
@@ -271,26 +346,18 @@ class SellWindow(QWidget):
 
     def reset_daily_sales_if_needed(self):
         """ รีเซ็ตยอดขายรายวันอัตโนมัติเมื่อถึงวันใหม่ """
-        conn = self.connect_db()
-        cursor = conn.cursor()
-        cursor.execute("SELECT last_reset FROM system_status")
-        last_reset = cursor.fetchone()
-        today = datetime.now().strftime("%Y-%m-%d")
-
-        if last_reset is None or last_reset[0] != today:
-            cursor.execute("UPDATE system_status SET daily_sales = 0, last_reset = ?", (today,))
-            conn.commit()
+        today = clock.day_str(clock.today())  # ✅ วันตามเวลาไทย (ตรงกับ checkout / ledger)
+        get_executor().write(reset_daily_sales_job, today, on_result=self.on_daily_sales_checked)
 
-        conn.close()
+    def on_daily_sales_checked(self, _result):
         self.update_daily_sales_label()
 
     def update_daily_sales_label(self):
         """ อัปเดตยอดขายรายวันบนหน้าจอ """
-        conn = self.connect_db()
-        cursor = conn.cursor()
-        cursor.execute("SELECT daily_sales FROM system_status")
-        daily_sales = cursor.fetchone()[0]
-        conn.close()
+        get_executor().query("SELECT daily_sales FROM system_status", on_result=self.show_daily_sales)
+
+    def show_daily_sales(self, rows):
+        daily_sales = rows[0][0]
         self.daily_sales_label.setText(f"📆 ยอดขายวันนี้: ฿{daily_sales:,.2f}")
 
     def on_table_item_changed(self, item):
@@ -308,19 +375,13 @@ class SellWindow(QWidget):
             if any(i is None or i.text().strip() == "" for i in [quantity_item, price_item]):
                 return
 
-            # ✅ ลบ "ชิ้น", "แพ็ค", "ลัง" ออกจาก quantity ก่อนแปลงเป็น int
-            raw_quantity = quantity_item.text().strip()
-            quantity = int(''.join(filter(str.isdigit, raw_quantity)))  # ✅ แยกเอาแต่ตัวเลขออกมา
-
-            unit_type = ''.join(filter(str.isalpha, raw_quantity))  # ✅ แยกเอาเฉพาะ "ชิ้น/แพ็ค/ลัง"
-            print(f"🔍 DEBUG: Quantity = {quantity}, Unit = {unit_type}")  # ✅ Debug ดูค่าที่ได้
-
-            unit_mapping = {"ชิ้น": 1, "แพ็ค": 3, "ลัง": 24}  # ✅ ใช้ค่าที่ตั้งไว้
-            conversion_factor = unit_mapping.get(unit_type, 1)
-            total_quantity = quantity * conversion_factor  # ✅ แปลงเป็นจำนวนชิ้นที่แท้จริง
-
-            unit_price = float(price_item.text())
-            total_price = total_quantity * unit_price
+            # ✅ หน่วย/จำนวนชิ้นต่อหน่วยมาจาก CartLine (ไม่ต้องเดาจากข้อความ)
+            line = self.cart[row]
+            line.quantity = int(''.join(filter(str.isdigit, quantity_item.text())))  # ✅ แยกเอาแต่ตัวเลขออกมา
+            line.unit_price = float(price_item.text().replace(",", ""))
+            self.last_receipt_id = None
+            total_price = line.total
+            print(f"🔍 DEBUG: Quantity = {line.quantity}, Unit = {line.unit_type}")  # ✅ Debug ดูค่าที่ได้
 
             self.sales_table.blockSignals(True)
             self.sales_table.setItem(row, 4, QTableWidgetItem(f"{total_price:,.2f}"))
@@ -348,30 +409,11 @@ class SellWindow(QWidget):
         customer_type = self.customer_type.currentText()
         unit_type = self.unit_type.currentText()
 
-        conn = self.connect_db()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT sell_price_retail, sell_price_wholesale, unit_conversion
-            FROM product_categories WHERE product_name = ?;
-        """, (product_name,))
-        product_data = cursor.fetchone()
-        conn.close()
-
-        if product_data:
-            price_retail, price_wholesale, unit_conversion = product_data
-            price_per_unit = price_retail if customer_type == "ลูกค้าปลีก" else price_wholesale
-
-            # ✅ แปลง unit_conversion (1:3:24) → [1, 3, 24]
-            unit_values = list(map(int, unit_conversion.split(":")))
-
-            if len(unit_values) == 3:
-                unit_per_pack, unit_per_carton = unit_values[1], unit_values[2]
-            else:
-                unit_per_pack, unit_per_carton = 1, 1
+        product = self.lookup_product(product_name)
 
-                # ✅ คำนวณราคาตามประเภทการขาย
-            unit_mapping = {"ชิ้น": 1, "แพ็ค": unit_per_pack, "ลัง": unit_per_carton}
-            price_display = price_per_unit * unit_mapping.get(unit_type, 1)
+        if product:
+            # ✅ คำนวณราคาตามประเภทการขาย
+            price_display = product.price(customer_type) * product.unit_factor(unit_type)
 
             self.price_label.setText(f"💲 ราคาขาย: ฿{price_display:,.2f} ({unit_type})")
 
@@ -389,58 +431,12 @@ class SellWindow(QWidget):
                 QMessageBox.warning(self, "⚠️ แจ้งเตือน", "กรุณาเลือกสินค้า!")
                 return
 
-            conn = self.connect_db()
-            cursor = conn.cursor()
-
-            # ✅ ดึงจำนวนคงเหลือ + unit_conversion จาก stock
-            cursor.execute(
-                """
-                SELECT quantity, unit_conversion
-                FROM stock
-                WHERE product = ?;
-                """,
-                (product_name,),
-            )
-            stock_data = cursor.fetchone()
-
-            # ✅ ดึงราคาต่อชิ้นจาก product_categories (เป็นแหล่งข้อมูลหลัก)
-            cursor.execute(
-                """
-                SELECT sell_price_retail, sell_price_wholesale
-                FROM product_categories
-                WHERE product_name = ?;
-                """,
-                (product_name,),
-            )
-            price_data = cursor.fetchone()
-            conn.close()
-
-            if not stock_data:
+            product = self.lookup_product(product_name)
+            if not product or product.stock_id is None:
                 QMessageBox.warning(self, "❌ ผิดพลาด", "ไม่พบสินค้าในสต็อก!")
                 return
 
-            stock_quantity, unit_conversion = stock_data
-
-            # fallback เผื่อไม่มีใน product_categories
-            if price_data:
-                price_retail, price_wholesale = price_data
-            else:
-                conn2 = self.connect_db()
-                cur2 = conn2.cursor()
-                cur2.execute(
-                    "SELECT sell_price_retail, sell_price_wholesale FROM stock WHERE product = ?;",
-                    (product_name,),
-                )
-                row2 = cur2.fetchone() or (0, 0)
-                conn2.close()
-                price_retail, price_wholesale = row2
-
-            price_per_unit = price_retail if customer_type == "ลูกค้าปลีก" else price_wholesale
-
-            # ✅ ดึงค่า unit_conversion (1:3:24)
-            unit_values = list(map(int, unit_conversion.split(":")))
-            unit_per_pack = unit_values[1]
-            unit_per_carton = unit_values[2]
+            price_per_unit = product.price(customer_type)
 
             # ✅ ตรวจสอบค่า quantity_input
             if quantity_input.isdigit():
@@ -449,13 +445,12 @@ class SellWindow(QWidget):
                 quantity = 1  # ✅ ตั้งค่าเริ่มต้นเป็น 1
 
             # ✅ แปลงจำนวนขายเป็น "ชิ้น"
-            unit_mapping = {"ชิ้น": 1, "แพ็ค": unit_per_pack, "ลัง": unit_per_carton}
-            total_units_sold = quantity * unit_mapping.get(unit_type, 1)
+            total_units_sold = quantity * product.unit_factor(unit_type)
 
             # ✅ ตรวจสอบว่าสต็อกพอไหม
-            if total_units_sold > stock_quantity:
+            if total_units_sold > product.quantity:
                 QMessageBox.critical(self, "❌ ข้อผิดพลาด",
-                                     f"สินค้า '{product_name}' มีไม่พอในสต็อก!\nคงเหลือ {stock_quantity} ชิ้น")
+                                     f"สินค้า '{product_name}' มีไม่พอในสต็อก!\nคงเหลือ {product.quantity} ชิ้น")
                 return  # ✅ หยุดทันทีหากสต็อกไม่พอ
 
             # ✅ เพิ่มข้อมูลลงตารางขาย
@@ -475,46 +470,30 @@ class SellWindow(QWidget):
                 print("❌ ERROR: self.sales_table ไม่มีอยู่แล้ว!")
                 return
 
-            conn = self.connect_db()
-            cursor = conn.cursor()
-
-            # ✅ ดึง unit_conversion
-            cursor.execute("SELECT unit_conversion FROM stock WHERE product = ?", (product_name,))
-            unit_conversion_data = cursor.fetchone()
-
-            if unit_conversion_data:
-                unit_values = list(map(int, unit_conversion_data[0].split(":")))
-                unit_per_pack = unit_values[1]
-                unit_per_carton = unit_values[2]
-            else:
-                unit_per_pack, unit_per_carton = 1, 1
-
-                # ✅ คำนวณจำนวนที่ขายเป็น "ชิ้น"
-            unit_mapping = {"ชิ้น": 1, "แพ็ค": unit_per_pack, "ลัง": unit_per_carton}
-            total_units_sold = quantity * unit_mapping.get(unit_type, 1)
-
-            # ✅ คำนวณราคาต่อหน่วยให้ถูกต้อง
-            price_mapping = {"ชิ้น": price_per_unit, "แพ็ค": price_per_unit * unit_per_pack,
-                             "ลัง": price_per_unit * unit_per_carton}
-            price_display = price_mapping[unit_type]
-
-            # ✅ คำนวณราคารวม
-            total_price = quantity * price_display
-
-            # ✅ ตรวจสอบคงเหลือล่าสุดจาก `sales_table` ถ้ามีสินค้าอยู่ก่อนแล้ว
-            current_stock_remaining = None
-            for row in range(self.sales_table.rowCount()):
-                item = self.sales_table.item(row, 0)
-                if item and item.text() == product_name:
-                    current_stock_remaining = int(self.sales_table.item(row, 1).text())  # ค่าคงเหลือจากตาราง
+            # ✅ id + จำนวนชิ้นต่อหน่วย + คงเหลือ มาจาก catalog ในหน่วยความจำ
+            product = self.lookup_product(product_name)
+            if not product or product.stock_id is None:
+                QMessageBox.warning(self, "❌ ผิดพลาด", "ไม่พบสินค้าในสต็อก!")
+                return
 
-            if current_stock_remaining is None:
-                # ✅ ถ้ายังไม่มีสินค้าใน `sales_table` ใช้ค่าจากฐานข้อมูล
-                cursor.execute("SELECT quantity FROM stock WHERE product = ?", (product_name,))
-                stock_quantity_data = cursor.fetchone()
-                current_stock_remaining = stock_quantity_data[0] if stock_quantity_data else 0
+            stock_id, stock_quantity = product.stock_id, product.quantity
+            unit_factor = product.unit_factor(unit_type)
+
+            # ✅ คำนวณจำนวนที่ขายเป็น "ชิ้น" + ราคาต่อหน่วยที่ขาย
+            line = CartLine(
+                stock_id=stock_id,
+                product=product_name,
+                unit_type=unit_type,
+                unit_factor=unit_factor,
+                quantity=quantity,
+                unit_price=price_per_unit * unit_factor,
+            )
+            total_units_sold = line.units
+            price_display = line.unit_price
+            total_price = line.total
 
-            conn.close()
+            # ✅ คงเหลือ = สต็อกในฐานข้อมูล - ที่อยู่ในตะกร้าแล้ว
+            current_stock_remaining = stock_quantity - sum(l.units for l in self.cart if l.stock_id == stock_id)
 
             new_stock_remaining = current_stock_remaining - total_units_sold
 
@@ -525,16 +504,20 @@ class SellWindow(QWidget):
                                      f"คงเหลือ {current_stock_remaining} ชิ้น แต่ต้องการ {total_units_sold} ชิ้น!")
                 return  # ✅ หยุดการทำงาน ไม่ให้เพิ่มสินค้าเข้าตาราง
 
+            self.cart.append(line)
+            self.last_receipt_id = None  # ✅ ตะกร้าเปลี่ยน → ไม่ใช่ใบเสร็จที่บันทึกไว้แล้ว
             row_position = self.sales_table.rowCount()
+            self.sales_table.blockSignals(True)
             self.sales_table.insertRow(row_position)
 
             # ✅ ใส่ข้อมูลในตาราง
             self.sales_table.setItem(row_position, 0, QTableWidgetItem(str(product_name)))
             self.sales_table.setItem(row_position, 1,
                                      QTableWidgetItem(str(new_stock_remaining)))  # ✅ อัปเดตคงเหลือล่าสุด
-            self.sales_table.setItem(row_position, 2, QTableWidgetItem(f"{quantity} {unit_type}"))
+            self.sales_table.setItem(row_position, 2, QTableWidgetItem(line.quantity_text))
             self.sales_table.setItem(row_position, 3, QTableWidgetItem(f"{price_display:,.2f}"))
             self.sales_table.setItem(row_position, 4, QTableWidgetItem(f"{total_price:,.2f}"))
+            self.sales_table.blockSignals(False)
 
             self.sales_table.scrollToBottom()
             self.sales_table.repaint()
@@ -550,252 +533,168 @@ class SellWindow(QWidget):
 
     def save_sales(self):
         """บันทึกข้อมูลการขายลงฐานข้อมูล และอัปเดตสต็อก"""
-        try:
-            conn = self.connect_db()
-            cursor = conn.cursor()
+        if not self.cart:
+            return
 
-            total_sales = 0  # ยอดขายรวมของรอบนี้
-            sales_data = []  # เก็บข้อมูลสำหรับอัปเดตสต็อก
+        # ✅ ทั้งตะกร้า = 1 transaction (BEGIN IMMEDIATE) + executemany, สต็อกไม่พอ = ไม่บันทึกอะไรเลย
+        # ✅ รายการขายถูกบันทึกลง `sales` ภายใต้เลขใบเสร็จเดียวกัน
+        # ✅ เขียนบน DbExecutor (ส่งสำเนาตะกร้าไป) → หน้าจอไม่ค้างระหว่างรอล็อก DB
+        self.save_sales_btn.setEnabled(False)  # ✅ กันกดบันทึกซ้ำระหว่างรอ
+        get_executor().write(
+            checkout_job, [replace(line) for line in self.cart], self.payment_type.currentText(),
+            on_result=self.on_sales_saved, on_error=self.on_sales_failed,
+        )
 
-            for row in range(self.sales_table.rowCount()):
-                product_item = self.sales_table.item(row, 0)  # สินค้า
-                quantity_item = self.sales_table.item(row, 2)  # จำนวน
-                total_price_item = self.sales_table.item(row, 4)  # ราคารวม
-
-                if not all([product_item, quantity_item, total_price_item]):
-                    continue  # ข้ามแถวที่ไม่มีข้อมูลครบ
-
-                product = product_item.text()
-                raw_quantity = quantity_item.text().strip()
-                total_price = float(total_price_item.text().replace(",", ""))
-
-                # ✅ แยกจำนวนและหน่วยสินค้าออกจากกัน
-                quantity = int(''.join(filter(str.isdigit, raw_quantity)))  # แยกตัวเลขออกจากข้อความ
-                if "ลัง" in raw_quantity:
-                    unit_type = "ลัง"
-                elif "แพ็ค" in raw_quantity:
-                    unit_type = "แพ็ค"
-                else:
-                    unit_type = "ชิ้น"
-
-                # ✅ ดึงค่าหน่วยต่อลังจากฐานข้อมูล
-                cursor.execute("SELECT unit_conversion FROM stock WHERE product = ?", (product,))
-                unit_conversion_data = cursor.fetchone()
-
-                if unit_conversion_data:
-                    unit_values = list(map(int, unit_conversion_data[0].split(":")))  # แปลง "1:3:24" → [1,3,24]
-                    unit_per_pack = unit_values[1]
-                    unit_per_carton = unit_values[2]
-                else:
-                    unit_per_pack, unit_per_carton = 1, 1  # ตั้งค่าเริ่มต้น
-
-                # ✅ แปลงจำนวนให้เป็น "ชิ้น"
-                unit_mapping = {"ชิ้น": 1, "แพ็ค": unit_per_pack, "ลัง": unit_per_carton}
-                total_units_sold = quantity * unit_mapping[unit_type]
-
-                # ✅ อัปเดตสต็อกให้ลดลง
-                cursor.execute("""
-                    UPDATE stock 
-                    SET quantity = quantity - ?, 
-                        sold_quantity = COALESCE(sold_quantity, 0) + ?, 
-                        sold_revenue = COALESCE(sold_revenue, 0) + ?
-                    WHERE product = ? AND quantity >= ?;
-                """, (total_units_sold, total_units_sold, total_price, product, total_units_sold))
-
-                total_sales += total_price
-                sales_data.append((product, quantity, unit_type, total_price))
-
-            # ✅ อัปเดตยอดขายรายวัน
-            cursor.execute("UPDATE system_status SET daily_sales = daily_sales + ?", (total_sales,))
-            conn.commit()
-            conn.close()
-
-            # ✅ อัปเดตแสดงผลยอดขายรายวัน และจำนวนที่ขายออก
-            self.update_daily_sales_label()
-            self.update_stock_display()  # โหลดข้อมูลใหม่จากฐานข้อมูล
-            self.load_products()  # ✅ รีเรียง dropdown ตามสินค้าขายบ่อย
-
-            QMessageBox.information(self, "✅ สำเร็จ", "บันทึกข้อมูลการขายและอัปเดตสต็อกเรียบร้อยแล้ว!")
+    def on_sales_saved(self, receipt_id):
+        self.save_sales_btn.setEnabled(True)
+        self.last_receipt_id = receipt_id
 
-        except Exception as e:
-            print(f"❌ ERROR ใน save_sales(): {e}")
+        # ✅ อัปเดตแสดงผลยอดขายรายวัน และจำนวนที่ขายออก
+        self.update_daily_sales_label()
+        self.update_stock_display()  # โหลดข้อมูลใหม่จากฐานข้อมูล
+        self.load_products()  # ✅ รีเรียง dropdown ตามสินค้าขายบ่อย
+        self.refresh_catalog()  # ✅ คงเหลือเปลี่ยนแล้ว
+
+        QMessageBox.information(self, "✅ สำเร็จ", "บันทึกข้อมูลการขายและอัปเดตสต็อกเรียบร้อยแล้ว!")
+
+    def on_sales_failed(self, error):
+        self.save_sales_btn.setEnabled(True)
+        if isinstance(error, OversoldError):
+            details = "\n".join(f"{p}: ต้องการ {want} ชิ้น คงเหลือ {have} ชิ้น" for p, want, have in error.shortages)
+            QMessageBox.critical(self, "❌ สต็อกไม่พอ", f"ยังไม่ได้บันทึกการขาย\n{details}")
+            self.update_stock_display()
+            return
+
+        print(f"❌ ERROR ใน save_sales(): {error}")
 
     def update_stock_display(self):
         """โหลดข้อมูลสต็อกใหม่และอัปเดตจำนวนคงเหลือในตาราง"""
-        try:
-            conn = self.connect_db()
-            cursor = conn.cursor()
+        names = [self.sales_table.item(row, 0).text() for row in range(self.sales_table.rowCount())]
+        if not names:
+            return
 
+        # ✅ ดึงข้อมูลสต็อกปัจจุบันจากฐานข้อมูล (query เดียวทุกแถว)
+        placeholders = ",".join("?" * len(set(names)))
+        get_executor().query(
+            f"SELECT product, quantity FROM stock WHERE product IN ({placeholders}) ORDER BY id DESC",
+            list(set(names)),
+            on_result=self.show_stock_remaining,
+        )
+
+    def show_stock_remaining(self, rows):
+        try:
+            # ✅ ORDER BY id DESC: ชื่อซ้ำให้แถวแรก (id น้อยสุด) ชนะ เหมือน fetchone() เดิม
+            on_hand = dict(rows)
             for row in range(self.sales_table.rowCount()):
                 product_name = self.sales_table.item(row, 0).text()
-
-                # ✅ ดึงข้อมูลสต็อกปัจจุบันจากฐานข้อมูล
-                cursor.execute("SELECT quantity FROM stock WHERE product = ?", (product_name,))
-                stock_data = cursor.fetchone()
-
-                if stock_data:
-                    new_stock = stock_data[0]
+                if product_name in on_hand:
+                    new_stock = on_hand[product_name]
                     self.sales_table.setItem(row, 1, QTableWidgetItem(str(new_stock)))  # ✅ อัปเดตคงเหลือในตารางขาย
 
-            conn.close()
             print("✅ อัปเดตข้อมูลสต็อกเรียบร้อยแล้ว!")
 
         except Exception as e:
             print(f"❌ ERROR ใน update_stock_display(): {e}")
 
     def print_sales(self):
-        """บันทึกใบเสร็จ PDF แยกเก็บเป็น receipts/ใบเสร็จ_YYYY-MM-DD_HH-MM-SS.pdf"""
+        """พิมพ์ใบเสร็จของตะกร้าปัจจุบัน (เรนเดอร์บน thread ของ ReceiptPrinter ไม่บล็อกหน้าจอ)
 
-        if self.sales_table.rowCount() == 0:
+        ไม่ได้ตั้งเครื่องพิมพ์ → บันทึก PDF ที่ receipts/ใบเสร็จ_YYYY-MM-DD_HH-MM-SS.pdf แล้วเปิดให้ดู
+        ตั้ง MIMISTOCK_RECEIPT_PRINTER → ส่ง ESC/POS ไปที่เครื่องพิมพ์ใบเสร็จโดยตรง
+        """
+        if not self.cart:
             QMessageBox.warning(self, "⚠️ แจ้งเตือน", "ไม่มีรายการขาย!")
             return
 
-        # ✅ ตรวจสอบและสร้างโฟลเดอร์ receipts ถ้ายังไม่มี
-        receipts_dir = "receipts"
-        if not os.path.exists(receipts_dir):
-            os.makedirs(receipts_dir)
-
-        # ✅ เปลี่ยน `:` เป็น `-` ในชื่อไฟล์ (Windows รองรับ)
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        pdf_filename = f"{receipts_dir}/ใบเสร็จ_{timestamp}.pdf"
-
-        # ✅ ปรับขนาดกระดาษให้เหมาะกับเครื่องพิมพ์ใบเสร็จ
-        page_width = 80 * mm
-        page_height = 120 * mm
-
-        doc = SimpleDocTemplate(
-            pdf_filename,
-            pagesize=portrait((page_width, page_height)),
-            leftMargin=1 * mm,
-            rightMargin=1 * mm,
-            topMargin=0 * mm,
-            bottomMargin=0 * mm
+        # ✅ ส่งสำเนาตะกร้า (Receipt เป็น immutable) ไปเรนเดอร์เบื้องหลัง
+        # ✅ บันทึกแล้ว → พิมพ์เลขใบเสร็จเดียวกับใน sales (ตรงกับใบที่พิมพ์ซ้ำจากรายงานยอดขาย)
+        self.receipt_printer.print_receipt(
+            receipt_from_cart(self.cart, receipt_id=self.last_receipt_id, payment=self.payment_type.currentText()),
+            on_result=self.on_receipt_printed, on_error=self.on_receipt_failed,
         )
 
-        # ✅ โหลดฟอนต์ภาษาไทย (รองรับทั้งรันจากซอร์ส และตอนเป็นไฟล์ .exe ของ PyInstaller)
-        # หมายเหตุ: ใน Paragraph ที่มี <b> จะเรียกใช้ฟอนต์ bold ถ้าไม่ register ไว้จะ fallback แล้วกลายเป็น "ต่างดาว/สี่เหลี่ยม"
-        font_regular = resource_path("THSarabunNew.ttf")
-        font_bold = resource_path("THSarabunNew Bold.ttf")
-        font_italic = resource_path("THSarabunNew Italic.ttf")
-        font_bold_italic = resource_path("THSarabunNew BoldItalic.ttf")
-
-        if font_regular.exists():
-            pdfmetrics.registerFont(TTFont("THSarabunNew", str(font_regular)))
-            # register bold/italic ถ้ามี (เพื่อรองรับ <b> และ <i>)
-            if font_bold.exists():
-                pdfmetrics.registerFont(TTFont("THSarabunNew-Bold", str(font_bold)))
-            if font_italic.exists():
-                pdfmetrics.registerFont(TTFont("THSarabunNew-Italic", str(font_italic)))
-            if font_bold_italic.exists():
-                pdfmetrics.registerFont(TTFont("THSarabunNew-BoldItalic", str(font_bold_italic)))
-
-            try:
-                pdfmetrics.registerFontFamily(
-                    "THSarabunNew",
-                    normal="THSarabunNew",
-                    bold="THSarabunNew-Bold",
-                    italic="THSarabunNew-Italic",
-                    boldItalic="THSarabunNew-BoldItalic",
-                )
-            except Exception:
-                # ถ้าบางตัวไม่มี ก็ยังใช้ regular ได้
-                pass
-
-            font_name = "THSarabunNew"
+    def on_receipt_printed(self, target):
+        if self.receipt_printer.printer is None:
+            # ✅ เปิดไฟล์ PDF อัตโนมัติ (os.startfile ไม่ผ่าน shell)
+            open_file(target)
+            QMessageBox.information(self, "✅ สำเร็จ", f"บันทึกใบเสร็จที่ {target} สำเร็จ!")
         else:
-            # ถ้าไม่เจอฟอนต์ไทย จะทำให้ภาษาไทยเพี้ยน/เป็นต่างดาวได้
-            font_name = "Helvetica"
-
-        styles = getSampleStyleSheet()
-        styles["Normal"].fontName = font_name
-        styles["Normal"].fontSize = 14
-        styles["Normal"].leading = 16
-
-        # ✅ บรรทัดแรก: "ใบเสร็จรับเงิน" อยู่ตรงกลาง
-        header_table = Table([
-            [Paragraph("<b>ใบเสร็จรับเงิน</b>", styles["Normal"])]
-        ], colWidths=[30 * mm])
-
-        header_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),  # ใบเสร็จรับเงิน อยู่ตรงกลาง
-        ]))
-
-        # ✅ บรรทัดที่สอง: "ร้านค้า Mimee_shop" อยู่ซ้าย + "วันที่และเวลา" อยู่ขวา
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        shop_date_table = Table([
-            [Paragraph("<b>ร้านค้า Mimee_shop</b>", styles["Normal"]),  # ร้านค้า Mimee_shop ชิดซ้าย
-             Paragraph(f"<b>วันที่:</b> {now}", styles["Normal"])]  # วันที่+เวลา ชิดขวา
-        ], colWidths=[35 * mm, 45 * mm])
-
-        shop_date_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (0, 0), 'LEFT'),  # ร้านค้า Mimee_shop ชิดซ้าย
-            ('ALIGN', (1, 0), (1, 0), 'RIGHT'),  # วันที่ + เวลา ชิดขวา
-        ]))
-
-        # ✅ ตารางสินค้า
-        data = [
-            [Paragraph("<b>สินค้า</b>", styles["Normal"]),
-             Paragraph("<b>จำนวน</b>", styles["Normal"]),
-             Paragraph("<b>ราคาต่อหน่วย</b>", styles["Normal"]),
-             Paragraph("<b>ราคารวม</b>", styles["Normal"])]
-        ]
-        total_amount = 0
+            print(f"🖨️ ส่งใบเสร็จไปที่ {target} แล้ว")
 
-        for row in range(self.sales_table.rowCount()):
-            product_name = self.sales_table.item(row, 0).text()
-            quantity = self.sales_table.item(row, 2).text()
-            unit_price = self.sales_table.item(row, 3).text()
-            total_price = self.sales_table.item(row, 4).text()
-
-            data.append([
-                Paragraph(product_name, styles["Normal"]),
-                Paragraph(quantity, styles["Normal"]),
-                Paragraph(f"฿{unit_price}", styles["Normal"]),
-                Paragraph(f"฿{total_price}", styles["Normal"])
-            ])
-            total_amount += float(total_price.replace(",", ""))
-
-        # ✅ ปรับขนาดตารางให้เหมาะกับใบเสร็จ (70 mm)
-        table = Table(data, colWidths=[30 * mm, 10 * mm, 15 * mm, 15 * mm])
-        table.setStyle(TableStyle([
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, -1), font_name),
-            ('FONTSIZE', (0, 0), (-1, -1), 14),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-            ('TOPPADDING', (0, 0), (-1, -1), 2),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('BOX', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-
-        # ✅ สรุปราคารวม
-        total_table = Table([[Paragraph(f"<b>รวมทั้งหมด:</b> ฿{total_amount:,.2f}", styles["Normal"])]],
-                            colWidths=[70 * mm])
-        total_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ]))
-
-        # ✅ รวม Layout ทั้งหมด
-        elements = [
-            header_table,
-            shop_date_table,
-            table,total_table
-        ]
-
-        # ✅ บันทึก PDF แยกไฟล์ตามวันเวลา
-        doc.build(elements)
-
-        # ✅ เปิดไฟล์ PDF อัตโนมัติ
-        os.system(f"start {pdf_filename}")
-
-        QMessageBox.information(self, "✅ สำเร็จ", f"บันทึกใบเสร็จที่ {pdf_filename} สำเร็จ!")
+    def on_receipt_failed(self, error):
+        QMessageBox.critical(self, "❌ ข้อผิดพลาด", f"พิมพ์ใบเสร็จไม่สำเร็จ: {error}")
+
+    def open_sales_report(self):
+        SalesReportDialog(self.receipt_printer, self).exec_()
 
     def closeEvent(self, event):
         """ล้างตารางเมื่อปิดหน้าต่าง"""
         self.sales_table.setRowCount(0)
+        self.cart.clear()
+        self.last_receipt_id = None
         event.accept()
 
 
+class SalesReportDialog(QDialog):
+    """เลือกช่วงวันที่ → สร้าง PDF: Z-Report (ยอดตามสินค้า/วิธีชำระ) + ใบเสร็จทุกใบในช่วงนั้น"""
+
+    def __init__(self, receipt_printer, parent=None):
+        super().__init__(parent)
+        self.receipt_printer = receipt_printer
+        self.setWindowTitle("📑 รายงานยอดขาย")
+
+        today = QDate.fromString(clock.day_str(clock.today()), "yyyy-MM-dd")
+        self.date_from = QDateEdit(today)
+        self.date_to = QDateEdit(today)
+        for edit in (self.date_from, self.date_to):
+            edit.setCalendarPopup(True)
+            edit.setDisplayFormat("yyyy-MM-dd")
+        self.include_receipts = QCheckBox("พิมพ์ใบเสร็จทุกใบต่อท้าย")
+        self.include_receipts.setChecked(True)
+
+        form = QFormLayout()
+        form.addRow("ตั้งแต่วันที่:", self.date_from)
+        form.addRow("ถึงวันที่:", self.date_to)
+        form.addRow(self.include_receipts)
+
+        self.build_btn = QPushButton("📄 สร้าง PDF")
+        self.build_btn.clicked.connect(self.build_report)
+        self.status_label = QLabel("")
+
+        layout = QVBoxLayout()
+        layout.addLayout(form)
+        layout.addWidget(self.build_btn)
+        layout.addWidget(self.status_label)
+        self.setLayout(layout)
+
+    def build_report(self):
+        first = self.date_from.date().toPyDate()
+        last = self.date_to.date().toPyDate()
+        if last < first:
+            QMessageBox.warning(self, "⚠️ แจ้งเตือน", "วันที่สิ้นสุดต้องไม่ก่อนวันที่เริ่ม")
+            return
+
+        # ✅ อ่าน sales + สร้าง PDF บน thread ของ ReceiptPrinter (หน้าจอไม่ค้าง)
+        self.build_btn.setEnabled(False)
+        self.status_label.setText("🔄 กำลังสร้างรายงาน...")
+        self.receipt_printer.submit(
+            build_sales_report, first, last, self.include_receipts.isChecked(),
+            on_result=self.on_report_built, on_error=self.on_report_failed,
+        )
+
+    def on_report_built(self, report):
+        self.build_btn.setEnabled(True)
+        self.status_label.setText(
+            f"✅ {report.receipts:,} ใบเสร็จ | ยอดรวม ฿{report.revenue:,.2f}\n{report.path}"
+        )
+        open_file(report.path)
+
+    def on_report_failed(self, error):
+        self.build_btn.setEnabled(True)
+        self.status_label.setText("")
+        QMessageBox.critical(self, "❌ ข้อผิดพลาด", f"สร้างรายงานไม่สำเร็จ: {error}")
+
+
 
 if __name__ == "__main__":
     import sys
@@ -804,6 +703,3 @@ if __name__ == "__main__":
     window = SellWindow()
     window.show()
     sys.exit(app.exec_())
-
-
-
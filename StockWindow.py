@@ -1,14 +1,20 @@
+import json
 import sqlite3
 import uuid
+from datetime import timedelta
 
-from database import connect_db
+from clock import timestamp, today
+from database import ORDERS_TO_RECEIVE, transaction
+from db_worker import get_executor
+from product_catalog import invalidate_catalog
+from product_units import ProductUnits
+from stock_ledger import ADJUSTMENT, RECEIPT, audit_stock, movements_for, quantity_on, record_movements
 
 try:
     from PyQt5.QtWidgets import (
         QWidget,
         QVBoxLayout,
-        QTableWidget,
-        QTableWidgetItem,
+        QTableView,
         QPushButton,
         QMessageBox,
         QLabel,
@@ -18,6 +24,7 @@ try:
         QFormLayout,
         QComboBox,
         QGridLayout,
+        QDialog,
     )
     from PyQt5.QtGui import QColor
     from PyQt5.QtCore import pyqtSignal, QTimer
@@ -30,6 +37,143 @@ except ModuleNotFoundError as e:
         ) from e
     raise
 
+from table_models import RowTableModel
+
+# ✅ สีของสต็อกที่เหลือน้อย (สร้างครั้งเดียว)
+LOW_STOCK_COLORS = (QColor("#FF6666"), QColor("#FFFFFF"))  # พื้นแดง ตัวหนังสือขาว
+
+
+def low_stock_style(row, column):
+    """ถ้าสต็อกเหลือน้อยกว่า 5 ชิ้น ให้คอลัมน์คงเหลือเป็นสีแดง"""
+    if column == 3 and int(row[3] or 0) < 5:
+        return LOW_STOCK_COLORS
+    return None
+
+
+def apply_delivered_orders(conn):
+    """เพิ่มสต็อกจากออเดอร์ที่จัดส่งสำเร็จแต่ยังไม่ processed (รันบน DbExecutor) คืนจำนวนออเดอร์
+
+    รวมจำนวนต่อสินค้าด้วย GROUP BY แล้ว UPSERT สินค้าละครั้ง + ตั้ง processed = 1 ทีเดียว
+    ใน transaction เดียว → งานเท่ากับจำนวนสินค้า ไม่ใช่จำนวนออเดอร์
+    """
+    print("🔄 update_stock_from_orders() ถูกเรียกแล้ว!")
+
+    with transaction(conn, immediate=True) as tx:
+        # ✅ รวมออเดอร์ที่จัดส่งสำเร็จแต่ยังไม่ processed ต่อสินค้า + ข้อมูลจาก product_categories
+        pending = tx.execute(f"""
+            SELECT o.product, SUM(COALESCE(o.unit_per_item, 1)), COUNT(*), pc.id,
+                   pc.sell_price_retail, pc.sell_price_wholesale, pc.barcode, pc.unit_conversion,
+                   pc.units_per_pack, pc.units_per_carton
+            FROM orders o
+            LEFT JOIN product_categories pc ON pc.product_name = o.product
+            WHERE {ORDERS_TO_RECEIVE}
+            GROUP BY o.product
+        """).fetchall()
+
+        if not pending:
+            print("ℹ️ ไม่มีออเดอร์ใหม่ที่ต้องเพิ่มเข้าสต็อก")
+            return 0
+
+        params = []
+        per_carton = {}
+        for (product, items, orders, category_id, retail, wholesale, barcode, unit_conversion,
+             units_per_pack, units_per_carton) in pending:
+            if category_id is None:
+                retail = wholesale = 0
+                barcode = "ไม่พบข้อมูล"
+                unit_conversion = "1:1"
+                units_per_pack = units_per_carton = 1
+            unit_conversion = unit_conversion or "1:1"
+
+            # ✅ unit_per_item คือจำนวนลัง → คูณจำนวนชิ้นต่อลัง (คอลัมน์ units_per_carton ไม่ต้อง parse ข้อความ)
+            total_units = items * units_per_carton
+            per_carton[product] = units_per_carton
+            print(f"🔄 รับเข้า {product}: +{total_units} ชิ้น ({orders} ออเดอร์)")
+            params.append((product, total_units, retail, wholesale, barcode, unit_conversion, units_per_pack, units_per_carton))
+
+        # ✅ มีสินค้าแล้ว → บวกจำนวนเพิ่ม, ยังไม่มี → เพิ่มแถวใหม่ (stock.product เป็น UNIQUE)
+        tx.executemany("""
+            INSERT INTO stock (product, quantity, date_received, sell_price_retail, sell_price_wholesale, barcode,
+                               unit_conversion, units_per_pack, units_per_carton)
+            VALUES (?, ?, CURRENT_TIMESTAMP, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (product) DO UPDATE SET
+                quantity = quantity + excluded.quantity,
+                date_received = excluded.date_received,
+                sell_price_retail = excluded.sell_price_retail,
+                sell_price_wholesale = excluded.sell_price_wholesale,
+                barcode = excluded.barcode,
+                unit_conversion = excluded.unit_conversion,
+                units_per_pack = excluded.units_per_pack,
+                units_per_carton = excluded.units_per_carton;
+        """, params)
+
+        # ✅ บันทึก stock_movements ออเดอร์ละแถว (source = เลขออเดอร์) ด้วย INSERT ... SELECT ครั้งเดียว
+        tx.execute(f"""
+            INSERT INTO stock_movements (product, stock_id, kind, qty, source_type, source_id, moved_at)
+            SELECT o.product, s.id, ?, COALESCE(o.unit_per_item, 1) * f.value, 'order', CAST(o.id AS TEXT), ?
+            FROM orders o
+            JOIN json_each(?) f ON f.key = o.product
+            JOIN stock s ON s.product = o.product
+            WHERE {ORDERS_TO_RECEIVE}
+        """, (RECEIPT, timestamp(), json.dumps(per_carton, ensure_ascii=False)))
+
+        # ✅ เงื่อนไขเดียวกับตอนรวมยอด และอยู่ใน transaction เดียวกัน → ตรงกันทุกออเดอร์
+        processed = tx.execute(f"UPDATE orders SET processed = 1 WHERE {ORDERS_TO_RECEIVE}").rowcount
+        print(f"✅ อัปเดต processed = 1 ให้ {processed} ออเดอร์")
+
+    print("✅ Commit ฐานข้อมูลสำเร็จ!")
+    invalidate_catalog()  # ✅ จำนวนคงเหลือเปลี่ยน → ให้ SellWindow โหลด catalog ใหม่
+    return processed
+
+
+# ✅ ช่วงประวัติที่แสดงในหน้าตรวจสอบสต็อก
+HISTORY_DAYS = 30
+
+MOVEMENT_KINDS = {"receipt": "รับเข้า", "sale": "ขาย", "adjustment": "ปรับยอด"}
+
+
+def load_stock_history(conn, product):
+    """ประวัติการเคลื่อนไหว HISTORY_DAYS วันของสินค้า + สินค้าที่ยอดไม่ตรง ledger (รันบน DbExecutor)
+
+    อ่านจาก index ทั้งหมด (snapshot ล่าสุด + ผลรวมช่วง) ไม่ต้องไล่คำนวณประวัติทั้งหมดใหม่
+    """
+    last = today()
+    first = last - timedelta(days=HISTORY_DAYS - 1)
+    opening = quantity_on(conn, product, first - timedelta(days=1))
+    return opening, movements_for(conn, product, first, last), audit_stock(conn)
+
+
+def save_product_category(conn, product_name, barcode, sku_prefix, sell_price_retail, sell_price_wholesale, units):
+    """เพิ่ม/อัปเดต product_categories (รันบน DbExecutor) คืน True ถ้าเป็นการอัปเดตสินค้าเดิม
+
+    units คือ ProductUnits → เก็บทั้งข้อความ unit_conversion และคอลัมน์ตัวเลข units_per_pack/units_per_carton
+    """
+    with transaction(conn) as tx:
+        cursor = tx.cursor()
+
+        # ✅ ตรวจสอบว่าสินค้ามีอยู่แล้วหรือไม่
+        cursor.execute("SELECT COUNT(*) FROM product_categories WHERE product_name = ?", (product_name,))
+        exists = cursor.fetchone()[0]
+
+        if exists:
+            cursor.execute("""
+                UPDATE product_categories 
+                SET sell_price_retail = ?, sell_price_wholesale = ?, sku_prefix = ?, barcode = ?, unit_conversion = ?,
+                    units_per_pack = ?, units_per_carton = ?
+                WHERE product_name = ?;
+            """, (sell_price_retail, sell_price_wholesale, sku_prefix, barcode, units.conversion,
+                  units.per_pack, units.per_carton, product_name))
+        else:
+            cursor.execute("""
+                INSERT INTO product_categories (product_name, barcode, sku_prefix, sell_price_retail, sell_price_wholesale,
+                                                unit_conversion, units_per_pack, units_per_carton)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+            """, (product_name, barcode, sku_prefix, sell_price_retail, sell_price_wholesale, units.conversion,
+                  units.per_pack, units.per_carton))
+
+    invalidate_catalog()  # ✅ ราคา/บาร์โค้ด/หน่วยเปลี่ยน
+    return bool(exists)
+
 
 class StockWindow(QWidget):
     product_added = pyqtSignal()  # ✅ เพิ่ม signal แจ้งเตือนเมื่อมีสินค้าใหม่
@@ -39,9 +183,6 @@ class StockWindow(QWidget):
         self.setWindowTitle("📦 จัดการสต็อกสินค้า")
         self.setGeometry(300, 200, 1000, 600)
 
-        # ✅ เช็คและเพิ่มคอลัมน์ unit_per_item ถ้ายังไม่มี
-        self.ensure_unit_per_item_column()
-
         # ✅ Layout หลัก
         self.layout = QVBoxLayout()
 
@@ -65,151 +206,15 @@ class StockWindow(QWidget):
         self.update_timer.timeout.connect(self.load_product_categories_data)
         self.update_timer.start(10000)  # 10 วินาที
 
-    def ensure_unit_per_item_column(self):
-        """ตรวจสอบและเพิ่มคอลัมน์ unit_per_item ในตาราง stock, product_categories และ orders ถ้ายังไม่มี"""
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        try:
-            ### ✅ ตรวจสอบและเพิ่ม unit_per_item ใน stock ###
-            cursor.execute("PRAGMA table_info(stock);")
-            stock_columns = [row[1] for row in cursor.fetchall()]
-            if "unit_per_item" not in stock_columns:
-                print("⚠️ กำลังเพิ่ม unit_per_item ใน stock...")
-                cursor.execute("ALTER TABLE stock ADD COLUMN unit_per_item INTEGER DEFAULT 1;")
-                conn.commit()
-                cursor.execute("VACUUM;")  # ✅ รีเฟรช schema
-                conn.commit()
-                print("✅ เพิ่มคอลัมน์ 'unit_per_item' ใน stock สำเร็จ!")
-
-            ### ✅ ตรวจสอบและเพิ่ม unit_per_item ใน product_categories ###
-            cursor.execute("PRAGMA table_info(product_categories);")
-            product_columns = [row[1] for row in cursor.fetchall()]
-            if "unit_per_item" not in product_columns:
-                print("⚠️ กำลังเพิ่ม unit_per_item ใน product_categories...")
-                cursor.execute("ALTER TABLE product_categories ADD COLUMN unit_per_item INTEGER DEFAULT 1;")
-                conn.commit()
-                cursor.execute("VACUUM;")  # ✅ รีเฟรช schema
-                conn.commit()
-                print("✅ เพิ่มคอลัมน์ 'unit_per_item' ใน product_categories สำเร็จ!")
-
-            ### ✅ ตรวจสอบและเพิ่ม unit_per_item ใน orders ###
-            cursor.execute("PRAGMA table_info(orders);")
-            orders_columns = [row[1] for row in cursor.fetchall()]
-            if "unit_per_item" not in orders_columns:
-                print("⚠️ กำลังเพิ่ม unit_per_item ใน orders...")
-                cursor.execute("ALTER TABLE orders ADD COLUMN unit_per_item INTEGER DEFAULT 1;")
-                conn.commit()
-                cursor.execute("VACUUM;")  # ✅ รีเฟรช schema
-                conn.commit()
-                print("✅ เพิ่มคอลัมน์ 'unit_per_item' ใน orders สำเร็จ!")
-
-            # ✅ Debug Schema หลังอัปเดต
-            cursor.execute("PRAGMA table_info(stock);")
-
-
-            cursor.execute("PRAGMA table_info(product_categories);")
-
-
-            cursor.execute("PRAGMA table_info(orders);")
-
-
-        except sqlite3.Error as e:
-            print(f"❌ Error: {e}")
-
-        finally:
-            conn.close()
-
     def update_stock_from_orders(self):
-        """อัปเดตสินค้าจากออเดอร์ที่จัดส่งสำเร็จ"""
-        conn = self.connect_db()
-        cursor = conn.cursor()
-
-        try:
-            print("🔄 update_stock_from_orders() ถูกเรียกแล้ว!")
-
-            # ✅ ดึงออเดอร์ที่จัดส่งพัสดุสำเร็จ แต่ยังไม่ processed
-            cursor.execute("""
-                SELECT id, product, unit_per_item
-                FROM orders
-                WHERE status = 'จัดส่งพัสดุสำเร็จ' 
-                AND processed = 0 
-                AND tracking IS NOT NULL
-            """)
-            orders = cursor.fetchall()
-
-            if not orders:
-                print("ℹ️ ไม่มีออเดอร์ใหม่ที่ต้องเพิ่มเข้าสต็อก")
-                return
-
-            updated_orders = []
-
-            for order_id, product, unit_per_item in orders:
-                # ✅ ดึงข้อมูล unit_conversion จาก `product_categories`
-                cursor.execute("""
-                    SELECT sell_price_retail, sell_price_wholesale, barcode, unit_conversion 
-                    FROM product_categories 
-                    WHERE product_name = ?
-                """, (product,))
-                product_data = cursor.fetchone()
-
-                if product_data:
-                    sell_price_retail, sell_price_wholesale, barcode, unit_conversion = product_data
-                else:
-                    sell_price_retail = sell_price_wholesale = 0
-                    barcode = "ไม่พบข้อมูล"
-                    unit_conversion = "1:1"
+        """อัปเดตสินค้าจากออเดอร์ที่จัดส่งสำเร็จ (เขียนบน DbExecutor ไม่บล็อกหน้าจอ)"""
+        get_executor().write(apply_delivered_orders, on_result=self.on_stock_updated, on_error=self.on_stock_update_failed)
 
-                # ✅ แปลง unit_conversion (1:3:24) → [1, 3, 24]
-                unit_values = list(map(int, unit_conversion.split(":")))
-
-                if len(unit_values) == 3:
-                    unit_per_pack, unit_per_carton = unit_values[1], unit_values[2]
-                else:
-                    unit_per_pack, unit_per_carton = 1, 1
-
-                    # ✅ คำนวณจำนวนชิ้นจากจำนวนลังที่สั่งเข้า
-                total_units = unit_per_item * unit_per_carton  # ✅ คูณจำนวนลังด้วยจำนวนชิ้นต่อลัง
-
-                # ✅ ตรวจสอบว่าสินค้ามีอยู่ในสต็อกหรือยัง
-                cursor.execute("SELECT id, quantity FROM stock WHERE product = ?", (product,))
-                existing_stock = cursor.fetchone()
-
-                if existing_stock:
-                    stock_id, current_quantity = existing_stock
-                    new_quantity = current_quantity + total_units
-                    print(f"🔄 อัปเดต {product}: {current_quantity} → {new_quantity} ชิ้น")
-
-                    cursor.execute("""
-                        UPDATE stock 
-                        SET quantity = ?, date_received = CURRENT_TIMESTAMP, 
-                            sell_price_retail = ?, sell_price_wholesale = ?, barcode = ?, unit_conversion = ?
-                        WHERE id = ?;
-                    """, (new_quantity, sell_price_retail, sell_price_wholesale, barcode, unit_conversion, stock_id))
-
-                else:
-                    cursor.execute("""
-                        INSERT INTO stock (product, quantity, date_received, sell_price_retail, sell_price_wholesale, barcode, unit_conversion)
-                        VALUES (?, ?, CURRENT_TIMESTAMP, ?, ?, ?, ?);
-                    """, (product, total_units, sell_price_retail, sell_price_wholesale, barcode, unit_conversion))
-                    print(f"✅ เพิ่มสินค้าใหม่ {product} จำนวน {total_units} ใน stock")
-
-                updated_orders.append(order_id)
-
-            if updated_orders:
-                cursor.executemany("UPDATE orders SET processed = 1 WHERE id = ?",
-                                   [(order_id,) for order_id in updated_orders])
-                print(f"✅ อัปเดต processed = 1 ให้ {len(updated_orders)} ออเดอร์")
-
-            conn.commit()
-            print("✅ Commit ฐานข้อมูลสำเร็จ!")
-
-        except sqlite3.Error as e:
-            print(f"❌ Error อัปเดต stock: {e}")
-
-        finally:
-            conn.close()
+    def on_stock_updated(self, _count):
+        self.load_stock_data()
 
+    def on_stock_update_failed(self, error):
+        print(f"❌ Error อัปเดต stock: {error}")
         self.load_stock_data()
 
     def create_add_product_ui(self):
@@ -284,11 +289,13 @@ class StockWindow(QWidget):
         product_layout = QVBoxLayout()
 
         # ✅ ตารางแสดงข้อมูล product_categories
-        self.product_table = QTableWidget()
-        self.product_table.setColumnCount(6)
-        self.product_table.setHorizontalHeaderLabels([
-            "ID", "ชื่อสินค้า", "บาร์โค้ด", "ราคาปลีก", "ราคาส่ง", "หน่วยต่อรายการ"
-        ])
+        self.product_model = RowTableModel(
+            ["ID", "ชื่อสินค้า", "บาร์โค้ด", "ราคาปลีก", "ราคาส่ง", "หน่วยต่อรายการ"],
+            formatter=lambda value, column: str(value) if value else "-",
+            parent=self,
+        )
+        self.product_table = QTableView()
+        self.product_table.setModel(self.product_model)
 
         product_layout.addWidget(self.product_table)
         product_group.setLayout(product_layout)
@@ -299,27 +306,15 @@ class StockWindow(QWidget):
 
     def load_product_categories_data(self):
         """โหลดข้อมูล product_categories และเรียงเฉพาะตามชื่อสินค้า (ก - ฮ | A-Z)"""
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        cursor.execute("""
+        get_executor().query("""
             SELECT id, product_name, barcode, sell_price_retail, sell_price_wholesale, unit_conversion
             FROM product_categories
             ORDER BY product_name COLLATE NOCASE ASC
-        """)
-        rows = cursor.fetchall()
-        conn.close()
-
-        self.product_table.setRowCount(len(rows))
-        self.product_table.setColumnCount(6)  # ✅ ไม่มีหมวดหมู่
-        self.product_table.setHorizontalHeaderLabels([
-            "ID", "ชื่อสินค้า", "บาร์โค้ด", "ราคาปลีก", "ราคาส่ง", "หน่วยต่อรายการ"
-        ])
+        """, on_result=self.set_product_categories_rows)
 
-        for row_idx, row_data in enumerate(rows):
-            for col_idx, cell_value in enumerate(row_data):
-                item = QTableWidgetItem(str(cell_value) if cell_value else "-")
-                self.product_table.setItem(row_idx, col_idx, item)
+    def set_product_categories_rows(self, rows):
+        # ✅ ข้อมูลเดิม → ไม่มีการวาดใหม่ (emit เฉพาะแถวที่เปลี่ยน)
+        self.product_model.set_rows(rows, [row[0] for row in rows])
 
     def calculate_price_per_unit(self):
         """คำนวณราคาปลีก/ส่งต่อชิ้นจากราคาลังอัตโนมัติ"""
@@ -378,44 +373,14 @@ class StockWindow(QWidget):
             QMessageBox.warning(self, "แจ้งเตือน", "❗ กรุณากรอกข้อมูลที่ถูกต้อง!")
             return
 
-        unit_conversion = f"1:{unit_per_pack}:{unit_per_carton}"
-
-        conn = None  # ป้องกันการใช้งาน conn ที่ผิดพลาด
-        try:
-            conn = sqlite3.connect("bot_system.db")
-            cursor = conn.cursor()
-
-            # ✅ ตรวจสอบว่าสินค้ามีอยู่แล้วหรือไม่
-            cursor.execute("SELECT COUNT(*) FROM product_categories WHERE product_name = ?", (product_name,))
-            exists = cursor.fetchone()[0]
-
-            if exists:
-                cursor.execute("""
-                    UPDATE product_categories 
-                    SET sell_price_retail = ?, sell_price_wholesale = ?, sku_prefix = ?, barcode = ?, unit_conversion = ?
-                    WHERE product_name = ?;
-                """, (
-                price_per_unit_retail, price_per_unit_wholesale, sku_prefix, barcode, unit_conversion, product_name))
-                conn.commit()
-                QMessageBox.information(self, "สำเร็จ", f"✅ อัปเดตข้อมูลสินค้า '{product_name}' สำเร็จ!")
-            else:
-                cursor.execute("""
-                    INSERT INTO product_categories (product_name, barcode, sku_prefix, sell_price_retail, sell_price_wholesale, unit_conversion)
-                    VALUES (?, ?, ?, ?, ?, ?);
-                """, (
-                product_name, barcode, sku_prefix, price_per_unit_retail, price_per_unit_wholesale, unit_conversion))
-                conn.commit()
-                QMessageBox.information(self, "สำเร็จ", f"✅ เพิ่มสินค้า '{product_name}' สำเร็จ!")
-
-            # ✅ รีโหลดตาราง
-            self.load_product_categories_data()
+        units = ProductUnits(unit_per_pack, unit_per_carton)
 
-        except sqlite3.Error as e:
-            QMessageBox.critical(self, "ข้อผิดพลาด", f"❌ เกิดข้อผิดพลาด: {e}")
-
-        finally:
-            if conn:
-                conn.close()  # ✅ ปิดฐานข้อมูลเสมอ
+        self._saving_product_name = product_name
+        get_executor().write(
+            save_product_category, product_name, barcode, sku_prefix,
+            price_per_unit_retail, price_per_unit_wholesale, units,
+            on_result=self.on_product_category_saved, on_error=self.on_product_category_failed,
+        )
 
         # ✅ เคลียร์ข้อมูลหลังบันทึก
         self.new_product_name.clear()
@@ -426,45 +391,61 @@ class StockWindow(QWidget):
         self.new_unit_per_pack.clear()
         self.new_unit_per_carton.clear()
 
+    def on_product_category_saved(self, exists):
+        product_name = self._saving_product_name
+        if exists:
+            QMessageBox.information(self, "สำเร็จ", f"✅ อัปเดตข้อมูลสินค้า '{product_name}' สำเร็จ!")
+        else:
+            QMessageBox.information(self, "สำเร็จ", f"✅ เพิ่มสินค้า '{product_name}' สำเร็จ!")
+
+        # ✅ รีโหลดตาราง
+        self.load_product_categories_data()
+
+    def on_product_category_failed(self, error):
+        QMessageBox.critical(self, "ข้อผิดพลาด", f"❌ เกิดข้อผิดพลาด: {error}")
+
+    @staticmethod
     def sync_product_with_stock(product_name):
         """อัปเดตข้อมูลสต็อกให้ตรงกับ product_categories"""
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        # ✅ ดึงข้อมูลสินค้าจาก product_categories
-        cursor.execute("""
-            SELECT sell_price_retail, sell_price_wholesale, unit_conversion
-            FROM product_categories WHERE product_name = ?;
-        """, (product_name,))
-        product_data = cursor.fetchone()
-
-        if product_data:
-            sell_price_retail, sell_price_wholesale, unit_conversion = product_data
-
-            # ✅ ตรวจสอบว่าสินค้านี้มีอยู่ใน stock หรือยัง
-            cursor.execute("SELECT COUNT(*) FROM stock WHERE product = ?", (product_name,))
-            exists = cursor.fetchone()[0]
-
-            if exists:
-                # ✅ ถ้ามีอยู่แล้ว → อัปเดตข้อมูล
-                cursor.execute("""
-                    UPDATE stock 
-                    SET sell_price_retail = ?, sell_price_wholesale = ?, unit_conversion = ?
-                    WHERE product = ?;
-                """, (sell_price_retail, sell_price_wholesale, unit_conversion, product_name))
-                print(f"🔄 อัปเดตสินค้า {product_name} ในสต็อกให้ตรงกับ product_categories")
+        with transaction() as conn:
+            cursor = conn.cursor()
 
-            else:
-                # ✅ ถ้ายังไม่มี → เพิ่มสินค้าใหม่เข้า stock พร้อม unit_conversion ที่ถูกต้อง
-                cursor.execute("""
-                    INSERT INTO stock (product, quantity, sell_price_retail, sell_price_wholesale, unit_conversion)
-                    VALUES (?, 0, ?, ?, ?);
-                """, (product_name, sell_price_retail, sell_price_wholesale, unit_conversion))
-                print(f"✅ เพิ่มสินค้า {product_name} ในสต็อกใหม่")
+            # ✅ ดึงข้อมูลสินค้าจาก product_categories
+            cursor.execute("""
+                SELECT sell_price_retail, sell_price_wholesale, unit_conversion, units_per_pack, units_per_carton
+                FROM product_categories WHERE product_name = ?;
+            """, (product_name,))
+            product_data = cursor.fetchone()
 
-            conn.commit()
+            if product_data:
+                sell_price_retail, sell_price_wholesale, unit_conversion, units_per_pack, units_per_carton = product_data
 
-        conn.close()
+                # ✅ ตรวจสอบว่าสินค้านี้มีอยู่ใน stock หรือยัง
+                cursor.execute("SELECT COUNT(*) FROM stock WHERE product = ?", (product_name,))
+                exists = cursor.fetchone()[0]
+
+                if exists:
+                    # ✅ ถ้ามีอยู่แล้ว → อัปเดตข้อมูล
+                    cursor.execute("""
+                        UPDATE stock 
+                        SET sell_price_retail = ?, sell_price_wholesale = ?, unit_conversion = ?,
+                            units_per_pack = ?, units_per_carton = ?
+                        WHERE product = ?;
+                    """, (sell_price_retail, sell_price_wholesale, unit_conversion, units_per_pack, units_per_carton, product_name))
+                    print(f"🔄 อัปเดตสินค้า {product_name} ในสต็อกให้ตรงกับ product_categories")
+
+                else:
+                    # ✅ ถ้ายังไม่มี → เพิ่มสินค้าใหม่เข้า stock พร้อม unit_conversion ที่ถูกต้อง
+                    cursor.execute("""
+                        INSERT INTO stock (product, quantity, sell_price_retail, sell_price_wholesale, unit_conversion,
+                                           units_per_pack, units_per_carton)
+                        VALUES (?, 0, ?, ?, ?, ?, ?);
+                    """, (product_name, sell_price_retail, sell_price_wholesale, unit_conversion, units_per_pack, units_per_carton))
+                    # ✅ แถวใหม่ 0 ชิ้น → บันทึกเป็น adjustment เพื่อให้ประวัติเริ่มที่สินค้านี้
+                    record_movements(conn, [(product_name, cursor.lastrowid, ADJUSTMENT, 0, "product_categories", None)])
+                    print(f"✅ เพิ่มสินค้า {product_name} ในสต็อกใหม่")
+
+        invalidate_catalog()
 
     def create_stock_table_ui(self):
         """สร้าง UI สำหรับแสดงสต็อกสินค้า"""
@@ -478,17 +459,26 @@ class StockWindow(QWidget):
         self.search_btn = QPushButton("🔎 ค้นหา")
         self.search_btn.clicked.connect(self.load_stock_data)
 
+        self.history_btn = QPushButton("🧾 ประวัติสต็อก")
+        self.history_btn.clicked.connect(self.show_stock_history)
+
         search_layout.addWidget(self.search_input)
         search_layout.addWidget(self.search_btn)
+        search_layout.addWidget(self.history_btn)
         stock_layout.addLayout(search_layout)
 
         # ✅ ตารางสินค้า
-        self.stock_table = QTableWidget()
-        self.stock_table.setColumnCount(12)
-        self.stock_table.setHorizontalHeaderLabels([
-            "ID", "สินค้า", "SKU", "จำนวน", "หน่วยต่อรายการ", "ราคาทุน", "ราคาขายปลีก", "ราคาขายส่ง",
-            "จำนวนที่ขายออก", "ยอดขายรวม", "กำไร", "วันที่รับเข้า"
-        ])
+        self.stock_model = RowTableModel(
+            [
+                "ID", "สินค้า", "SKU", "คงเหลือ/ชิ้น", "หน่วยต่อรายการ",
+                "ราคาทุน", "ราคาปลีก", "ราคาส่ง",
+                "จำนวนที่ขายออก", "ยอดขายรวม", "กำไร", "วันที่รับเข้า"
+            ],
+            styler=low_stock_style,
+            parent=self,
+        )
+        self.stock_table = QTableView()
+        self.stock_table.setModel(self.stock_model)
         stock_layout.addWidget(self.stock_table)
 
         self.stock_table.setColumnHidden(2, True)  # ✅ ซ่อน SKU (ตำแหน่งเดิม)
@@ -498,16 +488,9 @@ class StockWindow(QWidget):
         stock_group.setLayout(stock_layout)
         self.layout.addWidget(stock_group)
 
-    def connect_db(self):
-        """เชื่อมต่อฐานข้อมูล (ใช้ helper กลางเพื่อ path ชัวร์)"""
-        return connect_db()
-
     def load_stock_data(self):
         """โหลดข้อมูลสต็อกสินค้าทั้งหมด และแสดงจำนวนที่ขายออก + ยอดขายรวม"""
-        conn = self.connect_db()
-        cursor = conn.cursor()
-
-        # ✅ ดึงข้อมูลสต็อกจากฐานข้อมูล
+        # ✅ ดึงข้อมูลสต็อกจากฐานข้อมูล (บน DbExecutor)
         query = """
             SELECT id, product, sku, quantity, 
                    COALESCE(unit_per_item, 1), COALESCE(cost_price, 0), 
@@ -518,29 +501,66 @@ class StockWindow(QWidget):
             FROM stock
             ORDER BY date_received DESC
         """
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        conn.close()
-
-        # ✅ กำหนดจำนวนคอลัมน์ให้ตรงกับตารางเดิม
-        self.stock_table.setRowCount(len(rows))
-        self.stock_table.setColumnCount(12)  # 🔥 คงจำนวนคอลัมน์เท่าของเดิม
-        self.stock_table.setHorizontalHeaderLabels([
-            "ID", "สินค้า", "SKU", "คงเหลือ/ชิ้น", "หน่วยต่อรายการ",
-            "ราคาทุน", "ราคาปลีก", "ราคาส่ง",
-            "จำนวนที่ขายออก", "ยอดขายรวม", "กำไร", "วันที่รับเข้า"
-        ])
+        get_executor().query(query, on_result=self.set_stock_rows)
 
-        # ✅ ใส่ข้อมูลลงในตาราง
-        for row_idx, row_data in enumerate(rows):
-            for col_idx, cell_value in enumerate(row_data):
-                item = QTableWidgetItem(str(cell_value) if cell_value is not None else "")
+    def set_stock_rows(self, rows):
+        # ✅ ใส่ข้อมูลลงในตาราง (สีแดงเมื่อเหลือน้อยกว่า 5 ชิ้น ดู low_stock_style)
+        self.stock_model.set_rows(rows, [row[0] for row in rows])
 
-                # ✅ ถ้าสต็อกเหลือน้อยกว่า 5 ชิ้น ให้เปลี่ยนพื้นหลังเป็นสีแดง
-                if col_idx == 3 and int(row_data[col_idx]) < 5:
-                    item.setBackground(QColor("#FF6666"))  # สีแดง
-                    item.setForeground(QColor("#FFFFFF"))  # ตัวหนังสือสีขาว
+        print("✅ โหลดข้อมูลสต็อกเสร็จสิ้น!")
 
-                self.stock_table.setItem(row_idx, col_idx, item)
+    def show_stock_history(self):
+        """เปิดประวัติการเคลื่อนไหวของสินค้าที่เลือกในตารางสต็อก"""
+        selected = self.stock_table.selectionModel().selectedRows() or self.stock_table.selectionModel().selectedIndexes()
+        if not selected:
+            QMessageBox.information(self, "ประวัติสต็อก", "⚠️ กรุณาเลือกสินค้าในตารางก่อน")
+            return
+        product = self.stock_model.row(selected[0].row())[1]
+        self.history_dialog = StockHistoryDialog(product, self)
+        self.history_dialog.show()
+
+
+class StockHistoryDialog(QDialog):
+    """ประวัติ รับเข้า / ขาย / ปรับยอด ของสินค้าหนึ่งรายการ พร้อมยอดคงเหลือหลังแต่ละรายการ"""
+
+    def __init__(self, product, parent=None):
+        super().__init__(parent)
+        self.product = product
+        self.setWindowTitle(f"🧾 ประวัติสต็อก: {product}")
+        self.resize(760, 480)
+
+        layout = QVBoxLayout()
+        self.summary_label = QLabel("🔄 กำลังโหลด...")
+        self.summary_label.setWordWrap(True)
+        layout.addWidget(self.summary_label)
+
+        self.history_model = RowTableModel(
+            ["เวลา", "ประเภท", "จำนวน/ชิ้น", "คงเหลือ", "ที่มา", "เลขอ้างอิง"],
+            parent=self,
+        )
+        self.history_table = QTableView()
+        self.history_table.setModel(self.history_model)
+        layout.addWidget(self.history_table)
+        self.setLayout(layout)
+
+        get_executor().read(load_stock_history, product, on_result=self.show_history, on_error=self.on_history_failed)
+
+    def show_history(self, result):
+        opening, movements, mismatches = result
+        self.history_model.set_rows([
+            (moved_at, MOVEMENT_KINDS.get(kind, kind), f"{qty:+d}", balance, source_type or "", source_id or "")
+            for moved_at, kind, qty, balance, source_type, source_id in movements
+        ])
 
-        print("✅ โหลดข้อมูลสต็อกเสร็จสิ้น!")
+        summary = f"ยอดยกมา {HISTORY_DAYS} วันก่อน: {opening} ชิ้น | {len(movements)} รายการ"
+        if mismatches:
+            # ✅ ยอดใน stock ไม่ตรงกับ snapshot + movements → มีการแก้จำนวนโดยไม่ผ่าน ledger
+            summary += "\n⚠️ ยอดไม่ตรงกับประวัติ: " + ", ".join(
+                f"{product} (สต็อก {on_hand} / ประวัติ {ledger})" for product, on_hand, ledger in mismatches
+            )
+        else:
+            summary += "\n✅ ยอดคงเหลือทุกสินค้าตรงกับประวัติ"
+        self.summary_label.setText(summary)
+
+    def on_history_failed(self, error):
+        QMessageBox.critical(self, "ข้อผิดพลาด", f"❌ โหลดประวัติสต็อกไม่สำเร็จ: {error}")
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""checkout.py
+
+Structured cart + single-transaction checkout for SellWindow.
+
+A CartLine is built once when an item is added to the basket (stock id and
+unit factor resolved at scan time), so checkout never re-reads stock rows or
+parses quantities back out of display strings like "3 แพ็ค".
+"""
+
+from __future__ import annotations
+
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from clock import BANGKOK
+from database import DbTarget, get_connection, transaction
+from product_catalog import invalidate_catalog
+from stock_ledger import SALE, record_movements
+
+
+@dataclass
+class CartLine:
+    stock_id: int
+    product: str
+    unit_type: str  # ชิ้น / แพ็ค / ลัง
+    unit_factor: int  # pieces per unit_type
+    quantity: int  # how many unit_type
+    unit_price: float  # price per unit_type
+
+    @property
+    def units(self) -> int:
+        """Quantity in pieces (what stock.quantity counts)."""
+        return self.quantity * self.unit_factor
+
+    @property
+    def total(self) -> float:
+        return self.quantity * self.unit_price
+
+    @property
+    def quantity_text(self) -> str:
+        return f"{self.quantity} {self.unit_type}"
+
+
+class OversoldError(Exception):
+    """Raised when stock ran out between scanning and checkout.
+
+    `shortages` is [(product, requested_units, on_hand)]; nothing was written.
+    """
+
+    def __init__(self, shortages: List[Tuple[str, int, int]]):
+        self.shortages = shortages
+        super().__init__(", ".join(f"{p} ({want}/{have})" for p, want, have in shortages))
+
+
+# how a till sale was paid (sales.payment); the first one is the default
+PAYMENT_TYPES = ("เงินสด", "โอนเงิน", "บัตรเครดิต")
+
+
+def _aggregate(lines: Sequence[CartLine]) -> Dict[int, List]:
+    """stock_id -> [product, units, revenue]; one UPDATE per stock row."""
+    per_stock: Dict[int, List] = {}
+    for line in lines:
+        entry = per_stock.setdefault(line.stock_id, [line.product, 0, 0.0])
+        entry[1] += line.units
+        entry[2] += line.total
+    return per_stock
+
+
+def new_receipt_id(now: datetime) -> str:
+    return f"{now:%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+
+
+def commit_cart(
+    lines: Sequence[CartLine],
+    receipt_id: Optional[str] = None,
+    db_path: DbTarget = None,
+    payment: str = PAYMENT_TYPES[0],
+) -> Optional[str]:
+    """Deduct the whole basket from stock and append its lines to `sales`
+    (and the deductions to `stock_movements`), in one BEGIN IMMEDIATE
+    transaction.
+
+    Every stock row is updated with a `quantity >= ?` guard; if any guard
+    matches 0 rows the transaction is rolled back and OversoldError is raised.
+    Returns the receipt id the lines were recorded under (None for an
+    empty basket).
+    """
+    per_stock = _aggregate(lines)
+    if not per_stock:
+        return None
+
+    now = datetime.now(BANGKOK)
+    receipt_id = receipt_id or new_receipt_id(now)
+    sold_at = now.strftime("%Y-%m-%d %H:%M:%S")
+
+    params = [(units, units, revenue, stock_id, units) for stock_id, (_, units, revenue) in per_stock.items()]
+    total_sales = sum(revenue for _, _, revenue in per_stock.values())
+
+    try:
+        with transaction(db_path, immediate=True) as conn:
+            cur = conn.executemany(
+                """
+                UPDATE stock
+                SET quantity = quantity - ?,
+                    sold_quantity = COALESCE(sold_quantity, 0) + ?,
+                    sold_revenue = COALESCE(sold_revenue, 0) + ?
+                WHERE id = ? AND quantity >= ?;
+                """,
+                params,
+            )
+            # executemany sums rowcount over all rows: short = some guard failed
+            if cur.rowcount != len(params):
+                raise OversoldError([])
+
+            # ✅ line items -> sales (trigger keeps sales_daily_summary in step)
+            conn.executemany(
+                """
+                INSERT INTO sales (receipt_id, stock_id, product, unit_type, quantity, units,
+                                   price_per_unit, total_price, date, payment)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+                """,
+                [
+                    (receipt_id, line.stock_id, line.product, line.unit_type, line.quantity, line.units,
+                     line.unit_price, line.total, sold_at, payment)
+                    for line in lines
+                ],
+            )
+
+            # ✅ one 'sale' movement per stock row, under the receipt id
+            record_movements(
+                conn,
+                [(product, stock_id, SALE, -units, "receipt", receipt_id)
+                 for stock_id, (product, units, _) in per_stock.items()],
+                moved_at=sold_at,
+            )
+
+            conn.execute("UPDATE system_status SET daily_sales = daily_sales + ?", (total_sales,))
+    except OversoldError:
+        # rolled back: report against the untouched on-hand quantities
+        invalidate_catalog()
+        raise OversoldError(_shortages(per_stock, db_path)) from None
+
+    invalidate_catalog()  # on-hand quantities changed
+    return receipt_id
+
+
+def _shortages(per_stock: Dict[int, List], db_path: DbTarget) -> List[Tuple[str, int, int]]:
+    conn = get_connection(db_path)
+    placeholders = ",".join("?" * len(per_stock))
+    on_hand = dict(conn.execute(f"SELECT id, quantity FROM stock WHERE id IN ({placeholders})", list(per_stock)))
+    return [
+        (product, units, on_hand.get(stock_id, 0))
+        for stock_id, (product, units, _) in per_stock.items()
+        if on_hand.get(stock_id, 0) < units
+    ]
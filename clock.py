@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""clock.py
+
+Shop-local time. Every timestamp the app stores (orders.date_recorded,
+status_updated_at, sales.date, ...) is Asia/Bangkok wall time formatted as
+TIMESTAMP_FORMAT, so "today" and "now" must come from here too, not from
+datetime.now(), which follows whatever zone the PC is set to.
+"""
+
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta
+from typing import Tuple
+
+import pytz
+
+BANGKOK = pytz.timezone("Asia/Bangkok")
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def now() -> datetime:
+    """Bangkok wall time, naive (comparable with parsed stored timestamps)."""
+    return datetime.now(BANGKOK).replace(tzinfo=None)
+
+
+def timestamp() -> str:
+    """Current Bangkok time as stored in the DB."""
+    return now().strftime(TIMESTAMP_FORMAT)
+
+
+def today() -> date:
+    return now().date()
+
+
+def day_str(day: date) -> str:
+    return day.strftime(DATE_FORMAT)
+
+
+def day_range(day: date) -> Tuple[str, str]:
+    """(start, end) bounds for `ts >= start AND ts < end` over one day's
+    timestamps; unlike LIKE 'YYYY-MM-DD%' this can use an index."""
+    return day_str(day), day_str(day + timedelta(days=1))
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""cod_ledger.py
+
+COD accounting read from `cod_ledger` (database migration v8).
+
+Triggers on `orders` keep one row per (day, courier) with the COD total of
+the delivered COD orders recorded that day, so every query here costs one
+primary-key lookup per day in the range, however many orders there are.
+Days are Bangkok dates (clock.today()).
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from datetime import date, timedelta
+from typing import List, Tuple
+
+from clock import day_range, day_str
+from database import transaction
+
+DELIVERED = "จัดส่งพัสดุสำเร็จ"
+
+
+def cod_for_day(conn: sqlite3.Connection, day: date) -> float:
+    """COD total of one day (all couriers)."""
+    return conn.execute(
+        "SELECT COALESCE(SUM(total), 0) FROM cod_ledger WHERE day = ?", (day_str(day),)
+    ).fetchone()[0]
+
+
+def cod_by_day(conn: sqlite3.Connection, first: date, last: date) -> List[Tuple[str, str, float, int]]:
+    """[(day, courier, total, orders)] for first..last inclusive, oldest first."""
+    return conn.execute(
+        """
+        SELECT day, courier, total, orders FROM cod_ledger
+        WHERE day BETWEEN ? AND ? AND orders > 0
+        ORDER BY day, courier
+        """,
+        (day_str(first), day_str(last)),
+    ).fetchall()
+
+
+def cod_by_courier(conn: sqlite3.Connection, first: date, last: date) -> List[Tuple[str, float, int]]:
+    """[(courier, total, orders)] summed over first..last inclusive, largest total first."""
+    return conn.execute(
+        """
+        SELECT courier, SUM(total), SUM(orders) FROM cod_ledger
+        WHERE day BETWEEN ? AND ?
+        GROUP BY courier
+        HAVING SUM(orders) > 0
+        ORDER BY SUM(total) DESC
+        """,
+        (day_str(first), day_str(last)),
+    ).fetchall()
+
+
+def cod_last_days(conn: sqlite3.Connection, today: date, days: int = 30) -> List[Tuple[str, float, int]]:
+    """cod_by_courier() over the `days` days ending with `today`."""
+    return cod_by_courier(conn, today - timedelta(days=days - 1), today)
+
+
+def reset_day(conn: sqlite3.Connection, day: date) -> Tuple[int, int]:
+    """Zero cod_expense of the day's delivered COD orders.
+
+    Returns (orders counted for the day, orders reset); the two match unless
+    the ledger is out of step with `orders` (see database.rebuild_cod_ledger).
+    """
+    start, end = day_range(day)
+    with transaction(conn, immediate=True) as tx:
+        expected = tx.execute(
+            "SELECT COALESCE(SUM(orders), 0) FROM cod_ledger WHERE day = ?", (day_str(day),)
+        ).fetchone()[0]
+        reset = tx.execute(
+            """
+            UPDATE orders SET cod_expense = 0
+            WHERE status = ? AND payment = 'COD'
+            AND date_recorded >= ? AND date_recorded < ?
+            """,
+            (DELIVERED, start, end),
+        ).rowcount
+    return expected, reset
@@ -10,8 +10,22 @@ from __future__ import annotations
 
 import os
 import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional
+
+# Applied once per connection when it is opened by get_connection().
+_CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA cache_size=-20000;",  # ~20 MB page cache
+    "PRAGMA mmap_size=268435456;",  # 256 MB
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA busy_timeout=5000;",  # writers on other threads/processes wait for the lock
+)
+
+_local = threading.local()
 
 
 def get_db_path() -> Path:
@@ -29,20 +43,78 @@ def get_db_path() -> Path:
 
 
 def connect_db(db_path: Optional[os.PathLike | str] = None) -> sqlite3.Connection:
-    """Connect to SQLite database."""
+    """Open a new, unmanaged connection (caller closes it).
+
+    App code should use get_connection()/transaction() instead; this is kept
+    for one-off scripts.
+    """
     path = Path(db_path) if db_path else get_db_path()
     # check_same_thread=False lets us use the connection across threads if needed.
     return sqlite3.connect(str(path), check_same_thread=False)
 
 
-def setup_database(db_path: Optional[os.PathLike | str] = None) -> None:
-    """Create DB file and base tables if missing."""
-    path = Path(db_path) if db_path else get_db_path()
-    is_new = not path.exists()
+# A DB path (None = the app DB) or an open connection, e.g. the one a
+# DbExecutor job receives.
+DbTarget = Optional[os.PathLike | str | sqlite3.Connection]
+
+
+def get_connection(db_path: DbTarget = None) -> sqlite3.Connection:
+    """Return this thread's long-lived connection to the DB (opened on first use).
+
+    The connection is in autocommit mode: plain reads need no cleanup, and
+    writes should go through `transaction()`. Never close() it. A connection
+    passed in is returned as is, so helpers taking `db_path` also accept the
+    `conn` of a DbExecutor job.
+    """
+    if isinstance(db_path, sqlite3.Connection):
+        return db_path
+    path = str(Path(db_path) if db_path else get_db_path())
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+
+    conn = conns.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, isolation_level=None)
+        for pragma in _CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        conns[path] = conn
+    return conn
+
+
+@contextmanager
+def transaction(db_path: DbTarget = None, immediate: bool = False) -> Iterator[sqlite3.Connection]:
+    """Run a block in one transaction on this thread's connection (or on the
+    connection passed as `db_path`).
+
+    Commits on success, rolls back on any exception. Nested use joins the
+    outer transaction. `immediate=True` takes the write lock up front
+    (BEGIN IMMEDIATE) for read-modify-write blocks.
+    """
+    conn = get_connection(db_path)
+    if conn.in_transaction:
+        yield conn
+        return
+
+    conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+    try:
+        yield conn
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
 
-    conn = connect_db(path)
-    cursor = conn.cursor()
 
+def close_connections() -> None:
+    """Close the connections cached for the calling thread."""
+    conns = getattr(_local, "conns", None) or {}
+    for conn in conns.values():
+        conn.close()
+    conns.clear()
+
+
+def _create_base_tables(cursor: sqlite3.Cursor) -> None:
     # Base tables (CREATE IF NOT EXISTS is safe to run repeatedly)
     cursor.execute(
         """
@@ -113,11 +185,6 @@ def setup_database(db_path: Optional[os.PathLike | str] = None) -> None:
         """
     )
 
-    conn.commit()
-    conn.close()
-
-    # avoid emoji printing issues on some Windows consoles
-
 
 def _has_column(conn: sqlite3.Connection, table: str, column: str) -> bool:
     cur = conn.cursor()
@@ -126,37 +193,692 @@ def _has_column(conn: sqlite3.Connection, table: str, column: str) -> bool:
     return column in cols
 
 
-def update_database_schema(db_path: Optional[os.PathLike | str] = None) -> None:
-    """Apply lightweight migrations (add missing columns)."""
-    conn = connect_db(db_path)
+def _add_column(conn: sqlite3.Connection, table: str, column: str, decl: str) -> None:
+    if not _has_column(conn, table, column):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl};")
+
+
+# ---- migration steps ---------------------------------------------------
+# Each step runs exactly once, in order, inside the migrate() transaction.
+# Steps are append-only: never edit a released step, add a new one instead.
+
+
+def _migrate_v1_baseline(conn: sqlite3.Connection) -> None:
+    """Base tables, legacy column additions, change tracking, hot indexes.
+
+    Older DBs reach this step with any mix of these already applied, so it
+    is written to be idempotent.
+    """
+    cur = conn.cursor()
+    _create_base_tables(cur)
+
+    _add_column(conn, "orders", "status_updated_at", "TEXT")
+    _add_column(conn, "orders", "unit_conversion", "TEXT DEFAULT '1:1'")
+    _add_column(conn, "orders", "hidden", "INTEGER DEFAULT 0")
+    _add_column(conn, "stock", "unit_conversion", "TEXT DEFAULT '1:1'")
+    _add_column(conn, "product_categories", "unit_conversion", "TEXT DEFAULT '1:1'")
+    _add_column(conn, "product_categories", "unit_per_item", "INTEGER DEFAULT 1")
+
+    _ensure_orders_change_tracking(cur)
+    _create_hot_indexes(cur)
+
+
+def _migrate_v2_unit_per_item_and_system_status(conn: sqlite3.Connection) -> None:
+    """unit_per_item on pre-baseline stock/orders tables (was probed by
+    StockWindow on every open) + the system_status row SellWindow expects."""
+    _add_column(conn, "stock", "unit_per_item", "INTEGER DEFAULT 1")
+    _add_column(conn, "orders", "unit_per_item", "INTEGER DEFAULT 1")
+
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS system_status (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            daily_sales REAL DEFAULT 0,
+            last_reset TEXT DEFAULT ''
+        );
+        """
+    )
+    conn.execute(
+        "INSERT INTO system_status (daily_sales, last_reset) "
+        "SELECT 0, '' WHERE NOT EXISTS (SELECT 1 FROM system_status);"
+    )
+
+
+def _ensure_orders_change_tracking(cur: sqlite3.Cursor) -> None:
+    """Change counter + per-order changelog maintained by triggers on `orders`.
+
+    UI polls `change_counter` (one row) and only fetches ids whose change_seq moved.
+    Deletes are logged too so the grid can drop the row.
+    """
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS change_counter (
+            name TEXT PRIMARY KEY,
+            seq INTEGER NOT NULL DEFAULT 0
+        );
+        """
+    )
+    cur.execute("INSERT OR IGNORE INTO change_counter (name, seq) VALUES ('orders', 0);")
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS orders_changes (
+            order_id INTEGER PRIMARY KEY,
+            change_seq INTEGER NOT NULL
+        );
+        """
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_changes_seq ON orders_changes(change_seq);")
+
+    for event, ref in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+        cur.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_orders_change_{event.lower()}
+            AFTER {event} ON orders
+            BEGIN
+                UPDATE change_counter SET seq = seq + 1 WHERE name = 'orders';
+                INSERT OR REPLACE INTO orders_changes (order_id, change_seq)
+                SELECT {ref}.id, seq FROM change_counter WHERE name = 'orders';
+            END;
+            """
+        )
+
+
+# Indexes for the lookups the UI runs on every scan/refresh.
+# Column order puts the equality columns first; trailing columns make the
+# index covering so SQLite never has to visit the table row.
+_HOT_INDEXES = (
+    # check_tracking_popup: SELECT status, payment, price ... WHERE tracking = ?
+    "CREATE INDEX IF NOT EXISTS idx_orders_tracking ON orders(tracking, status, payment, price);",
+    # reload_table: WHERE hidden = 0 ORDER BY date_recorded DESC (visible rows only)
+    "CREATE INDEX IF NOT EXISTS idx_orders_visible_date ON orders(date_recorded) WHERE hidden = 0;",
+    # status summary GROUP BY status + daily COD sum (payment/status/date)
+    "CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status, payment, date_recorded, cod_expense);",
+    # SellWindow: WHERE product = ? (quantity check / stock deduction)
+    "CREATE INDEX IF NOT EXISTS idx_stock_product ON stock(product, quantity);",
+    # barcode scan: most rows have no barcode, keep them out of the index
+    "CREATE INDEX IF NOT EXISTS idx_stock_barcode ON stock(barcode, product) WHERE barcode IS NOT NULL;",
+    "CREATE INDEX IF NOT EXISTS idx_product_categories_barcode "
+    "ON product_categories(barcode, product_name) WHERE barcode IS NOT NULL;",
+)
+
+
+def _create_hot_indexes(cur: sqlite3.Cursor) -> None:
+    for ddl in _HOT_INDEXES:
+        cur.execute(ddl)
+    cur.execute("ANALYZE;")
+
+
+def _migrate_v3_sales_ledger(conn: sqlite3.Connection) -> None:
+    """Line-item columns on `sales` + per-day/per-product summary kept by triggers.
+
+    sales.quantity/price_per_unit are in the unit sold (unit_type);
+    sales.units is the same quantity in pieces.
+    """
+    _add_column(conn, "sales", "receipt_id", "TEXT")
+    _add_column(conn, "sales", "stock_id", "INTEGER")
+    _add_column(conn, "sales", "unit_type", "TEXT DEFAULT 'ชิ้น'")
+    _add_column(conn, "sales", "units", "INTEGER")
+
+    cur = conn.cursor()
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sales_date ON sales(date);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sales_receipt ON sales(receipt_id) WHERE receipt_id IS NOT NULL;")
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sales_daily_summary (
+            sale_date TEXT NOT NULL,
+            product TEXT NOT NULL,
+            units INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            lines INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (sale_date, product)
+        ) WITHOUT ROWID;
+        """
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_sales_daily_summary_product "
+        "ON sales_daily_summary(product, sale_date, units, revenue);"
+    )
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_sales_summary_insert
+        AFTER INSERT ON sales
+        BEGIN
+            INSERT INTO sales_daily_summary (sale_date, product, units, revenue, lines)
+            VALUES (substr(NEW.date, 1, 10), NEW.product, COALESCE(NEW.units, NEW.quantity), NEW.total_price, 1)
+            ON CONFLICT (sale_date, product) DO UPDATE SET
+                units = units + excluded.units,
+                revenue = revenue + excluded.revenue,
+                lines = lines + 1;
+        END;
+        """
+    )
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_sales_summary_delete
+        AFTER DELETE ON sales
+        BEGIN
+            UPDATE sales_daily_summary
+            SET units = units - COALESCE(OLD.units, OLD.quantity),
+                revenue = revenue - OLD.total_price,
+                lines = lines - 1
+            WHERE sale_date = substr(OLD.date, 1, 10) AND product = OLD.product;
+        END;
+        """
+    )
+    cur.execute(
+        """
+        INSERT OR REPLACE INTO sales_daily_summary (sale_date, product, units, revenue, lines)
+        SELECT substr(date, 1, 10), product, SUM(COALESCE(units, quantity)), SUM(total_price), COUNT(*)
+        FROM sales
+        GROUP BY substr(date, 1, 10), product;
+        """
+    )
+
+
+# orders columns indexed for search (orders_fts is an external-content table:
+# it stores only the trigram index, the text itself is read back from orders)
+ORDERS_FTS_COLUMNS = ("product", "shop", "tracking", "user_id", "status", "price")
+
+
+def _migrate_v4_orders_fts(conn: sqlite3.Connection) -> None:
+    """FTS5 trigram index over orders for substring search (Thai has no word breaks)."""
+    cols = ", ".join(ORDERS_FTS_COLUMNS)
+    old_cols = ", ".join(f"OLD.{c}" for c in ORDERS_FTS_COLUMNS)
+    new_cols = ", ".join(f"NEW.{c}" for c in ORDERS_FTS_COLUMNS)
+
     cur = conn.cursor()
+    cur.execute(
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS orders_fts USING fts5(
+            {cols},
+            content='orders', content_rowid='id', tokenize='trigram'
+        );
+        """
+    )
+    cur.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_orders_fts_insert AFTER INSERT ON orders
+        BEGIN
+            INSERT INTO orders_fts (rowid, {cols}) VALUES (NEW.id, {new_cols});
+        END;
+        """
+    )
+    cur.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_orders_fts_delete AFTER DELETE ON orders
+        BEGIN
+            INSERT INTO orders_fts (orders_fts, rowid, {cols}) VALUES ('delete', OLD.id, {old_cols});
+        END;
+        """
+    )
+    # only when an indexed column changes (status/hidden/cod updates are frequent)
+    cur.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_orders_fts_update AFTER UPDATE OF {cols} ON orders
+        BEGIN
+            INSERT INTO orders_fts (orders_fts, rowid, {cols}) VALUES ('delete', OLD.id, {old_cols});
+            INSERT INTO orders_fts (rowid, {cols}) VALUES (NEW.id, {new_cols});
+        END;
+        """
+    )
+    cur.execute("INSERT INTO orders_fts (orders_fts) VALUES ('rebuild');")
+
+
+def _migrate_v5_sheets_sync(conn: sqlite3.Connection) -> None:
+    """Google Sheets sync state (see sheets_sync.py): the sheet row each
+    order occupies. Empty = the sheet has never been written, so the next
+    push rewrites it from the header down.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sheets_sync (
+            order_id INTEGER PRIMARY KEY,
+            sheet_row INTEGER NOT NULL
+        );
+        """
+    )
+
+
+# Columns the outbox worker sends upstream; updates that touch none of them
+# (processed, cod_expense, unit_per_item) are not queued.
+_OUTBOX_COLUMNS = (
+    "date_recorded", "product", "shop", "price", "payment", "shipping",
+    "status", "tracking", "user_id", "password", "f2a", "hidden",
+)
+
+
+def _migrate_v6_outbox(conn: sqlite3.Connection) -> None:
+    """Outbox of order changes for the background upstream sync (outbox.py).
+
+    Triggers queue the order id on insert, delete and on updates of the
+    synced columns; the worker pushes the orders' current state and deletes
+    the entries it pushed. Every existing order is queued once so the
+    upstream starts complete.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            queued_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        """
+    )
+    for event, ref, of in (
+        ("INSERT", "NEW", ""),
+        ("UPDATE", "NEW", " OF " + ", ".join(_OUTBOX_COLUMNS)),
+        ("DELETE", "OLD", ""),
+    ):
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_orders_outbox_{event.lower()}
+            AFTER {event}{of} ON orders
+            BEGIN
+                INSERT INTO outbox (order_id) VALUES ({ref}.id);
+            END;
+            """
+        )
+    conn.execute("INSERT INTO outbox (order_id) SELECT id FROM orders ORDER BY id;")
+
+
+def _migrate_v7_order_status_counts(conn: sqlite3.Connection) -> None:
+    """Per-status order counts kept by triggers, so the status summary is a
+    primary-key lookup instead of a GROUP BY over every order.
+
+    NULL status is counted under ''.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS order_status_counts (
+            status TEXT PRIMARY KEY NOT NULL,
+            n INTEGER NOT NULL
+        ) WITHOUT ROWID;
+        """
+    )
+    add = """
+        INSERT OR IGNORE INTO order_status_counts (status, n) VALUES (COALESCE(NEW.status, ''), 0);
+        UPDATE order_status_counts SET n = n + 1 WHERE status = COALESCE(NEW.status, '');
+    """
+    remove = "UPDATE order_status_counts SET n = n - 1 WHERE status = COALESCE(OLD.status, '');"
+    for event, when, body in (
+        ("INSERT", "", add),
+        ("DELETE", "", remove),
+        ("UPDATE OF status", "WHEN OLD.status IS NOT NEW.status", remove + add),
+    ):
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_orders_status_count_{event.split()[0].lower()}
+            AFTER {event} ON orders {when}
+            BEGIN
+                {body}
+            END;
+            """
+        )
+    _recount_order_status(conn)
+
+
+def _recount_order_status(conn: sqlite3.Connection) -> None:
+    conn.execute("DELETE FROM order_status_counts;")
+    conn.execute(
+        "INSERT INTO order_status_counts (status, n) "
+        "SELECT COALESCE(status, ''), COUNT(*) FROM orders GROUP BY 1;"
+    )
+
+
+def rebuild_order_status_counts(db_path: DbTarget = None) -> None:
+    """Recount order_status_counts from `orders` (one full scan)."""
+    with transaction(db_path, immediate=True) as conn:
+        _recount_order_status(conn)
+
+
+def check_order_status_counts(db_path: DbTarget = None, repair: bool = False) -> list:
+    """Compare order_status_counts with a real count; return [(status, stored, actual)]
+    for every status that differs. `repair=True` rebuilds the table when anything does.
+
+    An empty list means the counters are consistent.
+    """
+    rows = get_connection(db_path).execute(
+        """
+        SELECT status, SUM(stored), SUM(actual) FROM (
+            SELECT status, n AS stored, 0 AS actual FROM order_status_counts
+            UNION ALL
+            SELECT COALESCE(status, ''), 0, COUNT(*) FROM orders GROUP BY 1
+        )
+        GROUP BY status
+        HAVING SUM(stored) != SUM(actual)
+        """
+    ).fetchall()
+    if rows and repair:
+        rebuild_order_status_counts(db_path)
+    return rows
+
+
+# An order counts towards the COD ledger while this holds (same filter the
+# daily COD label always used).
+_COD_LEDGER_WHEN = (
+    "{r}.payment = 'COD' AND {r}.status = 'จัดส่งพัสดุสำเร็จ' AND {r}.date_recorded IS NOT NULL"
+)
+
+
+def _migrate_v8_cod_ledger(conn: sqlite3.Connection) -> None:
+    """Per-day, per-courier COD totals kept by triggers (see cod_ledger.py).
+
+    day is the date part of date_recorded (Bangkok time, which is also the
+    delivery time for scanned parcels); courier is orders.shipping ('' if
+    unknown). total = SUM(cod_expense), orders = how many orders count.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS cod_ledger (
+            day TEXT NOT NULL,
+            courier TEXT NOT NULL,
+            total REAL NOT NULL,
+            orders INTEGER NOT NULL,
+            PRIMARY KEY (day, courier)
+        ) WITHOUT ROWID;
+        """
+    )
+
+    def key(r: str) -> str:
+        return f"day = substr({r}.date_recorded, 1, 10) AND courier = COALESCE({r}.shipping, '')"
+
+    add = f"""
+        INSERT OR IGNORE INTO cod_ledger (day, courier, total, orders)
+        VALUES (substr(NEW.date_recorded, 1, 10), COALESCE(NEW.shipping, ''), 0, 0);
+        UPDATE cod_ledger SET total = total + COALESCE(NEW.cod_expense, 0), orders = orders + 1
+        WHERE {key("NEW")};
+    """
+    remove = f"""
+        UPDATE cod_ledger SET total = total - COALESCE(OLD.cod_expense, 0), orders = orders - 1
+        WHERE {key("OLD")};
+    """
+    watched = "cod_expense, payment, status, date_recorded, shipping"
+    for name, event, ref, body in (
+        ("insert", "INSERT", "NEW", add),
+        ("delete", "DELETE", "OLD", remove),
+        ("update_old", f"UPDATE OF {watched}", "OLD", remove),
+        ("update_new", f"UPDATE OF {watched}", "NEW", add),
+    ):
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_orders_cod_ledger_{name}
+            AFTER {event} ON orders WHEN {_COD_LEDGER_WHEN.format(r=ref)}
+            BEGIN
+                {body}
+            END;
+            """
+        )
+    _recount_cod_ledger(conn)
+
+
+def _recount_cod_ledger(conn: sqlite3.Connection) -> None:
+    conn.execute("DELETE FROM cod_ledger;")
+    conn.execute(
+        f"""
+        INSERT INTO cod_ledger (day, courier, total, orders)
+        SELECT substr(date_recorded, 1, 10), COALESCE(shipping, ''), COALESCE(SUM(cod_expense), 0), COUNT(*)
+        FROM orders o
+        WHERE {_COD_LEDGER_WHEN.format(r="o")}
+        GROUP BY 1, 2;
+        """
+    )
+
+
+def rebuild_cod_ledger(db_path: Optional[os.PathLike | str] = None) -> None:
+    """Recompute cod_ledger from `orders` (one scan of the delivered COD orders)."""
+    with transaction(db_path, immediate=True) as conn:
+        _recount_cod_ledger(conn)
+
+
+def _migrate_v9_undelivered_index(conn: sqlite3.Connection) -> None:
+    """Partial index over undelivered orders for the status-aging job
+    (order_status.age_order_statuses), which then never visits the
+    delivered history."""
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_orders_undelivered "
+        "ON orders(date_recorded, tracking, status) WHERE status != 'จัดส่งพัสดุสำเร็จ';"
+    )
+
+
+# Delivered orders whose items have not been added to stock yet
+# (StockWindow.apply_delivered_orders); idx_orders_to_receive covers exactly these.
+ORDERS_TO_RECEIVE = "status = 'จัดส่งพัสดุสำเร็จ' AND processed = 0 AND tracking IS NOT NULL"
+
+
+def _migrate_v10_stock_per_product(conn: sqlite3.Connection) -> None:
+    """One stock row per product (UNIQUE index, so receiving can UPSERT) and a
+    partial index over the orders still to be received.
+
+    Duplicate stock rows from old DBs are merged into the oldest one, which
+    is the row selling and receiving always used: quantities and sold totals
+    are added up and sales are re-pointed to it.
+    """
+    keep = "SELECT MIN(id) FROM stock GROUP BY product"
+    conn.execute(
+        f"""
+        UPDATE stock SET
+            quantity = (SELECT SUM(quantity) FROM stock d WHERE d.product = stock.product),
+            sold_quantity = (SELECT SUM(COALESCE(sold_quantity, 0)) FROM stock d WHERE d.product = stock.product),
+            sold_revenue = (SELECT SUM(COALESCE(sold_revenue, 0)) FROM stock d WHERE d.product = stock.product)
+        WHERE id IN ({keep} HAVING COUNT(*) > 1);
+        """
+    )
+    conn.execute(
+        f"""
+        UPDATE sales SET stock_id = (
+            SELECT MIN(k.id) FROM stock d JOIN stock k ON k.product = d.product WHERE d.id = sales.stock_id
+        )
+        WHERE stock_id IN (SELECT id FROM stock WHERE id NOT IN ({keep}));
+        """
+    )
+    conn.execute(f"DELETE FROM stock WHERE id NOT IN ({keep});")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_stock_product_unique ON stock(product);")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_orders_to_receive "
+        f"ON orders(product, unit_per_item) WHERE {ORDERS_TO_RECEIVE};"
+    )
+
+
+def _migrate_v11_stock_ledger(conn: sqlite3.Connection) -> None:
+    """Append-only stock movements and end-of-day snapshots (see stock_ledger.py).
+
+    Every change of stock.quantity is also written to `stock_movements` as a
+    signed number of pieces, so the quantity of a product on any day is its
+    latest snapshot plus a range sum over the movements after it. The
+    quantities already on hand become one 'adjustment' per product (source
+    'opening'), which makes the movements add up to stock.quantity from the
+    start.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS stock_movements (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product TEXT NOT NULL,
+            stock_id INTEGER,
+            kind TEXT NOT NULL CHECK (kind IN ('receipt', 'sale', 'adjustment')),
+            qty INTEGER NOT NULL,
+            source_type TEXT,
+            source_id TEXT,
+            moved_at TEXT NOT NULL
+        );
+        """
+    )
+    # range sums per product over a period read the index only
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_stock_movements_product "
+        "ON stock_movements(product, moved_at, qty);"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_stock_movements_source "
+        "ON stock_movements(source_type, source_id);"
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS stock_snapshots (
+            product TEXT NOT NULL,
+            snapshot_date TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            PRIMARY KEY (product, snapshot_date)
+        ) WITHOUT ROWID;
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stock_snapshots_date ON stock_snapshots(snapshot_date);")
+    # moved_at is Bangkok time like the rest of the app (UTC+7, no DST)
+    conn.execute(
+        """
+        INSERT INTO stock_movements (product, stock_id, kind, qty, source_type, source_id, moved_at)
+        SELECT product, id, 'adjustment', COALESCE(quantity, 0), 'opening', NULL, datetime('now', '+7 hours')
+        FROM stock;
+        """
+    )
+
 
-    # orders additions
-    if not _has_column(conn, "orders", "status_updated_at"):
-        cur.execute("ALTER TABLE orders ADD COLUMN status_updated_at TEXT;")
+def _migrate_v12_product_units(conn: sqlite3.Connection) -> None:
+    """Integer units_per_pack / units_per_carton on product_categories and
+    stock (see product_units.py), backfilled from the unit_conversion strings.
 
-    if not _has_column(conn, "orders", "unit_conversion"):
-        cur.execute("ALTER TABLE orders ADD COLUMN unit_conversion TEXT DEFAULT '1:1';")
+    Stock rows without a unit_conversion of their own take their category's,
+    as the catalog used to at lookup time.
+    """
+    from product_units import ProductUnits
+
+    for table in ("product_categories", "stock"):
+        _add_column(conn, table, "units_per_pack", "INTEGER NOT NULL DEFAULT 1")
+        _add_column(conn, table, "units_per_carton", "INTEGER NOT NULL DEFAULT 1")
+
+    conn.execute(
+        """
+        UPDATE stock SET unit_conversion = (
+            SELECT pc.unit_conversion FROM product_categories pc WHERE pc.product_name = stock.product
+        )
+        WHERE unit_conversion IS NULL OR unit_conversion = '';
+        """
+    )
+    for table in ("product_categories", "stock"):
+        # one parse per distinct string, not per row
+        params = []
+        for (text,) in conn.execute(f"SELECT DISTINCT unit_conversion FROM {table};").fetchall():
+            units = ProductUnits.parse(text)
+            params.append((units.per_pack, units.per_carton, text))
+        conn.executemany(
+            f"UPDATE {table} SET units_per_pack = ?, units_per_carton = ? WHERE unit_conversion IS ?;", params
+        )
 
-    if not _has_column(conn, "orders", "hidden"):
-        cur.execute("ALTER TABLE orders ADD COLUMN hidden INTEGER DEFAULT 0;")
 
-    # stock additions
-    if not _has_column(conn, "stock", "unit_conversion"):
-        cur.execute("ALTER TABLE stock ADD COLUMN unit_conversion TEXT DEFAULT '1:1';")
+def _migrate_v13_sales_payment(conn: sqlite3.Connection) -> None:
+    """How each sale was paid (checkout.PAYMENT_TYPES), for the per-payment
+    totals of the end-of-day report (reports.py). Older lines stay NULL."""
+    _add_column(conn, "sales", "payment", "TEXT")
 
-    # product_categories additions
-    if not _has_column(conn, "product_categories", "unit_conversion"):
-        cur.execute("ALTER TABLE product_categories ADD COLUMN unit_conversion TEXT DEFAULT '1:1';")
 
-    if not _has_column(conn, "product_categories", "unit_per_item"):
-        cur.execute("ALTER TABLE product_categories ADD COLUMN unit_per_item INTEGER DEFAULT 1;")
+def _migrate_v14_catalog_version(conn: sqlite3.Connection) -> None:
+    """A counter bumped by triggers whenever a stock or product_categories
+    column the sell catalog holds changes, from any process.
+
+    product_catalog compares it on each lookup, so the till (its own process)
+    sees price/barcode/unit edits and received stock without polling the tables.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS catalog_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        );
+        """
+    )
+    conn.execute("INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0);")
+    columns = {
+        "stock": "product, barcode, quantity, sell_price_retail, sell_price_wholesale, "
+                 "units_per_pack, units_per_carton",
+        "product_categories": "product_name, barcode, sell_price_retail, sell_price_wholesale, "
+                              "units_per_pack, units_per_carton",
+    }
+    for table, watched in columns.items():
+        for event in ("INSERT", f"UPDATE OF {watched}", "DELETE"):
+            conn.execute(
+                f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_catalog_{event.split()[0].lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+                END;
+                """
+            )
+
+
+def _migrate_v15_sheets_free_rows(conn: sqlite3.Connection) -> None:
+    """Sheet rows blanked by hidden/deleted orders, reused by the next new
+    orders (sheets_sync.py), so the sheet stays as long as the visible orders
+    instead of growing with history.
+
+    Seeded with the gaps below the last assigned row (data starts on sheet
+    row 2, row 1 is the header).
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sheets_free_rows (
+            sheet_row INTEGER PRIMARY KEY
+        );
+        """
+    )
+    conn.execute(
+        """
+        WITH RECURSIVE r(n) AS (
+            SELECT 2 WHERE EXISTS (SELECT 1 FROM sheets_sync)
+            UNION ALL
+            SELECT n + 1 FROM r WHERE n < (SELECT MAX(sheet_row) FROM sheets_sync)
+        )
+        INSERT OR IGNORE INTO sheets_free_rows (sheet_row)
+        SELECT n FROM r WHERE n NOT IN (SELECT sheet_row FROM sheets_sync);
+        """
+    )
+
+
+# (user_version after the step, step)
+MIGRATIONS = (
+    (1, _migrate_v1_baseline),
+    (2, _migrate_v2_unit_per_item_and_system_status),
+    (3, _migrate_v3_sales_ledger),
+    (4, _migrate_v4_orders_fts),
+    (5, _migrate_v5_sheets_sync),
+    (6, _migrate_v6_outbox),
+    (7, _migrate_v7_order_status_counts),
+    (8, _migrate_v8_cod_ledger),
+    (9, _migrate_v9_undelivered_index),
+    (10, _migrate_v10_stock_per_product),
+    (11, _migrate_v11_stock_ledger),
+    (12, _migrate_v12_product_units),
+    (13, _migrate_v13_sales_payment),
+    (14, _migrate_v14_catalog_version),
+    (15, _migrate_v15_sheets_free_rows),
+)
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def _user_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version;").fetchone()[0]
+
+
+def migrate(db_path: Optional[os.PathLike | str] = None) -> int:
+    """Bring the DB up to SCHEMA_VERSION; return the resulting version.
+
+    An up-to-date DB costs one PRAGMA read. Otherwise all pending steps run
+    in a single write transaction (all or nothing).
+    """
+    if _user_version(get_connection(db_path)) >= SCHEMA_VERSION:
+        return SCHEMA_VERSION
 
-    conn.commit()
-    conn.close()
+    with transaction(db_path, immediate=True) as conn:
+        # re-read under the write lock: another instance may have migrated
+        version = _user_version(conn)
+        for target, step in MIGRATIONS:
+            if target > version:
+                step(conn)
+                version = target
+        conn.execute(f"PRAGMA user_version = {version};")
+    return version
 
 
 def init_db(db_path: Optional[os.PathLike | str] = None) -> None:
-    """Create DB + run migrations. Call once at startup."""
-    setup_database(db_path)
-    update_database_schema(db_path)
+    """Create DB + run pending migrations. Call once at startup."""
+    migrate(db_path)
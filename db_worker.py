@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""db_worker.py
+
+Database executor shared by every window.
+
+Reads run on a small thread pool, writes on one writer thread; each thread
+uses its own cached connection (database.get_connection), so the Qt GUI
+thread never waits on a query or on the write lock. Results are delivered
+back on the GUI thread through a queued Qt signal:
+
+    executor = get_executor()
+    executor.query("SELECT ...", params, on_result=self.show_rows)
+    executor.write(commit_cart, cart, on_result=..., on_error=...)
+
+`fn(conn, *args)` passed to read()/write() runs on a worker thread and must
+not touch widgets. write() does not open a transaction by itself: `fn` uses
+`transaction()` (or calls helpers such as checkout.commit_cart that do), and
+execute() wraps a single statement for you. Writes submitted here run one
+after another, so the windows' writes never contend with each other.
+
+Background workers that own a thread commit there on their own connection:
+the outbox drain (outbox.drain_batch), SheetsUpstream.push and the order
+import (order_import.import_file). Those writes can meet a window's write;
+the loser waits on the lock for up to busy_timeout
+(database._CONNECTION_PRAGMAS) instead of failing with "database is locked".
+
+Callbacks bound to a widget that has been deleted meanwhile are dropped.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from PyQt5 import sip
+from PyQt5.QtCore import QCoreApplication, QObject, pyqtSignal
+
+from database import get_connection, transaction
+
+Callback = Optional[Callable[[Any], None]]
+
+READ_THREADS = 2
+
+
+def _report_error(error: BaseException) -> None:
+    print(f"❌ งานฐานข้อมูลล้มเหลว: {error!r}")
+
+
+class DbExecutor(QObject):
+    # callback, value (result or exception)
+    _finished = pyqtSignal(object, object)
+
+    def __init__(self, read_threads: int = READ_THREADS, parent=None):
+        super().__init__(parent)
+        self._readers = ThreadPoolExecutor(max_workers=read_threads, thread_name_prefix="db-read")
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+        self._finished.connect(self._deliver)
+
+    def read(self, fn: Callable, *args, on_result: Callback = None, on_error: Callback = None) -> Future:
+        """Run `fn(conn, *args)` on a reader thread."""
+        return self._submit(self._readers, fn, args, on_result, on_error)
+
+    def write(self, fn: Callable, *args, on_result: Callback = None, on_error: Callback = None) -> Future:
+        """Run `fn(conn, *args)` on the writer thread (fn manages its transaction)."""
+        return self._submit(self._writer, fn, args, on_result, on_error)
+
+    def query(self, sql: str, params=(), on_result: Callback = None, on_error: Callback = None) -> Future:
+        """fetchall() of one SELECT on a reader thread."""
+        return self.read(_fetchall, sql, params, on_result=on_result, on_error=on_error)
+
+    def execute(self, sql: str, params=(), on_result: Callback = None, on_error: Callback = None) -> Future:
+        """One write statement in its own transaction; result is the rowcount."""
+        return self.write(_execute, sql, params, on_result=on_result, on_error=on_error)
+
+    def _submit(self, pool: ThreadPoolExecutor, fn, args, on_result: Callback, on_error: Callback) -> Future:
+        def task():
+            try:
+                result = fn(get_connection(), *args)
+            except Exception as e:
+                self._finished.emit(on_error or _report_error, e)
+                raise
+            if on_result is not None:
+                self._finished.emit(on_result, result)
+            return result
+
+        return pool.submit(task)
+
+    def _deliver(self, callback: Callable, value: Any) -> None:
+        owner = getattr(callback, "__self__", None)
+        if isinstance(owner, QObject) and sip.isdeleted(owner):
+            return  # window closed while the query was running
+        callback(value)
+
+    def shutdown(self) -> None:
+        """Let queued work finish (a checkout must not be cut off at exit)."""
+        self._readers.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+
+
+def _fetchall(conn: sqlite3.Connection, sql: str, params) -> list:
+    return conn.execute(sql, params).fetchall()
+
+
+def _execute(conn: sqlite3.Connection, sql: str, params) -> int:
+    with transaction() as tx:
+        return tx.execute(sql, params).rowcount
+
+
+_executor: Optional[DbExecutor] = None
+
+
+def get_executor() -> DbExecutor:
+    """Shared executor (created on first use, shut down when the app quits)."""
+    global _executor
+    if _executor is None:
+        _executor = DbExecutor()
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(shutdown_executor)
+    return _executor
+
+
+def shutdown_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
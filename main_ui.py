@@ -3,30 +3,158 @@ import sys
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QLabel, QLineEdit, QPushButton, QVBoxLayout,
     QFormLayout, QMessageBox, QTableWidget, QTableWidgetItem, QHBoxLayout, QComboBox, QDialog, QLayout, QSplitter,
-    QHeaderView, QScrollArea
+    QHeaderView, QScrollArea, QTableView, QStatusBar
 )
-from PyQt5.QtGui import QFont, QColor, QIntValidator
-from PyQt5.QtCore import QTimer, Qt, QUrl
-from datetime import datetime
-import pytz
+from PyQt5.QtGui import QFont, QColor, QIntValidator, QKeySequence
+from PyQt5.QtCore import QTimer, Qt, QUrl, QSortFilterProxyModel
+import clock
 from StockWindow import StockWindow
-from database import init_db, connect_db
+from database import init_db, transaction, check_order_status_counts
+from cod_ledger import cod_for_day, cod_last_days, reset_day
+from order_status import AGING_INTERVAL_MS, age_order_statuses
 from product_editor import ProductEditorDialog
-from PyQt5.QtCore import pyqtSignal, pyqtSlot
+from product_catalog import invalidate_catalog
+from order_search import LiveOrderSearch, normalize_query
+from table_models import PagedRowTableModel, RowTableModel
+from db_worker import get_executor
+from outbox import OutboxSync
+from sheets_sync import GspreadBackend, SheetsUpstream
+from stock_ledger import take_due_snapshot
+from order_import import (
+    IMPORT_HEADERS, FileImport, ImportedOrder, ParsedImport, detect_shipping_provider, insert_orders, parse_text
+)
 from SellWindow import SellWindow
-from PyQt5.QtWidgets import QCompleter, QDesktopWidget, QSizePolicy
+from PyQt5.QtWidgets import QCompleter, QDesktopWidget, QSizePolicy, QShortcut, QFileDialog, QProgressDialog
 import winsound
 import threading
 import os
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-from datetime import datetime, timedelta
 
 # หมายเหตุ: ห้าม init DB ตอน import โมดูล (จะทำใน main.py/ตอนรันโปรแกรม)
 
-CREDENTIALS_FILE = "gen-lang-client-0301147324-8f1c9d568355.json"
-SHEET_ID = "1T-wLeIpBrm75PfV7O7eOUJY5dxlUPp_AbCSMNuYyFZ4"
-SHEET_NAME = "ฐานข้อมูล"
+# ✅ คอลัมน์ที่แสดงในตารางออเดอร์ (ลำดับตรงกับหัวตาราง)
+ORDER_GRID_COLUMNS = "date_recorded, product, shop, price, payment, shipping, status, tracking, user_id, password, f2a"
+
+# ✅ จำนวนออเดอร์ที่โหลดต่อหน้า (เลื่อนลงสุดแล้วค่อยโหลดหน้าถัดไป)
+ORDERS_PAGE_SIZE = 200
+
+# ✅ ค้นหาอัตโนมัติหลังหยุดพิมพ์กี่มิลลิวินาที
+SEARCH_DEBOUNCE_MS = 300
+
+# ✅ หน้าต่างนำเข้าแสดงตัวอย่างแค่กี่แถว (นำเข้าจริงทุกแถว)
+IMPORT_PREVIEW_ROWS = 500
+
+# ✅ สีพื้น/สีตัวอักษรตามสถานะจัดส่ง
+STATUS_COLORS = {
+    "รอจัดส่ง": ("#FFD700", "#000000"),  # พื้นเหลือง ตัวหนังสือดำ
+    "อยู่ระหว่างการจัดส่ง": ("#87CEEB", "#000000"),  # พื้นฟ้า ตัวหนังสือดำ
+    "ตรวจสอบพัสดุ": ("#DC143C", "#FFFFFF"),  # พื้นแดง ตัวหนังสือขาว
+    "จัดส่งพัสดุสำเร็จ": ("#32CD32", "#FFFFFF"),  # พื้นเขียว ตัวหนังสือขาว
+}
+
+
+# ✅ สร้าง QColor ครั้งเดียว ใช้ซ้ำทุกเซลล์
+STATUS_BRUSHES = {
+    status: (QColor(background), QColor(foreground))
+    for status, (background, foreground) in STATUS_COLORS.items()
+}
+
+
+def order_status_style(row, column):
+    """สีของเซลล์ในคอลัมน์สถานะ (คอลัมน์อื่นใช้สีปกติ)"""
+    if column == 6:
+        return STATUS_BRUSHES.get(row[6])
+    return None
+
+
+# ✅ ฟังก์ชันด้านล่างรันบน thread ของ DbExecutor (ห้ามแตะ widget)
+
+def fetch_order_changes(conn, since_seq, with_rows):
+    """(since_seq, seq ล่าสุด, แถวที่เปลี่ยนหลัง since_seq)"""
+    seq = conn.execute("SELECT seq FROM change_counter WHERE name = 'orders'").fetchone()[0]
+    changed = []
+    if with_rows and seq != since_seq:
+        # ✅ LEFT JOIN: แถวที่ถูกลบจะได้ hidden = NULL
+        changed = conn.execute(f"""
+            SELECT c.order_id, o.hidden, {ORDER_GRID_COLUMNS}
+            FROM orders_changes c
+            LEFT JOIN orders o ON o.id = c.order_id
+            WHERE c.change_seq > ?
+        """, (since_seq,)).fetchall()
+    return since_seq, seq, changed
+
+
+def orders_seq(conn):
+    return conn.execute("SELECT seq FROM change_counter WHERE name = 'orders'").fetchone()[0]
+
+
+def fetch_search_seq(conn, search_text):
+    """(คำค้น, seq ณ ตอนเริ่มค้น)"""
+    return search_text, orders_seq(conn)
+
+
+def select_orders_page(conn, after, limit):
+    """ออเดอร์ที่ไม่ถูกซ่อนถัดจากแถว `after` (key, row) เรียงใหม่ → เก่า"""
+    if after is None:
+        cursor = conn.execute(f"""
+            SELECT id, {ORDER_GRID_COLUMNS}
+            FROM orders WHERE hidden = 0
+            ORDER BY date_recorded DESC, id DESC
+            LIMIT ?
+        """, (limit,))
+    else:
+        # ✅ keyset: ต่อจากแถวสุดท้ายที่โหลดแล้ว (ใช้ index ไม่ต้อง OFFSET)
+        last_id, last_row = after
+        cursor = conn.execute(f"""
+            SELECT id, {ORDER_GRID_COLUMNS}
+            FROM orders WHERE hidden = 0 AND (date_recorded, id) < (?, ?)
+            ORDER BY date_recorded DESC, id DESC
+            LIMIT ?
+        """, (last_row[0], last_id, limit))
+
+    # ✅ สถานะในตารางคือค่าที่เก็บใน DB (age_order_statuses อัปเดตให้ตามรอบ) ไม่ต้องคำนวณทีละแถว
+    return [(order_id, tuple(row_data)) for order_id, *row_data in cursor.fetchall()]
+
+
+def fetch_orders_page(conn, after, limit):
+    """(after, แถวถัดจาก after) ส่ง `after` ตัวเดิมกลับไปให้ model ตรวจว่ายังเป็นคำขอล่าสุด"""
+    return after, select_orders_page(conn, after, limit)
+
+
+def fetch_orders_reload(conn, limit):
+    """(seq, แถวหน้าแรก, limit) สำหรับโหลดตารางใหม่จากบนสุด"""
+    # ✅ อ่าน seq ก่อนโหลด: อะไรที่เปลี่ยนระหว่างโหลดจะถูก patch ซ้ำในรอบถัดไป (ไม่หาย)
+    seq = orders_seq(conn)
+    return seq, select_orders_page(conn, None, limit), limit
+
+
+def mark_tracking_delivered(conn, tracking_number, current_time):
+    """(เลขพัสดุ, ผล) ผล = None ไม่พบ / "already" ส่งสำเร็จไปแล้ว / "delivered" อัปเดตแล้ว"""
+    with transaction(conn, immediate=True) as tx:
+        result = tx.execute("SELECT status, payment, price FROM orders WHERE tracking = ?", (tracking_number,)).fetchone()
+        if not result:
+            return tracking_number, None
+
+        current_status, payment, price = result
+        if current_status == "จัดส่งพัสดุสำเร็จ":
+            return tracking_number, "already"
+
+        cod_expense = price if payment == "COD" else 0  # อัปเดตค่า COD เฉพาะถ้าเป็น COD
+        tx.execute("""
+            UPDATE orders 
+            SET status = 'จัดส่งพัสดุสำเร็จ', status_updated_at = ?, cod_expense = ?, date_recorded = ?
+            WHERE tracking = ?;
+        """, (current_time, cod_expense, current_time, tracking_number))
+    return tracking_number, "delivered"
+
+
+def verify_status_counts(conn):
+    """ตรวจตัวนับสถานะ (order_status_counts) กับจำนวนจริง ถ้าไม่ตรงให้นับใหม่ คืนสถานะที่ไม่ตรง"""
+    return check_order_status_counts(conn, repair=True)
+
+
+def cod_summary(conn, today):
+    """(ยอด COD วันนี้, ยอด 30 วันล่าสุดแยกตามขนส่ง) อ่านจาก cod_ledger"""
+    return cod_for_day(conn, today), cod_last_days(conn, today, 30)
 
 # ธีมสี
 THEME_DARK = """
@@ -52,18 +180,40 @@ class SQLiteApp(QWidget):
     def __init__(self):
         super().__init__()
         self.theme = "dark"
+        self._orders_seq = None  # ✅ change_counter ล่าสุดที่ตารางสะท้อนอยู่ (None = ยังไม่โหลดเต็ม)
+        self._refresh_pending = False  # ✅ รอบรีเฟรชก่อนหน้ายังรอผลจาก DbExecutor
+
+        # ✅ ค้นหาแบบพิมพ์แล้วกรองเลย (query รันบน thread แยก ไม่ทำให้ UI ค้าง)
+        self._search_text = ""  # ตัวกรองที่ตารางแสดงอยู่ ("" = ออเดอร์ปกติ)
+        self._search_gen = 0
+        self._search_stream = True
+        self._search_buffer = []
+        self.live_search = LiveOrderSearch(self)
+        self.live_search.chunk.connect(self.on_search_chunk)
+
+        # ✅ ซิงค์ Google Sheets เบื้องหลัง: ดึงจากตาราง outbox ตามรอบ (ล้มเหลว → รอนานขึ้นแล้วลองใหม่)
+        self.outbox_sync = OutboxSync(SheetsUpstream(GspreadBackend()), parent=self)
+        self.outbox_sync.status.connect(self.show_sync_status)
+
         self.initUI()
 
     def sync_data_to_sheets(self):
-        """ซิงค์ข้อมูลจาก SQLite ไป Google Sheets เมื่อกดปุ่ม"""
+        """ซิงค์ไป Google Sheets ทันทีโดยไม่ต้องรอรอบถัดไป (งานจริงทำบน thread เบื้องหลัง)"""
         print("🟡 กดปุ่มซิงค์แล้ว! เริ่มซิงค์ข้อมูลไป Google Sheets...")  # ✅ Debug Log
-        try:
-            sync_sqlite_to_sheets()  # ✅ เรียกฟังก์ชันซิงค์ข้อมูล
-            print("✅ ซิงค์เสร็จแล้ว! แสดงข้อความแจ้งเตือน...")
-            QMessageBox.information(self, "✅ สำเร็จ", "ซิงค์ข้อมูลไปยัง Google Sheets เรียบร้อยแล้ว!")
-        except Exception as e:
-            print(f"❌ เกิดข้อผิดพลาดขณะซิงค์: {e}")
-            QMessageBox.critical(self, "❌ ข้อผิดพลาด", f"เกิดข้อผิดพลาด: {e}")
+        self.outbox_sync.sync_now()
+
+    def show_sync_status(self, status):
+        """แสดงสถานะการซิงค์ Google Sheets ที่แถบสถานะด้านล่าง"""
+        pending = f"ค้าง {status.pending:,} รายการ" if status.pending >= 0 else "ค้าง ? รายการ"
+        throughput = f"ส่งแล้ว {status.pushed:,} รายการ ({status.rate:,.0f} รายการ/วินาที)"
+        if status.state == "retrying":
+            self.sync_status_bar.showMessage(
+                f"⚠️ Google Sheets: ซิงค์ไม่สำเร็จ ลองใหม่ใน {status.retry_in_ms // 1000} วินาที • {pending} • {status.error}"
+            )
+        elif status.state == "syncing":
+            self.sync_status_bar.showMessage(f"⏳ Google Sheets: กำลังซิงค์... • {pending} • {throughput}")
+        else:
+            self.sync_status_bar.showMessage(f"✅ Google Sheets: ซิงค์ล่าสุดแล้ว • {pending} • {throughput}")
 
     def initUI(self):
         self.setWindowTitle("🚀 SQLite Manager - Real-time Update")
@@ -192,6 +342,13 @@ class SQLiteApp(QWidget):
         self.search_input = QLineEdit()
         self.search_input.setPlaceholderText("🔍 ค้นหาสินค้า ร้านค้า เลขพัสดุ ฯลฯ")
 
+        # ✅ หน่วงเวลาหลังพิมพ์ตัวสุดท้ายก่อนค้นหา (พิมพ์ต่อเนื่อง = ค้นครั้งเดียว)
+        self.search_debounce = QTimer(self)
+        self.search_debounce.setSingleShot(True)
+        self.search_debounce.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_debounce.timeout.connect(self.apply_search_filter)
+        self.search_input.textChanged.connect(lambda _: self.search_debounce.start())
+
         self.start_search_btn = QPushButton("🔍 เริ่มค้นหา")
         self.start_search_btn.setFont(font)
         self.start_search_btn.clicked.connect(self.search_data)
@@ -238,14 +395,26 @@ class SQLiteApp(QWidget):
         # ✅ เพิ่ม Layout ปุ่มเข้าไปใน UI
         layout.addLayout(clear_cod_layout)
 
-        self.table = QTableWidget()
+        # ✅ ตารางแบบ model/view: เก็บข้อมูลเป็น tuple แล้ว format เฉพาะเซลล์ที่มองเห็น
+        # ✅ โหลดทีละหน้า (keyset บน date_recorded, id) เมื่อเลื่อนตารางลงมา
+        self.orders_model = PagedRowTableModel(
+            [
+                "วันที่บันทึก", "สินค้า", "ร้านค้า", "ราคา", "ชำระผ่าน",
+                "ขนส่ง", "สถานะจัดส่ง", "เลขพัสดุ", "ID", "Password", "F2A"
+            ],
+            request_page=self.request_orders_page,
+            page_size=ORDERS_PAGE_SIZE,
+            styler=order_status_style,
+            editable_columns=range(11),
+            parent=self,
+        )
+        self.orders_proxy = QSortFilterProxyModel(self)
+        self.orders_proxy.setSourceModel(self.orders_model)
+
+        self.table = QTableView()
         self.table.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         self.table.setFont(font)
-        self.table.setColumnCount(11)  # ตั้งค่าจำนวนคอลัมน์
-        self.table.setHorizontalHeaderLabels([
-            "วันที่บันทึก", "สินค้า", "ร้านค้า", "ราคา", "ชำระผ่าน",
-            "ขนส่ง", "สถานะจัดส่ง", "เลขพัสดุ", "ID", "Password", "F2A"
-        ])
+        self.table.setModel(self.orders_proxy)
 
         # ✅ ปุ่ม "แสดง/ซ่อน ID, Password, F2A"
         toggle_sensitive_layout = QHBoxLayout()
@@ -262,13 +431,15 @@ class SQLiteApp(QWidget):
 
         layout.addLayout(toggle_sensitive_layout)
 
-        # ✅ เปิดใช้งานการเรียงลำดับคอลัมน์
-        self.table.setSortingEnabled(True)
+        # ✅ เรียงตามหัวคอลัมน์ได้เฉพาะตอนโหลดครบทุกแถวแล้ว (ผลค้นหา / ออเดอร์ไม่เกินที่โหลดไว้)
+        # ✅ ระหว่างยังมีหน้าถัดไป การเรียงฝั่ง client จะเรียงแค่บางส่วน → ปิดไว้และแสดงตามวันที่ใหม่ → เก่า
+        self.orders_model.completeChanged.connect(self.set_orders_sorting)
+        self.set_orders_sorting(not self.orders_model.has_more())
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
 
         self.table.horizontalHeader().setStyleSheet("color: #000000; font-size: 14px; font-weight: bold;")
-        self.table.cellChanged.connect(self.edit_data)
-        self.table.itemSelectionChanged.connect(self.load_tracking_from_db)
+        self.orders_model.cellEdited.connect(self.edit_data)
+        self.table.selectionModel().selectionChanged.connect(self.load_tracking_from_db)
 
         # ✅ ขยายคอลัมน์ที่ต้องการให้ใหญ่ขึ้น
         columns_to_expand = [0, 1, 6, 7]  # "วันที่บันทึก", "สินค้า", "สถานะจัดส่ง", "เลขพัสดุ"
@@ -277,25 +448,63 @@ class SQLiteApp(QWidget):
 
         layout.addWidget(self.table)
 
+        # ✅ แถบสถานะด้านล่าง: สถานะ/ความเร็วการซิงค์ Google Sheets
+        self.sync_status_bar = QStatusBar(self)
+        self.sync_status_bar.showMessage("☁️ Google Sheets: กำลังเริ่มซิงค์...")
+        layout.addWidget(self.sync_status_bar)
+
         # ✅ คำนวณค่าใช้จ่าย COD ครั้งแรกเมื่อเปิดโปรแกรม
         self.calculate_cod_expense()
 
         self.setLayout(layout)
         # ✅ อัปเดตสถานะพัสดุทุกครั้งที่โหลด UI
         self.update_status_summary()
+        # ✅ ตรวจตัวนับสถานะครั้งเดียวตอนเปิดโปรแกรม (นับจริงทั้งตาราง จึงทำเบื้องหลัง)
+        get_executor().write(verify_status_counts, on_result=self.on_status_counts_verified)
 
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.update_table)
         self.timer.start(3000)
 
+        # ✅ ปรับสถานะตามอายุออเดอร์ (เช่น เกิน 3 วัน → ตรวจสอบพัสดุ) ลง DB ตอนเปิดโปรแกรมและทุกนาที
+        self.age_statuses()
+        self.aging_timer = QTimer(self)
+        self.aging_timer.timeout.connect(self.age_statuses)
+        self.aging_timer.timeout.connect(self.snapshot_stock)
+        self.aging_timer.start(AGING_INTERVAL_MS)
+
+        # ✅ snapshot สต็อกสิ้นวันของเมื่อวาน (ถ้ายังไม่มี) ตอนเปิดโปรแกรมและเมื่อข้ามวัน
+        self.snapshot_stock()
+
+        self.outbox_sync.start()
+
+    def age_statuses(self):
+        """อัปเดตสถานะที่เก็บใน DB ด้วย UPDATE ชุดเดียว (บน DbExecutor) แถวที่เปลี่ยนจะมาถึงตารางผ่าน update_table"""
+        get_executor().write(age_order_statuses, on_result=self.on_statuses_aged)
+
+    def on_statuses_aged(self, changed):
+        if changed:
+            self.update_table()
+        self.calculate_cod_expense()  # ✅ ขึ้นวันใหม่แล้วยอด COD "วันนี้" ต้องเปลี่ยนแม้ไม่มีออเดอร์ใหม่
+
+    def snapshot_stock(self):
+        """เก็บจำนวนสต็อกสิ้นวันของเมื่อวานลง stock_snapshots (บน DbExecutor) ถ้ายังไม่ได้เก็บ"""
+        get_executor().write(take_due_snapshot)
+
     def update_status_summary(self):
-        """อัปเดตจำนวนพัสดุในแต่ละสถานะ"""
-        conn = connect_db()
-        cursor = conn.cursor()
-        cursor.execute("SELECT status, COUNT(*) FROM orders GROUP BY status")
-        data = cursor.fetchall()
-        conn.close()
+        """อัปเดตจำนวนพัสดุในแต่ละสถานะ (นับบน DbExecutor แล้วค่อยแสดง)"""
+        # ✅ อ่านจากตัวนับที่ trigger ดูแล (3 แถว) แทน GROUP BY ทั้งตาราง orders
+        get_executor().query(
+            "SELECT status, n FROM order_status_counts WHERE status IN (?, ?, ?)",
+            ("รอจัดส่ง", "อยู่ระหว่างการจัดส่ง", "จัดส่งพัสดุสำเร็จ"),
+            on_result=self.show_status_summary,
+        )
+
+    def on_status_counts_verified(self, mismatches):
+        if mismatches:
+            self.update_status_summary()
 
+    def show_status_summary(self, data):
         # ✅ นับจำนวนสถานะพัสดุ
         status_counts = {"รอจัดส่ง": 0, "อยู่ระหว่างการจัดส่ง": 0, "จัดส่งพัสดุสำเร็จ": 0}
         for status, count in data:
@@ -321,21 +530,17 @@ class SQLiteApp(QWidget):
 
     def clear_shipped_data(self):
         """ซ่อนข้อมูลพัสดุที่จัดส่งสำเร็จ โดยไม่ลบออกจากฐานข้อมูล"""
-        conn = connect_db()
-        cursor = conn.cursor()
-
         # ✅ อัปเดตให้ซ่อนแถวที่จัดส่งสำเร็จ (ไม่ลบจริง)
-        cursor.execute("""
+        get_executor().execute("""
             UPDATE orders SET hidden = 1 WHERE status = 'จัดส่งพัสดุสำเร็จ';
-        """)
-        conn.commit()
-        conn.close()
+        """, on_result=self.on_shipped_hidden)
 
+    def on_shipped_hidden(self, _count):
         self.update_table()  # ✅ อัปเดตตารางใหม่
         QMessageBox.information(self, "✅ สำเร็จ", "ซ่อนข้อมูลพัสดุที่จัดส่งสำเร็จแล้ว!")
 
     def show_import_dialog(self):
-        """แสดงหน้าต่างให้วางข้อมูลออเดอร์ในรูปแบบตาราง"""
+        """แสดงหน้าต่างนำเข้าออเดอร์ (วางจาก Google ชีต / Excel)"""
         dialog = QDialog(self)
         dialog.setWindowTitle("📥 นำเข้าออเดอร์แบบตาราง")
 
@@ -345,27 +550,27 @@ class SQLiteApp(QWidget):
         dialog.setGeometry(int(width * 0.1), int(height * 0.1), int(width * 0.8), int(height * 0.8))
 
         layout = QVBoxLayout()
+        self.parsed_import = ParsedImport()
 
-        # ✅ ทำให้ตารางปรับขนาดอัตโนมัติ
-        self.import_table = QTableWidget()
+        # ✅ ตารางตัวอย่าง: model เก็บ tuple ไม่สร้าง item ต่อเซลล์ (แสดงแค่ IMPORT_PREVIEW_ROWS แถวแรก)
+        self.import_model = RowTableModel(IMPORT_HEADERS, parent=dialog)
+        self.import_table = QTableView()
         self.import_table.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
-
-        self.import_table.setColumnCount(9)
-        self.import_table.setHorizontalHeaderLabels([
-            "ID ผู้ใช้", "รหัสผ่าน", "F2A", "สินค้า", "เลขพัสดุ", "จำนวนสินค้า", "ราคา", "ช่องทางชำระเงิน", "ร้านค้า"
-        ])
-        self.import_table.setRowCount(100)  # ✅ ตั้งค่าเริ่มต้น 100 แถวเลย
+        self.import_table.setModel(self.import_model)
         # ✅ ปรับให้หัวตารางตัวหนังสือเป็นสีดำ
-        header = self.import_table.horizontalHeader()
-        for col in range(self.import_table.columnCount()):
-            item = self.import_table.horizontalHeaderItem(col)
-            if item:
-                item.setForeground(QColor("black"))
+        self.import_table.horizontalHeader().setStyleSheet("color: #000000;")
+
         # ✅ ปุ่มวางข้อมูลจาก Clipboard (Google ชีต / Excel)
         paste_btn = QPushButton("📋 วางข้อมูล (Ctrl+V)")
         paste_btn.clicked.connect(self.paste_data_from_clipboard)
+        QShortcut(QKeySequence.Paste, dialog, activated=self.paste_data_from_clipboard)
         layout.addWidget(paste_btn)
 
+        # ✅ ปุ่มนำเข้าจากไฟล์ (ไฟล์ใหญ่ที่วางผ่าน Clipboard ไม่ไหว)
+        file_btn = QPushButton("📂 นำเข้าจากไฟล์ (CSV / Excel)")
+        file_btn.clicked.connect(self.import_orders_from_file)
+        layout.addWidget(file_btn)
+
         # ✅ ปุ่มตรวจสอบข้อมูลก่อนนำเข้า
         check_btn = QPushButton("🔍 ตรวจสอบข้อมูล")
         check_btn.clicked.connect(self.validate_import_data)
@@ -378,12 +583,15 @@ class SQLiteApp(QWidget):
         self.import_btn = import_btn
         layout.addWidget(import_btn)
 
+        self.import_summary_label = QLabel("วางข้อมูลตามลำดับคอลัมน์: " + ", ".join(IMPORT_HEADERS))
+        layout.addWidget(self.import_summary_label)
+
         layout.addWidget(self.import_table)
         dialog.setLayout(layout)
         dialog.exec_()
 
     def paste_data_from_clipboard(self):
-        """วางข้อมูลจาก Clipboard ลงในตาราง"""
+        """แปลงข้อมูลจาก Clipboard เป็นแถวพร้อมนำเข้า (ไม่ผ่านเซลล์ในตาราง)"""
         clipboard = QApplication.clipboard()
         data = clipboard.text()
 
@@ -391,120 +599,137 @@ class SQLiteApp(QWidget):
             QMessageBox.warning(self, "⚠️ ข้อผิดพลาด", "ไม่มีข้อมูลใน Clipboard!")
             return
 
-        rows = data.strip().split("\n")
-        row_count = len(rows)
+        self.show_parsed_import(parse_text(data))
 
-        # ✅ ถ้าแถวที่มีอยู่ไม่พอ ให้เพิ่มแถวใหม่
-        if row_count > self.import_table.rowCount():
-            self.import_table.setRowCount(row_count)
+    def show_parsed_import(self, parsed):
+        self.parsed_import = parsed
+        self.import_model.set_rows(parsed.rows[:IMPORT_PREVIEW_ROWS])
 
-        for row_idx, row in enumerate(rows):
-            cells = row.split("\t")  # ✅ แยกข้อมูลตาม Tab (จาก Google ชีต/Excel)
-            for col_idx, cell in enumerate(cells):
-                if col_idx < self.import_table.columnCount():
-                    self.import_table.setItem(row_idx, col_idx, QTableWidgetItem(cell.strip()))
+        summary = f"พร้อมนำเข้า {len(parsed.rows):,} แถว"
+        if len(parsed.rows) > IMPORT_PREVIEW_ROWS:
+            summary += f" (แสดงตัวอย่าง {IMPORT_PREVIEW_ROWS} แถวแรก)"
+        if parsed.errors:
+            summary += f" | ❌ ข้ามแถวที่ไม่ถูกต้อง {len(parsed.errors):,} แถว (กด 🔍 ตรวจสอบข้อมูล)"
+        self.import_summary_label.setText(summary)
 
-        self.import_btn.setEnabled(True)  # ✅ เปิดปุ่มนำเข้าเมื่อมีข้อมูล
+        self.import_btn.setEnabled(bool(parsed.rows))  # ✅ เปิดปุ่มนำเข้าเมื่อมีข้อมูล
 
     def import_orders_from_table(self):
-        """นำเข้าข้อมูลออเดอร์จากตาราง"""
-        timezone = pytz.timezone("Asia/Bangkok")
-        current_time = datetime.now(timezone).strftime("%Y-%m-%d %H:%M:%S")
-
-        conn = self.connect_db()
-        cursor = conn.cursor()
-
-        for row in range(self.import_table.rowCount()):
-            user_id = self.import_table.item(row, 0)
-            product = self.import_table.item(row, 3)
-            price = self.import_table.item(row, 6)
-
-            # ✅ ข้ามแถวที่ไม่มี ID ผู้ใช้, สินค้า และราคา
-            if not user_id or not product or not price:
-                continue
-
-            password = self.import_table.item(row, 1)
-            f2a = self.import_table.item(row, 2)
-            tracking = self.import_table.item(row, 4)
-            quantity = self.import_table.item(row, 5)
-            payment = self.import_table.item(row, 7)
-            shop = self.import_table.item(row, 8)
-
-            user_id = user_id.text().strip()
-            password = password.text().strip() if password else ""
-            f2a = f2a.text().strip() if f2a else ""
-            product = product.text().strip()
-            tracking = tracking.text().strip() if tracking else ""
-            price = float(price.text().replace("฿", "").replace(",", ""))  # ✅ แปลงราคาเป็นตัวเลข
-            payment = payment.text().strip()
-            shop = shop.text().strip() if shop else "-"
-
-            # ✅ ถ้าไม่ได้ใส่จำนวน หรือใส่ 1 ให้เป็น 1
-            quantity = int(quantity.text().strip()) if quantity and quantity.text().strip().isdigit() else 1
-
-            status = "รอจัดส่ง" if tracking == "" else "อยู่ระหว่างการจัดส่ง"
-            cod_expense = price if payment == "COD" else 0
-
-            cursor.execute("""
-                INSERT INTO orders (date_recorded, product, shop, price, payment, tracking, shipping, status, user_id, password, f2a, cod_expense, unit_per_item)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                current_time, product, shop, price, payment, tracking, self.detect_shipping_provider(tracking), status,
-                user_id, password, f2a, cod_expense, quantity))
-
-        conn.commit()
-        conn.close()
+        """นำเข้าออเดอร์ที่แปลงแล้ว (executemany เป็นชุด ใน transaction เดียว บน DbExecutor)"""
+        rows = self.parsed_import.rows
+        if not rows:
+            return
+
+        current_time = clock.timestamp()
+
+        self.import_btn.setEnabled(False)  # ✅ กันกดซ้ำระหว่างกำลังบันทึก
+        get_executor().write(insert_orders, rows, current_time, on_result=self.on_orders_imported, on_error=self.on_import_failed)
+
+    def on_orders_imported(self, count):
+        self.parsed_import = ParsedImport()
+        self.import_model.set_rows([])
+        self.import_summary_label.setText(f"นำเข้าแล้ว {count:,} แถว")
 
         self.update_table()
         self.calculate_cod_expense()
-        QMessageBox.information(self, "✅ สำเร็จ", "นำเข้าออเดอร์เรียบร้อย!")
-        print(f"🟡 DEBUG: Payment Method -> '{payment}'")
+        QMessageBox.information(self, "✅ สำเร็จ", f"นำเข้าออเดอร์เรียบร้อย! ({count:,} แถว)")
+
+    def on_import_failed(self, error):
+        self.import_btn.setEnabled(True)
+        QMessageBox.critical(self, "❌ ข้อผิดพลาด", f"นำเข้าออเดอร์ไม่สำเร็จ: {error}")
+
+    def import_orders_from_file(self):
+        """นำเข้าออเดอร์จากไฟล์ CSV / Excel ทีละชุดบน thread แยก พร้อมแถบความคืบหน้า"""
+        path, _ = QFileDialog.getOpenFileName(
+            self, "เลือกไฟล์ออเดอร์", "", "ไฟล์ออเดอร์ (*.csv *.tsv *.txt *.xlsx *.xlsm);;ทุกไฟล์ (*)"
+        )
+        if not path:
+            return
+
+        current_time = clock.timestamp()
+
+        self.file_import = FileImport(path, current_time, parent=self)
+        self.import_progress = QProgressDialog(f"กำลังนำเข้า {os.path.basename(path)} ...", "ยกเลิก", 0, 100, self)
+        self.import_progress.setWindowTitle("📥 นำเข้าออเดอร์จากไฟล์")
+        self.import_progress.setWindowModality(Qt.WindowModal)
+        self.import_progress.setAutoClose(False)
+        self.import_progress.setAutoReset(False)
+        self.import_progress.setMinimumDuration(0)
+        self.import_progress.canceled.connect(self.file_import.cancel)
+
+        self.file_import.progress.connect(self.on_file_import_progress)
+        self.file_import.finished.connect(self.on_file_import_finished)
+        self.file_import.failed.connect(self.on_file_import_failed)
+        self.file_import.start()
+
+    def on_file_import_progress(self, inserted, percent):
+        self.import_progress.setValue(percent)
+        self.import_progress.setLabelText(f"นำเข้าแล้ว {inserted:,} แถว ({percent}%)")
+        self.update_table()  # ✅ แต่ละชุด commit แล้ว → ตารางทยอยอัปเดตระหว่างนำเข้า
+
+    def on_file_import_finished(self, inserted, errors, cancelled):
+        self.import_progress.close()
+        self.update_table()
+        self.calculate_cod_expense()
+
+        message = f"นำเข้าออเดอร์ {inserted:,} แถว"
+        if cancelled:
+            message = f"ยกเลิกแล้ว (นำเข้าไปแล้ว {inserted:,} แถว)"
+        if errors:
+            message += f"\n❌ ข้ามแถวที่ไม่ถูกต้อง {len(errors):,} แถว เช่น\n"
+            message += "\n".join(f"แถวที่ {line}: {text}" for line, text in errors[:10])
+        QMessageBox.information(self, "📥 นำเข้าจากไฟล์", message)
+
+    def on_file_import_failed(self, message):
+        self.import_progress.close()
+        self.update_table()
+        QMessageBox.critical(self, "❌ ข้อผิดพลาด", f"นำเข้าไฟล์ไม่สำเร็จ: {message}")
 
     def validate_import_data(self):
-        """ตรวจสอบข้อมูลในตารางก่อนนำเข้า"""
-        for row in range(self.import_table.rowCount()):
-            user_id = self.import_table.item(row, 0)
-            product = self.import_table.item(row, 3)
-            price = self.import_table.item(row, 6)
-
-            if user_id and product and price:
-                continue  # ✅ ข้อมูลสมบูรณ์ ข้ามไปตรวจสอบแถวถัดไป
-            elif not user_id and not product and not price:
-                break  # ✅ เจอแถวว่าง ให้หยุดตรวจสอบได้เลย
-            else:
-                QMessageBox.warning(self, "⚠️ ข้อผิดพลาด", f"แถวที่ {row + 1} ข้อมูลไม่ครบถ้วน!")
-                return
+        """แสดงแถวที่ข้อมูลไม่ครบ/ไม่ถูกต้อง (แถวเหล่านี้จะไม่ถูกนำเข้า)"""
+        errors = self.parsed_import.errors
+        if errors:
+            details = "\n".join(f"แถวที่ {line}: {message}" for line, message in errors[:20])
+            if len(errors) > 20:
+                details += f"\n... และอีก {len(errors) - 20:,} แถว"
+            QMessageBox.warning(self, "⚠️ ข้อผิดพลาด", details)
+            return
+
+        if not self.parsed_import.rows:
+            QMessageBox.warning(self, "⚠️ ข้อผิดพลาด", "ยังไม่มีข้อมูลให้นำเข้า!")
+            return
 
-        self.import_btn.setEnabled(True)  # ✅ เปิดปุ่มนำเข้า
         QMessageBox.information(self, "✅ ตรวจสอบแล้ว", "ข้อมูลถูกต้อง พร้อมนำเข้า!")
 
     def load_shop_history(self):
         """โหลดประวัติร้านค้าเพื่อใช้เป็น AutoComplete"""
-        conn = self.connect_db()
-        if conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT DISTINCT shop FROM orders ORDER BY date_recorded DESC LIMIT 50")
-            shop_list = [row[0] for row in cursor.fetchall()]
-            conn.close()
-
-            completer = QCompleter(shop_list, self)
-            completer.setCaseSensitivity(False)  # ไม่ต้องสนใจตัวพิมพ์ใหญ่-เล็ก
-            completer.setFilterMode(Qt.MatchContains)  # แสดงผลแม้พิมพ์บางคำ
-            self.shop_input.setCompleter(completer)
+        get_executor().query(
+            "SELECT DISTINCT shop FROM orders ORDER BY date_recorded DESC LIMIT 50",
+            on_result=self.set_shop_completer,
+        )
+
+    def set_shop_completer(self, rows):
+        shop_list = [row[0] for row in rows]
+
+        completer = QCompleter(shop_list, self)
+        completer.setCaseSensitivity(False)  # ไม่ต้องสนใจตัวพิมพ์ใหญ่-เล็ก
+        completer.setFilterMode(Qt.MatchContains)  # แสดงผลแม้พิมพ์บางคำ
+        self.shop_input.setCompleter(completer)
 
     def load_price_history(self):
         """โหลดประวัติราคาสินค้าเพื่อใช้เป็น AutoComplete"""
-        conn = self.connect_db()
-        if conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT DISTINCT price FROM orders ORDER BY date_recorded DESC LIMIT 50")
-            price_list = [str(row[0]) for row in cursor.fetchall()]
-            conn.close()
-
-            completer = QCompleter(price_list, self)
-            completer.setCaseSensitivity(False)
-            completer.setFilterMode(Qt.MatchContains)
-            self.price_input.setCompleter(completer)
+        get_executor().query(
+            "SELECT DISTINCT price FROM orders ORDER BY date_recorded DESC LIMIT 50",
+            on_result=self.set_price_completer,
+        )
+
+    def set_price_completer(self, rows):
+        price_list = [str(row[0]) for row in rows]
+
+        completer = QCompleter(price_list, self)
+        completer.setCaseSensitivity(False)
+        completer.setFilterMode(Qt.MatchContains)
+        self.price_input.setCompleter(completer)
 
     def open_sell_window(self):
         """เปิดหน้าต่างขายสินค้า"""
@@ -512,40 +737,29 @@ class SQLiteApp(QWidget):
         self.sell_window.show()
 
     def detect_shipping_provider(self, tracking_no):
-        tracking_no = (tracking_no or "").strip().upper()
-        if tracking_no.startswith("TH"):
-            return "Flash Express"
-        elif tracking_no.startswith("TIK"):
-            return "Kerry"
-        return "J&T Express"
-
-    def connect_db(self):
-        """เชื่อมต่อกับฐานข้อมูล SQLite (ใช้ helper กลางเพื่อ path ชัวร์)"""
-        return connect_db()
+        return detect_shipping_provider(tracking_no)
 
     def load_product_categories(self):
         """โหลดชื่อสินค้าตามออเดอร์ล่าสุดเข้า Dropdown"""
-        conn = self.connect_db()
-        if conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT DISTINCT p.product_name 
-                FROM product_categories p
-                LEFT JOIN orders o ON p.product_name = o.product
-                ORDER BY o.date_recorded DESC, p.id DESC
-            """)  # ✅ เรียงตามออเดอร์ล่าสุด
-            products = [p[0] for p in cursor.fetchall()]
-            conn.close()
-
-            # ✅ บันทึกค่าที่เลือกอยู่ปัจจุบัน
-            current_selection = self.product_input.currentText()
-
-            self.product_input.clear()
-            self.product_input.addItems(products)
-
-            # ✅ ถ้าค่าก่อนหน้านี้ยังอยู่ ให้เลือกค่าเดิมกลับมา
-            if current_selection in products:
-                self.product_input.setCurrentText(current_selection)
+        get_executor().query("""
+            SELECT DISTINCT p.product_name 
+            FROM product_categories p
+            LEFT JOIN orders o ON p.product_name = o.product
+            ORDER BY o.date_recorded DESC, p.id DESC
+        """, on_result=self.set_product_choices)  # ✅ เรียงตามออเดอร์ล่าสุด
+
+    def set_product_choices(self, rows):
+        products = [p[0] for p in rows]
+
+        # ✅ บันทึกค่าที่เลือกอยู่ปัจจุบัน
+        current_selection = self.product_input.currentText()
+
+        self.product_input.clear()
+        self.product_input.addItems(products)
+
+        # ✅ ถ้าค่าก่อนหน้านี้ยังอยู่ ให้เลือกค่าเดิมกลับมา
+        if current_selection in products:
+            self.product_input.setCurrentText(current_selection)
 
     def open_stock_window(self):
         """เปิดหน้าต่างสต็อกสินค้า"""
@@ -570,30 +784,21 @@ class SQLiteApp(QWidget):
         except Exception:
             pass
 
-    cod_updated = pyqtSignal()  # ✅ Signal แจ้งว่า ค่าใช้จ่าย COD อัปเดตแล้ว
-
     def calculate_cod_expense(self):
-        """คำนวณค่าใช้จ่าย COD รายวันโดยใช้ date_recorded"""
-        today = datetime.now().strftime("%Y-%m-%d")
+        """ยอด COD วันนี้ (วันตามเวลาไทย) อ่านจาก cod_ledger ที่ trigger ดูแล ไม่ต้องสแกน orders"""
+        get_executor().read(cod_summary, clock.today(), on_result=self.show_cod_expense)
 
-        conn = connect_db()
-        if conn:
-            cursor = conn.cursor()
+    def show_cod_expense(self, summary):
+        total_cod, by_courier = summary
 
-            # ✅ คำนวณค่า COD ใหม่
-            cursor.execute("""
-                SELECT SUM(cod_expense) FROM orders 
-                WHERE payment = 'COD' 
-                AND status = 'จัดส่งพัสดุสำเร็จ'
-                AND date_recorded LIKE ?;
-            """, (f"{today}%",))
-            total_cod = cursor.fetchone()[0] or 0
-            conn.close()
+        # ✅ **อัปเดต Label ใน UI**
+        self.cod_expense_label.setText(f"💰 ค่าใช้จ่าย COD วันนี้: ฿{total_cod:,.2f}")
 
-            # ✅ **อัปเดต Label ใน UI**
-            self.cod_expense_label.setText(f"💰 ค่าใช้จ่าย COD วันนี้: ฿{total_cod:,.2f}")
+        # ✅ วางเมาส์ค้างที่ยอด COD → ดูยอด 30 วันล่าสุดแยกตามขนส่ง
+        lines = [f"{courier or 'ไม่ระบุขนส่ง'}: ฿{total:,.2f} ({orders:,} ออเดอร์)" for courier, total, orders in by_courier]
+        self.cod_expense_label.setToolTip("💰 COD 30 วันล่าสุด\n" + ("\n".join(lines) or "ยังไม่มียอด"))
 
-            print(f"🔄 อัปเดตค่าใช้จ่าย COD ใน UI: ฿{total_cod:,.2f}")
+        print(f"🔄 อัปเดตค่าใช้จ่าย COD ใน UI: ฿{total_cod:,.2f}")
 
     def reset_cod_expense(self):
         """รีเซ็ตค่าใช้จ่าย COD เฉพาะของวันนี้"""
@@ -603,178 +808,103 @@ class SQLiteApp(QWidget):
                 QMessageBox.Yes | QMessageBox.No, QMessageBox.No
             )
             if reply == QMessageBox.Yes:
-                conn = connect_db()
-                if conn:
-                    cursor = conn.cursor()
-                    today = datetime.now().strftime("%Y-%m-%d")
-
-                    # ✅ ตรวจสอบจำนวนออเดอร์ที่ควรถูกรีเซ็ต
-                    cursor.execute("""
-                        SELECT COUNT(*) FROM orders 
-                        WHERE payment = 'COD' 
-                        AND status = 'จัดส่งพัสดุสำเร็จ'
-                        AND date_recorded LIKE ?;
-                    """, (f"{today}%",))
-                    count_before = cursor.fetchone()[0]
-                    print(f"📊 จำนวนออเดอร์ของวันนี้ที่ควรรีเซ็ต: {count_before}")
-
-                    # ✅ รีเซ็ตเฉพาะออเดอร์ของวันนี้
-                    cursor.execute("""
-                        UPDATE orders 
-                        SET cod_expense = 0 
-                        WHERE payment = 'COD' 
-                        AND status = 'จัดส่งพัสดุสำเร็จ'
-                        AND date_recorded LIKE ?;
-                    """, (f"{today}%",))
-                    conn.commit()
-
-                    # ✅ ตรวจสอบจำนวนออเดอร์ที่ถูกรีเซ็ตแล้ว
-                    cursor.execute("""
-                        SELECT COUNT(*) FROM orders 
-                        WHERE payment = 'COD' 
-                        AND status = 'จัดส่งพัสดุสำเร็จ'
-                        AND date_recorded LIKE ? 
-                        AND cod_expense = 0;
-                    """, (f"{today}%",))
-                    count_after = cursor.fetchone()[0]
-                    print(f"✅ จำนวนออเดอร์ที่ถูกรีเซ็ตแล้ว: {count_after}")
-
-                    if count_after == count_before:
-                        print("🎯 ค่า COD ถูกรีเซ็ตเรียบร้อย! (เฉพาะของวันนี้)")
-                    else:
-                        print("⚠️ บางออเดอร์ไม่ได้ถูกรีเซ็ต กรุณาตรวจสอบฐานข้อมูล!")
-
-                    conn.commit()
-                    cursor.close()
-                    conn.close()
-
-                    # ✅ โหลดค่าล่าสุดใหม่ และอัปเดตตารางทันที
-                    self.calculate_cod_expense()
-                    self.update_table()
-
-                    QMessageBox.information(
-                        self, "✅ สำเร็จ",
-                        f"รีเซ็ตค่าใช้จ่าย COD วันนี้เรียบร้อย! ({count_after}/{count_before} ออเดอร์)"
-                    )
-                    print("🔄 รีเซ็ตค่าใช้จ่าย COD เสร็จแล้ว! (เฉพาะของวันนี้)")
+                get_executor().write(reset_day, clock.today(), on_result=self.on_cod_reset, on_error=self.on_cod_reset_failed)
 
         except Exception as e:
             QMessageBox.critical(self, "❌ ข้อผิดพลาด", f"เกิดข้อผิดพลาด: {e}")
 
-    def edit_data(self, row, column):
-        """อัปเดตข้อมูลที่แก้ไขในตารางลง SQLite"""
-        new_value = self.table.item(row, column).text()
-        conn = connect_db()
-        updated_stock = False  # ✅ ป้องกันการเรียกซ้ำ
-
-        if conn:
-            cursor = conn.cursor()
-            order_id = self.table.item(row, 8).text()  # ID ผู้ใช้
-
-            column_mapping = {
-                0: "date_recorded",
-                1: "product",
-                2: "shop",
-                3: "price",
-                4: "payment",
-                5: "shipping",
-                6: "status",
-                7: "tracking",
-                8: "user_id",
-                9: "password",
-                10: "f2a"
-            }
-
-            if column not in column_mapping:
-                print(f"⚠️ คอลัมน์ {column} ไม่สามารถอัปเดตได้!")
-                return
-
-            column_name = column_mapping[column]
-
-            # ✅ ถ้าเป็น "เลขพัสดุ" ให้เปลี่ยนสถานะ
-            if column == 7:  # ช่องเลขพัสดุ
-                status = "อยู่ระหว่างการจัดส่ง" if new_value.strip() else "รอจัดส่ง"
-                try:
-                    cursor.execute(f"""
-                        UPDATE orders SET {column_name} = ?, status = ? WHERE user_id = ?
-                    """, (new_value, status, order_id))
-                    conn.commit()
-                except sqlite3.Error as e:
-                    print(f"❌ เกิดข้อผิดพลาดขณะอัปเดตข้อมูล: {e}")
-
-
-            elif column == 6:  # อัปเดตสถานะ
-
-                if new_value == "จัดส่งพัสดุสำเร็จ":
-
-                    try:
-
-                        timezone = pytz.timezone("Asia/Bangkok")
-
-                        current_time = datetime.now(timezone).strftime("%Y-%m-%d %H:%M:%S")
-
-                        cursor.execute("""
-
-                            UPDATE orders 
-
-                            SET status = ?, cod_expense = price, processed = 1, 
-
-                                date_recorded = ?, status_updated_at = ?
-
-                            WHERE user_id = ?;
-
-                        """, (new_value, current_time, current_time, order_id))
-
-                        conn.commit()
-
-                        print(
-                            f"✅ อัปเดต processed = 1, date_recorded และ status_updated_at ให้ user_id {order_id} ทันที")
-
-                        # ✅ เพิ่มตรงนี้เพื่ออัปเดตค่า COD ทันที
-
-                        self.calculate_cod_expense()
-
-                        if hasattr(self, 'stock_window') and not updated_stock:
-                            print("🔄 update_stock_from_orders() ถูกเรียกใช้งาน! (จาก edit_data())")
-
-                            self.stock_window.update_stock_from_orders()
-
-                            updated_stock = True
-
-                        # ✅ คำนวณค่า COD ใหม่ทุกครั้งที่มีการจัดส่งสำเร็จ
-
-                        self.calculate_cod_expense()
+    def on_cod_reset(self, counts):
+        count_before, count_after = counts
+        print(f"📊 จำนวนออเดอร์ของวันนี้ที่ควรรีเซ็ต: {count_before}")
+        print(f"✅ จำนวนออเดอร์ที่ถูกรีเซ็ตแล้ว: {count_after}")
 
+        if count_after == count_before:
+            print("🎯 ค่า COD ถูกรีเซ็ตเรียบร้อย! (เฉพาะของวันนี้)")
+        else:
+            print("⚠️ บางออเดอร์ไม่ได้ถูกรีเซ็ต กรุณาตรวจสอบฐานข้อมูล!")
 
-                    except sqlite3.Error as e:
+        # ✅ โหลดค่าล่าสุดใหม่ และอัปเดตตารางทันที
+        self.calculate_cod_expense()
+        self.update_table()
 
-                        print(f"❌ เกิดข้อผิดพลาดขณะอัปเดตค่าใช้จ่าย COD: {e}")
+        QMessageBox.information(
+            self, "✅ สำเร็จ",
+            f"รีเซ็ตค่าใช้จ่าย COD วันนี้เรียบร้อย! ({count_after}/{count_before} ออเดอร์)"
+        )
+        print("🔄 รีเซ็ตค่าใช้จ่าย COD เสร็จแล้ว! (เฉพาะของวันนี้)")
+
+    def on_cod_reset_failed(self, error):
+        QMessageBox.critical(self, "❌ ข้อผิดพลาด", f"เกิดข้อผิดพลาด: {error}")
+
+    def edit_data(self, order_id, column, new_value):
+        """อัปเดตข้อมูลที่แก้ไขในตารางลง SQLite (order_id = orders.id ของแถวที่แก้)
+        เขียนผ่าน DbExecutor → ตารางไม่ค้างแม้ DB ถูกล็อกจากงานอื่นอยู่"""
+        column_mapping = {
+            0: "date_recorded",
+            1: "product",
+            2: "shop",
+            3: "price",
+            4: "payment",
+            5: "shipping",
+            6: "status",
+            7: "tracking",
+            8: "user_id",
+            9: "password",
+            10: "f2a"
+        }
+
+        if column not in column_mapping:
+            print(f"⚠️ คอลัมน์ {column} ไม่สามารถอัปเดตได้!")
+            return
 
+        column_name = column_mapping[column]
 
+        # ✅ ถ้าเป็น "เลขพัสดุ" ให้เปลี่ยนสถานะ
+        if column == 7:  # ช่องเลขพัสดุ
+            status = "อยู่ระหว่างการจัดส่ง" if new_value.strip() else "รอจัดส่ง"
+            get_executor().execute(f"""
+                UPDATE orders SET {column_name} = ?, status = ? WHERE id = ?
+            """, (new_value, status, order_id), on_error=self.on_order_edit_failed)
 
-                else:
-                    try:
-                        # ✅ ถ้าสถานะยังไม่เป็น "จัดส่งพัสดุสำเร็จ" ให้ตรวจสอบ `cod_expense`
-                        cursor.execute("""
-                            UPDATE orders 
-                            SET status = ?, cod_expense = CASE 
-                                WHEN payment = 'COD' AND cod_expense = 0 THEN price 
-                                ELSE cod_expense END
-                            WHERE user_id = ?;
-                        """, (new_value, order_id))
-                        conn.commit()
-                        print(f"✅ อัปเดตสถานะ {new_value} และตรวจสอบ cod_expense ให้ user_id {order_id}")
+        elif column == 6:  # อัปเดตสถานะ
+            if new_value == "จัดส่งพัสดุสำเร็จ":
+                current_time = clock.timestamp()
 
-                    except sqlite3.Error as e:
-                        print(f"❌ เกิดข้อผิดพลาดขณะอัปเดตค่าใช้จ่าย COD: {e}")
+                get_executor().execute("""
+                    UPDATE orders 
+                    SET status = ?, cod_expense = price, processed = 1, 
+                        date_recorded = ?, status_updated_at = ?
+                    WHERE id = ?;
+                """, (new_value, current_time, current_time, order_id),
+                    on_result=self.on_order_delivered, on_error=self.on_order_edit_failed)
+                print(f"✅ อัปเดต processed = 1, date_recorded และ status_updated_at ให้ออเดอร์ {order_id}")
 
-                if not updated_stock:
-                    print("✅ คำนวณค่า COD ตามปกติ")
-                    self.calculate_cod_expense()
-                else:
-                    print("⚠️ ข้าม `calculate_cod_expense()` เพราะอัปเดตสต็อกแล้ว")
+            else:
+                # ✅ ถ้าสถานะยังไม่เป็น "จัดส่งพัสดุสำเร็จ" ให้ตรวจสอบ `cod_expense`
+                get_executor().execute("""
+                    UPDATE orders 
+                    SET status = ?, cod_expense = CASE 
+                        WHEN payment = 'COD' AND cod_expense = 0 THEN price 
+                        ELSE cod_expense END
+                    WHERE id = ?;
+                """, (new_value, order_id), on_result=self.on_order_edited, on_error=self.on_order_edit_failed)
+                print(f"✅ อัปเดตสถานะ {new_value} และตรวจสอบ cod_expense ให้ออเดอร์ {order_id}")
+
+    def on_order_delivered(self, _count):
+        if hasattr(self, 'stock_window'):
+            print("🔄 update_stock_from_orders() ถูกเรียกใช้งาน! (จาก edit_data())")
+            self.stock_window.update_stock_from_orders()
+
+        # ✅ คำนวณค่า COD ใหม่ทุกครั้งที่มีการจัดส่งสำเร็จ
+        self.on_order_edited(_count)
+
+    def on_order_edited(self, _count):
+        self.calculate_cod_expense()
+        self.update_table()  # ✅ อัปเดต UI ให้ข้อมูลใหม่แสดง
 
-                self.update_table()  # ✅ อัปเดต UI ให้ข้อมูลใหม่แสดง
+    def on_order_edit_failed(self, error):
+        print(f"❌ เกิดข้อผิดพลาดขณะอัปเดตข้อมูล: {error}")
+        self.update_table()  # ✅ ดึงค่าจริงจาก DB กลับมาแทนค่าที่พิมพ์ไว้
 
     def add_product_category(self):
         """เพิ่มสินค้าใหม่ลงใน `product_categories`"""
@@ -793,167 +923,195 @@ class SQLiteApp(QWidget):
             QMessageBox.warning(self, "แจ้งเตือน", "❗ ราคาต้องเป็นตัวเลข!")
             return
 
-        conn = self.connect_db()
-        if conn:
-            cursor = conn.cursor()
-            try:
-                sku_prefix = product_name[:3].upper()
-
-                cursor.execute("""
-                    INSERT INTO product_categories (product_name, sku_prefix, sell_price_retail, sell_price_wholesale)
-                    VALUES (?, ?, ?, ?)
-                """, (product_name, sku_prefix, sell_price_retail, sell_price_wholesale))
+        sku_prefix = product_name[:3].upper()
+        self._new_category_name = product_name
+        get_executor().execute("""
+            INSERT INTO product_categories (product_name, sku_prefix, sell_price_retail, sell_price_wholesale)
+            VALUES (?, ?, ?, ?)
+        """, (product_name, sku_prefix, sell_price_retail, sell_price_wholesale),
+            on_result=self.on_category_added, on_error=self.on_category_add_failed)
 
-                conn.commit()
-                QMessageBox.information(self, "สำเร็จ", f"✅ เพิ่มสินค้า '{product_name}' สำเร็จ!")
+        self.new_product_name.clear()
+        self.new_sell_price_retail.clear()
+        self.new_sell_price_wholesale.clear()
 
-                # ✅ โหลดข้อมูลใหม่หลังจากเพิ่มสินค้า
-                self.load_stock_data()
+    def on_category_added(self, _count):
+        invalidate_catalog()
+        QMessageBox.information(self, "สำเร็จ", f"✅ เพิ่มสินค้า '{self._new_category_name}' สำเร็จ!")
 
-            except sqlite3.IntegrityError:
-                QMessageBox.warning(self, "แจ้งเตือน", f"❗ สินค้า '{product_name}' มีอยู่แล้ว!")
-            finally:
-                conn.close()
+        # ✅ โหลดข้อมูลใหม่หลังจากเพิ่มสินค้า
+        self.load_product_categories()
 
-            self.new_product_name.clear()
-            self.new_sell_price_retail.clear()
-            self.new_sell_price_wholesale.clear()
+    def on_category_add_failed(self, error):
+        if isinstance(error, sqlite3.IntegrityError):
+            QMessageBox.warning(self, "แจ้งเตือน", f"❗ สินค้า '{self._new_category_name}' มีอยู่แล้ว!")
+        else:
+            QMessageBox.critical(self, "❌ ข้อผิดพลาด", f"เกิดข้อผิดพลาด: {error}")
 
     def search_data(self):
-        search_text = self.search_input.text().strip().lower()  # แปลงเป็น lower case
-
-        if not search_text:
+        """ค้นหาทันทีเมื่อกดปุ่ม (ไม่ต้องรอหน่วงเวลา)"""
+        if not normalize_query(self.search_input.text()):
             QMessageBox.warning(self, "แจ้งเตือน", "กรุณากรอกคำค้นหา!")
             return
 
-        # ตัด "฿" ออกจากการค้นหาถ้าผู้ใช้ค้นหาด้วยราคา
-        if search_text.startswith("฿"):
-            search_text = search_text[1:]
-
-        conn = connect_db()
-        if conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT date_recorded, product, shop, price, payment, shipping, status, tracking, user_id, password, f2a 
-                FROM orders 
-                WHERE 
-                    LOWER(product) LIKE ? OR 
-                    LOWER(shop) LIKE ? OR 
-                    LOWER(tracking) LIKE ? OR 
-                    LOWER(user_id) LIKE ? OR
-                    LOWER(status) LIKE ? OR
-                    price LIKE ?
-            """, (f"%{search_text}%", f"%{search_text}%", f"%{search_text}%", f"%{search_text}%", f"%{search_text}%",
-                  f"%{search_text}%"))
-
-            search_results = cursor.fetchall()
-            conn.close()
-
-            if not search_results:
-                QMessageBox.warning(self, "แจ้งเตือน", "ไม่พบข้อมูลที่เกี่ยวข้อง!")
-                return
-
-            self.show_search_results(search_results)
-
-            self.timer.stop()
-            self.start_search_btn.setEnabled(False)
-            self.stop_search_btn.setEnabled(True)
+        self.search_debounce.stop()
+        self.apply_search_filter()
 
     def stop_search(self):
+        self.search_debounce.stop()
         self.search_input.clear()
-        self.update_table()
-        self.timer.start(5000)
-        self.start_search_btn.setEnabled(True)
-        self.stop_search_btn.setEnabled(False)
+        self.apply_search_filter()
+
+    def apply_search_filter(self):
+        """ใช้ข้อความใน search_input เป็นตัวกรองตาราง (ว่าง = กลับไปแสดงออเดอร์ปกติ)"""
+        search_text = normalize_query(self.search_input.text())
+        if search_text == self._search_text:
+            return
 
-    def show_search_results(self, results):
-        self.table.blockSignals(True)
-        self.table.setRowCount(len(results))
-        self.table.setColumnCount(11)
+        self._search_text = search_text
+        if not search_text:
+            self.live_search.cancel()
+            self.reload_table()  # ✅ ผลค้นหาทับตารางไปแล้ว ต้องโหลดเต็มใหม่
+            self.stop_search_btn.setEnabled(False)
+            return
 
-        for row_idx, row_data in enumerate(results):
-            for col_idx, cell_value in enumerate(row_data):
-                item = QTableWidgetItem(str(cell_value))
-                self.table.setItem(row_idx, col_idx, item)
+        # ✅ ผลค้นหาสะท้อน DB ณ ตอนนี้ → รอบรีเฟรชถัดไปค้นซ้ำเฉพาะเมื่อมีการเปลี่ยนแปลง
+        # ✅ อ่าน seq บน DbExecutor แล้วค่อยเริ่มค้น (ไม่ query บน GUI thread)
+        get_executor().read(fetch_search_seq, search_text, on_result=self.start_search)
+        self.stop_search_btn.setEnabled(True)
+
+    def start_search(self, result):
+        search_text, seq = result
+        if search_text != self._search_text:
+            return  # ✅ พิมพ์คำใหม่/ล้างคำค้นไปแล้ว
+        self._orders_seq = seq
+        self.run_search(stream=True)
+
+    def run_search(self, stream):
+        """ส่งคำค้นไป worker; stream=True ทยอยแสดงทีละชุด, False รอครบแล้วอัปเดตทีเดียว (ไม่กระพริบ)"""
+        self._search_stream = stream
+        self._search_buffer = []
+        self._search_gen = self.live_search.search(self._search_text)
+
+    def on_search_chunk(self, generation, rows, first, done):
+        if generation != self._search_gen or not self._search_text:
+            return  # ✅ ผลของคำค้นเก่า (พิมพ์ใหม่ไปแล้ว)
+
+        keys = [row[0] for row in rows]
+        grid_rows = [tuple(row[1:]) for row in rows]
+
+        if not self._search_stream:
+            self._search_buffer.extend(zip(keys, grid_rows))
+            if done:
+                buffer = self._search_buffer
+                self.orders_model.set_rows([row for _, row in buffer], [key for key, _ in buffer])
+            return
 
-        self.table.blockSignals(False)
+        if first:
+            self.orders_model.set_rows(grid_rows, keys)
+        else:
+            self.orders_model.append_rows(grid_rows, keys)
 
-    def load_tracking_from_db(self):
-        selected_row = self.table.currentRow()
-        if selected_row == -1:
+    def load_tracking_from_db(self, *_):
+        index = self.table.currentIndex()
+        if not index.isValid():
             return
 
-        tracking_number = self.table.item(selected_row, 7).text()
+        source_row = self.orders_proxy.mapToSource(index).row()
+        tracking_number = self.orders_model.row(source_row)[7] or ""
         if tracking_number.strip():
             self.tracking_input.setText(tracking_number)
 
     def update_table(self):
-        """โหลดข้อมูลจากฐานข้อมูล และซ่อนรายการที่ถูกซ่อนไว้"""
-        conn = connect_db()
-        if conn:
-            cursor = conn.cursor()
-            # ✅ โหลดเฉพาะออเดอร์ที่ไม่ได้ถูกซ่อน (hidden = 0)
-            cursor.execute("""
-                SELECT date_recorded, product, shop, price, payment, shipping, status, tracking, user_id, password, f2a 
-                FROM orders WHERE hidden = 0 ORDER BY date_recorded DESC
-            """)
-            all_data = cursor.fetchall()
-            conn.close()
-
-            self.table.blockSignals(True)  # ปิดการส่งสัญญาณชั่วคราว (ป้องกัน loop update)
-
-            self.table.setRowCount(len(all_data))  # ✅ ปรับจำนวนแถวตามข้อมูลใหม่
-
-            from datetime import datetime
-            today = datetime.now()
-
-            for row_idx, row_data in enumerate(all_data):
-                date_recorded = datetime.strptime(row_data[0], "%Y-%m-%d %H:%M:%S")
-                tracking = row_data[7].strip()
-                status = row_data[6]
-
-                # ✅ **อัปเดตสถานะตามเงื่อนไขเดิม**
-                if not tracking:
-                    new_status = "รอจัดส่ง"
-                elif status != "จัดส่งพัสดุสำเร็จ":
-                    new_status = "อยู่ระหว่างการจัดส่ง"
-                else:
-                    new_status = status  # ไม่เปลี่ยนแปลงถ้าส่งสำเร็จแล้ว
-
-                if (today - date_recorded).days > 3 and new_status != "จัดส่งพัสดุสำเร็จ":
-                    new_status = "ตรวจสอบพัสดุ"
-
-                row_data = list(row_data)
-                row_data[6] = new_status  # ✅ อัปเดตสถานะใหม่
-
-                # ✅ **ถ้าสถานะเป็น "จัดส่งพัสดุสำเร็จ" ให้คำนวณค่า COD**
-                if new_status == "จัดส่งพัสดุสำเร็จ":
-                    self.calculate_cod_expense()
-
-                # ✅ ใส่ข้อมูลลงตาราง
-                for col_idx, cell_value in enumerate(row_data):
-                    item = QTableWidgetItem(str(cell_value))
-
-                    # ✅ **จัดสีตามสถานะการจัดส่ง**
-                    if col_idx == 6:  # คอลัมน์สถานะ
-                        if new_status == "รอจัดส่ง":
-                            item.setBackground(QColor("#FFD700"))  # พื้นเหลือง
-                            item.setForeground(QColor("#000000"))  # ตัวหนังสือดำ
-                        elif new_status == "อยู่ระหว่างการจัดส่ง":
-                            item.setBackground(QColor("#87CEEB"))  # พื้นฟ้า
-                            item.setForeground(QColor("#000000"))  # ตัวหนังสือดำ
-                        elif new_status == "ตรวจสอบพัสดุ":
-                            item.setBackground(QColor("#DC143C"))  # พื้นแดง
-                            item.setForeground(QColor("#FFFFFF"))  # ตัวหนังสือขาว
-                        elif new_status == "จัดส่งพัสดุสำเร็จ":
-                            item.setBackground(QColor("#32CD32"))  # พื้นเขียว
-                            item.setForeground(QColor("#FFFFFF"))  # ตัวหนังสือขาว
-
-                    self.table.setItem(row_idx, col_idx, item)
-
-            self.table.blockSignals(False)  # ✅ เปิดการส่งสัญญาณกลับมา
-            # ✅ อัปเดตสถานะพัสดุหลังโหลดข้อมูลใหม่
-            self.update_status_summary()
+        """รีเฟรชตารางเฉพาะแถวที่เปลี่ยน (query รันบน DbExecutor; ถ้า DB ไม่เปลี่ยนจะเสียแค่ query เดียว)"""
+        if self._refresh_pending:
+            return  # ✅ รอบก่อนยังไม่ได้ผล ไม่ต้องส่งซ้อน
+
+        if not self._search_text and self._orders_seq is None:
+            # ✅ โหลดเต็มครั้งแรก (สถานะตามอายุออเดอร์มาทาง change tracking เพราะ age_statuses เขียนลง DB)
+            self.reload_table()
+            return
+
+        self._refresh_pending = True
+        # ✅ กำลังค้นหาอยู่: ไม่ต้องดึงแถวที่เปลี่ยน แค่ดูว่าต้องค้นซ้ำไหม
+        get_executor().read(
+            fetch_order_changes, self._orders_seq, not self._search_text,
+            on_result=self.apply_order_changes, on_error=self.on_refresh_failed,
+        )
+
+    def apply_order_changes(self, result):
+        self._refresh_pending = False
+        since_seq, seq, changed = result
+        if since_seq != self._orders_seq:
+            return  # ✅ ตารางถูกโหลดใหม่ระหว่างรอผล → ผลนี้เก่าแล้ว
+
+        if self._search_text:
+            # ✅ timer ยังทำงานระหว่างค้นหา: ค้นซ้ำเมื่อ DB เปลี่ยน
+            if seq == self._orders_seq:
+                return
+            self._orders_seq = seq
+            self.run_search(stream=False)
+        else:
+            if seq == self._orders_seq:
+                return
+            self._orders_seq = seq
+            self.patch_table_rows(changed)
+
+        self.update_status_summary()
+        self.calculate_cod_expense()  # ✅ คำนวณยอด COD ครั้งเดียวต่อรอบรีเฟรช (ไม่ใช่ทุกแถว)
+
+    def on_refresh_failed(self, error):
+        self._refresh_pending = False
+        print(f"❌ รีเฟรชตารางไม่สำเร็จ: {error}")
+
+    def set_orders_sorting(self, complete):
+        if not complete:
+            # ✅ กลับไปลำดับของ DB (date_recorded DESC, id DESC) และล้างลูกศรเรียงบนหัวตาราง
+            self.table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+            self.orders_proxy.sort(-1)
+        self.table.setSortingEnabled(complete)
+
+    def reload_table(self):
+        """โหลดออเดอร์ที่ไม่ถูกซ่อนใหม่จากบนสุด (เฉพาะหน้าแรก/เท่าที่เลื่อนดูไว้แล้ว) บน DbExecutor"""
+        self._refresh_pending = True
+        get_executor().read(
+            fetch_orders_reload, self.orders_model.reload_limit(),
+            on_result=self.apply_reload, on_error=self.on_refresh_failed,
+        )
+
+    def apply_reload(self, result):
+        self._refresh_pending = False
+        if self._search_text:
+            return  # ✅ เริ่มค้นหาระหว่างรอผล → ผลค้นหาเป็นเจ้าของตาราง
+
+        seq, items, limit = result
+        self.orders_model.load_first_page(items, limit)
+        self._orders_seq = seq
+        # ✅ อัปเดตสถานะพัสดุ + ยอด COD หลังโหลดข้อมูลใหม่ (ครั้งเดียวต่อรอบ)
+        self.update_status_summary()
+        self.calculate_cod_expense()
+
+    def request_orders_page(self, after, limit, on_page, on_error):
+        """หน้าถัดไปตอนเลื่อนตาราง: query บน DbExecutor แล้ว model ต่อแถวท้ายตารางเมื่อได้ผล"""
+        get_executor().read(fetch_orders_page, after, limit, on_result=on_page, on_error=on_error)
+
+    def patch_table_rows(self, changed):
+        """แก้เฉพาะแถวที่เปลี่ยน: อัปเดตแถวเดิม, ลบแถวที่ถูกซ่อน/ลบ, เพิ่มแถวใหม่ไว้บนสุด"""
+        removed = [order_id for order_id, hidden, *_ in changed if hidden is None or hidden]
+
+        # ✅ แถวที่ยังไม่ได้โหลดและเก่ากว่าหน้าที่โหลดไว้ → ปล่อยให้มาตอนเลื่อนถึง (ไม่ดันขึ้นบนสุด)
+        last = self.orders_model.last_loaded() if self.orders_model.has_more() else None
+        upserts = [
+            (order_id, tuple(row_data))
+            for order_id, hidden, *row_data in changed
+            if hidden == 0 and (
+                last is None
+                or self.orders_model.row_for_key(order_id) is not None
+                or (row_data[0], order_id) > (last[1][0], last[0])
+            )
+        ]
+        self.orders_model.remove_keys(removed)
+        self.orders_model.upsert_rows(upserts, insert_at=0)
 
     def format_price_input(self):
         text = self.price_input.text()
@@ -976,48 +1134,43 @@ class SQLiteApp(QWidget):
         return input_field
 
     def add_data(self):
-        conn = connect_db()
-        if conn:
-            cursor = conn.cursor()
-
-            timezone = pytz.timezone("Asia/Bangkok")
-            current_time = datetime.now(timezone).strftime("%Y-%m-%d %H:%M:%S")
-
-            product = self.product_input.currentText().strip()
-            shop = self.shop_input.text().strip()
-            price = self.price_input.text().replace("฿", "").strip()
-            payment = self.payment_input.currentText().strip()
-            tracking = self.tracking_input.text().strip()
-            shipping = self.detect_shipping_provider(tracking)
-            status = "รอจัดส่ง" if not tracking else "อยู่ระหว่างการจัดส่ง"
-            user_id = self.id_input.text().strip()
-            password = self.password_input.text().strip()
-            f2a = self.f2a_input.text().strip()
-            unit_per_item = self.unit_per_item_input.text().strip()
-            unit_per_item = int(unit_per_item) if unit_per_item.isdigit() else 1  # ✅ ถ้าเว้นว่าง ให้เป็น 1
-
-            # ✅ ถ้าเป็น COD ให้ใส่ราคาไปที่ cod_expense ด้วย
-            cod_expense = float(price) if payment == "COD" else 0
-            print(f"📝 บันทึกข้อมูล: {product}, unit_per_item = {unit_per_item}")
-
-            cursor.execute("""
-                INSERT INTO orders (date_recorded, product, shop, price, payment, tracking, shipping, status, user_id, password, f2a, cod_expense, unit_per_item)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (current_time, product, shop, price, payment, tracking, shipping, status, user_id, password, f2a,
-                  cod_expense, unit_per_item))
-
-            conn.commit()
-            conn.close()
+        current_time = clock.timestamp()
+
+        product = self.product_input.currentText().strip()
+        shop = self.shop_input.text().strip()
+        price = self.price_input.text().replace("฿", "").strip()
+        payment = self.payment_input.currentText().strip()
+        tracking = self.tracking_input.text().strip()
+        user_id = self.id_input.text().strip()
+        password = self.password_input.text().strip()
+        f2a = self.f2a_input.text().strip()
+        unit_per_item = self.unit_per_item_input.text().strip()
+        unit_per_item = int(unit_per_item) if unit_per_item.isdigit() else 1  # ✅ ถ้าเว้นว่าง ให้เป็น 1
 
-            self.update_table()
-            self.update_status_summary()
-            self.load_shop_history()
-            self.load_price_history()
-            self.clear_inputs()
-            self.load_product_categories()
-            self.calculate_cod_expense()  # ✅ อัปเดตค่าใช้จ่าย COD ทันที
+        try:
+            price = float(price)
+        except ValueError:
+            QMessageBox.warning(self, "แจ้งเตือน", "❗ ราคาต้องเป็นตัวเลข!")
+            return
+        print(f"📝 บันทึกข้อมูล: {product}, unit_per_item = {unit_per_item}")
+
+        # ✅ สถานะ/ขนส่ง/cod_expense (COD = ราคา) คำนวณใน order_import.order_params
+        order = ImportedOrder(user_id, password, f2a, product, tracking, unit_per_item, price, payment, shop)
+        get_executor().write(insert_orders, [order], current_time, on_result=self.on_order_added, on_error=self.on_order_add_failed)
+
+    def on_order_added(self, _count):
+        self.update_table()
+        self.update_status_summary()
+        self.load_shop_history()
+        self.load_price_history()
+        self.clear_inputs()
+        self.load_product_categories()
+        self.calculate_cod_expense()  # ✅ อัปเดตค่าใช้จ่าย COD ทันที
+
+        QMessageBox.information(self, "✅ สำเร็จ", "บันทึกข้อมูลเรียบร้อย!")
 
-            QMessageBox.information(self, "✅ สำเร็จ", "บันทึกข้อมูลเรียบร้อย!")
+    def on_order_add_failed(self, error):
+        QMessageBox.critical(self, "❌ ข้อผิดพลาด", f"บันทึกข้อมูลไม่สำเร็จ: {error}")
 
     def show_temp_message(self, message, color="black"):
         if not hasattr(self, "message_label"):
@@ -1084,47 +1237,31 @@ class SQLiteApp(QWidget):
             self.show_temp_message("⚠️ กรุณากรอกเลขพัสดุ!", "red")
             return
 
-        conn = connect_db()
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT status, payment, price FROM orders WHERE tracking = ?", (tracking_number,))
-        result = cursor.fetchone()
+        current_time = clock.timestamp()
 
-        if result:
-            current_status, payment, price = result
+        # ✅ ตรวจ + อัปเดตบน DbExecutor: ยิงบาร์โค้ดต่อได้เลยไม่ต้องรอ DB
+        get_executor().write(mark_tracking_delivered, tracking_number, current_time, on_result=self.on_tracking_checked)
 
-            if current_status == "จัดส่งพัสดุสำเร็จ":
-                self.play_sound("Windows Notify Calendar.wav")
-                self.show_temp_message("✅ พัสดุนี้จัดส่งสำเร็จแล้ว!", "orange")
-            else:
-                timezone = pytz.timezone("Asia/Bangkok")
-                current_time = datetime.now(timezone).strftime("%Y-%m-%d %H:%M:%S")
-
-                cod_expense = price if payment == "COD" else 0  # อัปเดตค่า COD เฉพาะถ้าเป็น COD
-
-                cursor.execute("""
-                    UPDATE orders 
-                    SET status = 'จัดส่งพัสดุสำเร็จ', status_updated_at = ?, cod_expense = ?, date_recorded = ?
-                    WHERE tracking = ?;
-                """, (current_time, cod_expense, current_time, tracking_number))
-
-                conn.commit()
+        self.tracking_input_popup.clear()
+        self.tracking_input_popup.setFocus()
 
-                self.play_sound("Windows Unlock.wav")
-                self.show_temp_message("✅ จัดส่งพัสดุสำเร็จแล้ว!", "green")
+    def on_tracking_checked(self, result):
+        tracking_number, outcome = result
 
-                # ✅ อัปเดตยอด COD ทันที
-                self.calculate_cod_expense()
-                self.update_table()
+        if outcome == "already":
+            self.play_sound("Windows Notify Calendar.wav")
+            self.show_temp_message("✅ พัสดุนี้จัดส่งสำเร็จแล้ว!", "orange")
+        elif outcome == "delivered":
+            self.play_sound("Windows Unlock.wav")
+            self.show_temp_message("✅ จัดส่งพัสดุสำเร็จแล้ว!", "green")
 
+            # ✅ อัปเดตยอด COD ทันที
+            self.calculate_cod_expense()
+            self.update_table()
         else:
             self.play_sound("tada.wav")
             self.show_temp_message(f"❌ ไม่พบพัสดุ: {tracking_number}!", "red")
 
-        conn.close()
-        self.tracking_input_popup.clear()
-        self.tracking_input_popup.setFocus()
-
     def play_sound(self, sound_file):
         full_path = os.path.abspath(sound_file)
         print(f"กำลังเล่นไฟล์เสียง: {full_path}")
@@ -1140,44 +1277,6 @@ class SQLiteApp(QWidget):
         self.theme = "neon" if self.theme == "dark" else "dark"
 
 
-def sync_sqlite_to_sheets():
-    """ซิงค์ข้อมูลจาก SQLite ไปยัง Google Sheets"""
-    try:
-        print("🔄 เชื่อมต่อ Google Sheets...")  # ✅ Debug Log
-        creds = ServiceAccountCredentials.from_json_keyfile_name(
-            CREDENTIALS_FILE,
-            ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-        )
-        client = gspread.authorize(creds)
-        sheet = client.open_by_key(SHEET_ID).worksheet(SHEET_NAME)
-
-        print("✅ เชื่อมต่อ Google Sheets สำเร็จ!")  # ✅ Debug Log
-
-        # เชื่อมต่อ SQLite
-        conn = sqlite3.connect("bot_system.db")
-        cursor = conn.cursor()
-
-        print("🔄 ดึงข้อมูลจาก SQLite...")  # ✅ Debug Log
-        cursor.execute(
-            "SELECT product, shop, price, payment, tracking, status, user_id, password, f2a FROM orders WHERE hidden = 0")
-        data = cursor.fetchall()
-
-        conn.close()
-
-        print(f"📊 จำนวนข้อมูลที่ต้องอัปโหลด: {len(data)} แถว")  # ✅ Debug Log
-
-        # ล้างข้อมูลเดิมใน Google Sheets
-        sheet.clear()
-        sheet.append_row(["สินค้า", "ร้านค้า", "ราคา", "ชำระผ่าน", "เลขพัสดุ", "สถานะ", "ID", "รหัสผ่าน", "F2A"])
-
-        if data:
-            sheet.append_rows(data)
-            print("✅ ซิงค์ข้อมูลจาก SQLite ไป Google Sheets สำเร็จ!")
-
-    except Exception as e:
-        print(f"❌ เกิดข้อผิดพลาดขณะซิงค์ SQLite ไป Google Sheets:\n{e}")
-
-
 if __name__ == "__main__":
     import sys
     import traceback
@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+"""order_import.py
+
+Bulk order import for SQLiteApp's import dialog.
+
+Pasted (or file) text is parsed straight into typed ImportedOrder tuples:
+no per-cell widgets and no reading values back out of a grid. Rows are
+validated in one pass and inserted with executemany in fixed-size chunks
+inside a single transaction, so 50k pasted rows cost one parse plus one
+commit.
+
+Columns are the ones the dialog always used (Google Sheets / Excel order):
+ID ผู้ใช้, รหัสผ่าน, F2A, สินค้า, เลขพัสดุ, จำนวนสินค้า, ราคา, ช่องทางชำระเงิน, ร้านค้า
+If the first row is a header with recognised names (COLUMN_ALIASES), columns
+are mapped by name instead, so marketplace exports import as they are.
+
+Files (CSV/TSV, or XLSX when openpyxl is installed) are too big for the
+clipboard; import_file() streams them chunk by chunk and commits each chunk
+in its own transaction, so other writers get the lock between chunks.
+FileImport runs it on a QThread with progress and cancellation.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from itertools import chain, islice
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from PyQt5.QtCore import QObject, QThread, pyqtSignal, pyqtSlot
+
+from database import close_connections, get_connection, transaction
+
+IMPORT_HEADERS = [
+    "ID ผู้ใช้", "รหัสผ่าน", "F2A", "สินค้า", "เลขพัสดุ", "จำนวนสินค้า", "ราคา", "ช่องทางชำระเงิน", "ร้านค้า"
+]
+
+# rows per executemany() call
+IMPORT_CHUNK_ROWS = 5000
+
+# header names (lowercased) accepted for each ImportedOrder field
+COLUMN_ALIASES = {
+    "user_id": ("id ผู้ใช้", "ชื่อผู้ใช้", "user_id", "user id", "username"),
+    "password": ("รหัสผ่าน", "password"),
+    "f2a": ("f2a", "2fa"),
+    "product": ("สินค้า", "ชื่อสินค้า", "product", "product name"),
+    "tracking": ("เลขพัสดุ", "หมายเลขติดตามพัสดุ", "tracking", "tracking number", "tracking no"),
+    "quantity": ("จำนวนสินค้า", "จำนวน", "quantity", "qty"),
+    "price": ("ราคา", "ยอดรวม", "price", "total", "amount"),
+    "payment": ("ช่องทางชำระเงิน", "วิธีการชำระเงิน", "payment", "payment method"),
+    "shop": ("ร้านค้า", "ชื่อร้าน", "ชื่อร้านค้า", "shop", "shop name"),
+}
+
+ORDER_INSERT_SQL = """
+    INSERT INTO orders (date_recorded, product, shop, price, payment, tracking, shipping, status, user_id, password, f2a, cod_expense, unit_per_item)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+class ImportFileError(Exception):
+    """The file cannot be read as an order import (message is shown to the user)."""
+
+
+class ImportedOrder(NamedTuple):
+    user_id: str
+    password: str
+    f2a: str
+    product: str
+    tracking: str
+    quantity: int
+    price: float
+    payment: str
+    shop: str
+
+
+@dataclass
+class ParsedImport:
+    rows: List[ImportedOrder] = field(default_factory=list)
+    errors: List[Tuple[int, str]] = field(default_factory=list)  # (line number, message)
+
+
+def detect_shipping_provider(tracking_no: Optional[str]) -> str:
+    tracking_no = (tracking_no or "").strip().upper()
+    if tracking_no.startswith("TH"):
+        return "Flash Express"
+    elif tracking_no.startswith("TIK"):
+        return "Kerry"
+    return "J&T Express"
+
+
+def sniff_delimiter(first_line: str) -> str:
+    # Sheets/Excel copy as TSV; exported files are usually CSV
+    return "\t" if "\t" in first_line else ","
+
+
+def iter_records(lines: Iterable[str], delimiter: Optional[str] = None) -> Iterator[List[str]]:
+    """csv.reader over `lines` (quoted cells may span lines, as Sheets copies them)."""
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        return
+    delimiter = delimiter or sniff_delimiter(first)
+
+    def rejoin():
+        yield first
+        yield from lines
+
+    yield from csv.reader(rejoin(), delimiter=delimiter)
+
+
+def parse_price(text: str) -> float:
+    return float(text.replace("฿", "").replace(",", "").strip())
+
+
+def header_mapping(header: Sequence[str]) -> Optional[List[Optional[int]]]:
+    """Column index per ImportedOrder field, or None if `header` is not a header row."""
+    names = {str(cell).strip().lower(): i for i, cell in enumerate(header)}
+    mapping = [
+        next((names[alias] for alias in COLUMN_ALIASES[name] if alias in names), None)
+        for name in ImportedOrder._fields
+    ]
+    fields = dict(zip(ImportedOrder._fields, mapping))
+    if fields["product"] is None or fields["price"] is None:
+        return None
+    return mapping
+
+
+def mapped_records(records: Iterable[Sequence[str]]) -> Tuple[Iterator[List[str]], bool, int]:
+    """(records in ImportedOrder column order, file has a user id column, line number of the first record).
+
+    A recognised header row is consumed and used to reorder columns;
+    otherwise the records are taken positionally.
+    """
+    records = iter(records)
+    first = next(records, None)
+    if first is None:
+        return iter(()), True, 1
+
+    mapping = header_mapping(first)
+    if mapping is None:
+        return chain([list(first)], records), True, 1
+
+    def reorder(cells):
+        return ["" if i is None or i >= len(cells) else cells[i] for i in mapping]
+
+    return map(reorder, records), mapping[0] is not None, 2
+
+
+def parse_records(records: Iterable[Sequence[str]], first_line: int = 1, require_user_id: bool = True) -> ParsedImport:
+    """Typed rows + per-line errors. Blank lines are skipped."""
+    parsed = ParsedImport()
+    rows, errors = parsed.rows, parsed.errors
+
+    for line_no, cells in enumerate(records, first_line):
+        cells = [c.strip() for c in cells[:9]]
+        if not any(cells):
+            continue
+        cells += [""] * (9 - len(cells))
+        user_id, password, f2a, product, tracking, quantity, price, payment, shop = cells
+
+        if (require_user_id and not user_id) or not product or not price:
+            errors.append((line_no, "ข้อมูลไม่ครบถ้วน (ต้องมี ID ผู้ใช้, สินค้า, ราคา)"))
+            continue
+        try:
+            price = parse_price(price)
+        except ValueError:
+            errors.append((line_no, f"ราคาไม่ถูกต้อง: {price}"))
+            continue
+
+        rows.append(ImportedOrder(
+            user_id, password, f2a, product, tracking,
+            # ✅ ถ้าไม่ได้ใส่จำนวน หรือใส่ไม่ใช่ตัวเลข ให้เป็น 1
+            int(quantity) if quantity.isdigit() else 1,
+            price, payment, shop or "-",
+        ))
+
+    return parsed
+
+
+def parse_text(text: str) -> ParsedImport:
+    """Parse clipboard text (TSV from Sheets/Excel, or CSV)."""
+    records, has_user_id, first_line = mapped_records(iter_records(io.StringIO(text)))
+    return parse_records(records, first_line, require_user_id=has_user_id)
+
+
+def order_params(row: ImportedOrder, date_recorded: str) -> tuple:
+    status = "รอจัดส่ง" if not row.tracking else "อยู่ระหว่างการจัดส่ง"
+    cod_expense = row.price if row.payment == "COD" else 0
+    return (
+        date_recorded, row.product, row.shop, row.price, row.payment, row.tracking,
+        detect_shipping_provider(row.tracking), status, row.user_id, row.password, row.f2a,
+        cod_expense, row.quantity,
+    )
+
+
+def insert_orders(
+    conn: sqlite3.Connection,
+    rows: Iterable[ImportedOrder],
+    date_recorded: str,
+    chunk_rows: int = IMPORT_CHUNK_ROWS,
+    progress: Optional[Callable[[int], None]] = None,
+) -> int:
+    """Insert `rows` in one transaction, `chunk_rows` per executemany().
+
+    `progress(inserted_so_far)` is called after every chunk. Returns the
+    number of rows inserted.
+    """
+    params = (order_params(row, date_recorded) for row in rows)
+    inserted = 0
+    with transaction(immediate=True) as tx:
+        while True:
+            chunk = list(islice(params, chunk_rows))
+            if not chunk:
+                break
+            tx.executemany(ORDER_INSERT_SQL, chunk)
+            inserted += len(chunk)
+            if progress is not None:
+                progress(inserted)
+    return inserted
+
+
+def _cell_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))  # 123456.0 -> "123456" (tracking numbers, prices)
+    return str(value)
+
+
+def _text_encoding(path: str) -> str:
+    # UTF-8 (with or without BOM) from Sheets/marketplaces; Thai Excel saves CSV as cp874
+    with open(path, "rb") as f:
+        head = f.read(1 << 16)
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        if e.start < len(head) - 4:  # not just a character cut at the 64 KB boundary
+            return "cp874"
+    return "utf-8-sig"
+
+
+@contextmanager
+def open_order_file(path: str) -> Iterator[Tuple[Iterator[List[str]], Callable[[], float]]]:
+    """(records, fraction of the file read so far) for a CSV/TSV/TXT or XLSX file."""
+    if path.lower().endswith((".xlsx", ".xlsm")):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ImportFileError("ต้องติดตั้ง openpyxl ก่อนจึงจะนำเข้าไฟล์ Excel ได้ (pip install openpyxl)") from None
+
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            sheet = workbook.active
+            total = sheet.max_row or 0
+            read = [0]
+
+            def rows():
+                for values in sheet.iter_rows(values_only=True):
+                    read[0] += 1
+                    yield [_cell_text(v) for v in values]
+
+            yield rows(), lambda: read[0] / total if total else 0.0
+        finally:
+            workbook.close()
+        return
+
+    size = os.path.getsize(path) or 1
+    with open(path, "rb") as raw:
+        text = io.TextIOWrapper(raw, encoding=_text_encoding(path), newline="")
+        yield iter_records(text), lambda: min(raw.tell() / size, 1.0)
+
+
+def import_file(
+    path: str,
+    date_recorded: str,
+    chunk_rows: int = IMPORT_CHUNK_ROWS,
+    progress: Optional[Callable[[int, float], None]] = None,
+    should_stop: Callable[[], bool] = lambda: False,
+) -> Tuple[int, List[Tuple[int, str]], bool]:
+    """Stream `path` into `orders`, one transaction per `chunk_rows` records.
+
+    `progress(inserted_so_far, fraction_read)` is called after each chunk;
+    `should_stop()` is checked between chunks (chunks already committed
+    stay). Returns (inserted, errors, stopped).
+    """
+    conn = get_connection()
+    inserted = 0
+    errors: List[Tuple[int, str]] = []
+
+    with open_order_file(path) as (records, fraction_read):
+        records, has_user_id, line_no = mapped_records(records)
+        while True:
+            if should_stop():
+                return inserted, errors, True
+
+            chunk = list(islice(records, chunk_rows))
+            if not chunk:
+                return inserted, errors, False
+
+            parsed = parse_records(chunk, line_no, require_user_id=has_user_id)
+            line_no += len(chunk)
+            errors.extend(parsed.errors)
+            if parsed.rows:
+                inserted += insert_orders(conn, parsed.rows, date_recorded, chunk_rows)
+            if progress is not None:
+                progress(inserted, fraction_read())
+
+
+class _FileImportWorker(QObject):
+    progress = pyqtSignal(int, int)  # rows inserted, percent of the file read
+    finished = pyqtSignal(int, list, bool)  # rows inserted, errors, cancelled
+    failed = pyqtSignal(str)
+
+    def __init__(self, path: str, date_recorded: str, chunk_rows: int):
+        super().__init__()
+        self._args = (path, date_recorded, chunk_rows)
+        self._stop = threading.Event()
+
+    @pyqtSlot()
+    def run(self) -> None:
+        try:
+            inserted, errors, cancelled = import_file(
+                *self._args,
+                progress=lambda n, fraction: self.progress.emit(n, int(fraction * 100)),
+                should_stop=self._stop.is_set,
+            )
+        except (ImportFileError, OSError, csv.Error, sqlite3.Error) as e:
+            self.failed.emit(str(e))
+        except Exception as e:  # openpyxl raises its own types for broken workbooks
+            self.failed.emit(f"{type(e).__name__}: {e}")
+        else:
+            self.finished.emit(inserted, errors, cancelled)
+        finally:
+            close_connections()  # this thread's connection; the thread ends here
+
+
+class FileImport(QObject):
+    """Import one order file on its own thread.
+
+    Signals arrive on the GUI thread: progress(inserted, percent),
+    finished(inserted, errors, cancelled) or failed(message).
+    """
+
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(int, list, bool)
+    failed = pyqtSignal(str)
+
+    def __init__(self, path: str, date_recorded: str, chunk_rows: int = IMPORT_CHUNK_ROWS, parent=None):
+        super().__init__(parent)
+        self._thread = QThread()
+        self._worker = _FileImportWorker(path, date_recorded, chunk_rows)
+        self._worker.moveToThread(self._thread)
+        self._thread.started.connect(self._worker.run)
+        self._worker.progress.connect(self.progress)
+        self._worker.finished.connect(self.finished)
+        self._worker.failed.connect(self.failed)
+        self._worker.finished.connect(self._thread.quit)
+        self._worker.failed.connect(self._thread.quit)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def cancel(self) -> None:
+        """Stop after the chunk being inserted (already committed chunks stay)."""
+        self._worker._stop.set()
+
+    def wait(self) -> None:
+        self._thread.wait()
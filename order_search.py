@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""order_search.py
+
+Order search for SQLiteApp backed by the `orders_fts` trigram index.
+
+Trigram matching is substring matching, which is what Thai text needs (no
+spaces between words). Queries shorter than three characters cannot form a
+trigram, so they fall back to the old LIKE scan.
+
+LiveOrderSearch runs searches on its own thread for search-as-you-type: each
+new search supersedes the previous one, which is aborted mid-query through an
+SQLite progress handler, and results arrive in chunks via a Qt signal.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+from typing import List, Optional
+
+from PyQt5.QtCore import QCoreApplication, QObject, QThread, pyqtSignal, pyqtSlot
+
+from database import get_connection
+
+# id first, then the grid columns (same order as main_ui.ORDER_GRID_COLUMNS)
+SEARCH_COLUMNS = "id, date_recorded, product, shop, price, payment, shipping, status, tracking, user_id, password, f2a"
+
+MIN_FTS_LENGTH = 3
+
+
+def _fts_phrase(text: str) -> str:
+    # one quoted phrase: the whole input is matched as a substring, and FTS
+    # operators/punctuation in user input lose their meaning
+    return '"' + text.replace('"', '""') + '"'
+
+
+def normalize_query(text: str) -> str:
+    text = text.strip().lower()
+    # ตัด "฿" ออกจากการค้นหาถ้าผู้ใช้ค้นหาด้วยราคา
+    if text.startswith("฿"):
+        text = text[1:].strip()
+    return text
+
+
+def search_orders_cursor(text: str, conn: sqlite3.Connection) -> Optional[sqlite3.Cursor]:
+    """Executed (not yet fetched) search cursor, or None for an empty query."""
+    text = normalize_query(text)
+    if not text:
+        return None
+
+    if len(text) >= MIN_FTS_LENGTH:
+        return conn.execute(
+            f"""
+            SELECT {", ".join("o." + c.strip() for c in SEARCH_COLUMNS.split(","))}
+            FROM orders_fts f
+            JOIN orders o ON o.id = f.rowid
+            WHERE orders_fts MATCH ?
+            ORDER BY f.rank
+            """,
+            (_fts_phrase(text),),
+        )
+
+    pattern = f"%{text}%"
+    return conn.execute(
+        f"""
+        SELECT {SEARCH_COLUMNS}
+        FROM orders
+        WHERE
+            LOWER(product) LIKE ? OR
+            LOWER(shop) LIKE ? OR
+            LOWER(tracking) LIKE ? OR
+            LOWER(user_id) LIKE ? OR
+            LOWER(status) LIKE ? OR
+            price LIKE ?
+        ORDER BY date_recorded DESC, id DESC
+        """,
+        (pattern,) * 6,
+    )
+
+
+def search_orders(
+    text: str,
+    conn: Optional[sqlite3.Connection] = None,
+    db_path: Optional[os.PathLike | str] = None,
+) -> List[tuple]:
+    """Orders whose product/shop/tracking/user_id/status/price contain `text`.
+
+    Best matches first (bm25). Includes hidden orders, as search always did.
+    """
+    cursor = search_orders_cursor(text, conn or get_connection(db_path))
+    return cursor.fetchall() if cursor is not None else []
+
+
+class _SearchWorker(QObject):
+    # generation, rows, first chunk, last chunk
+    chunk = pyqtSignal(int, list, bool, bool)
+
+    def __init__(self, owner: "LiveOrderSearch", chunk_size: int):
+        super().__init__()
+        self._owner = owner
+        self._chunk_size = chunk_size
+
+    @pyqtSlot(int, str)
+    def run(self, generation: int, text: str) -> None:
+        def stale() -> bool:
+            return generation != self._owner.generation
+
+        if stale():
+            return  # a newer keystroke is already queued
+
+        conn = get_connection()
+        # non-zero return aborts the running statement ("interrupted")
+        conn.set_progress_handler(lambda: 1 if stale() else 0, 1000)
+        try:
+            cursor = search_orders_cursor(text, conn)
+            first = True
+            while True:
+                rows = cursor.fetchmany(self._chunk_size) if cursor is not None else []
+                if stale():
+                    return
+                done = len(rows) < self._chunk_size
+                self.chunk.emit(generation, rows, first, done)
+                first = False
+                if done:
+                    return
+        except sqlite3.OperationalError as e:
+            if not stale():
+                print(f"❌ ค้นหาไม่สำเร็จ: {e}")
+                self.chunk.emit(generation, [], True, True)
+        finally:
+            conn.set_progress_handler(None, 0)
+
+
+class LiveOrderSearch(QObject):
+    """Background order search; only the latest search() delivers results.
+
+    `chunk(generation, rows, first, done)` is emitted on the GUI thread;
+    compare `generation` with the value search() returned.
+    """
+
+    chunk = pyqtSignal(int, list, bool, bool)
+    _request = pyqtSignal(int, str)
+
+    def __init__(self, parent=None, chunk_size: int = 200):
+        super().__init__(parent)
+        self.generation = 0
+
+        self._thread = QThread()
+        self._worker = _SearchWorker(self, chunk_size)
+        self._worker.moveToThread(self._thread)
+        self._request.connect(self._worker.run)
+        self._worker.chunk.connect(self.chunk)
+        self._thread.start()
+
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.shutdown)
+
+    def search(self, text: str) -> int:
+        self.generation += 1
+        self._request.emit(self.generation, text)
+        return self.generation
+
+    def cancel(self) -> None:
+        """Drop any running/queued search."""
+        self.generation += 1
+
+    def shutdown(self) -> None:
+        self.cancel()
+        self._thread.quit()
+        self._thread.wait()
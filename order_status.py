@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""order_status.py
+
+Stored order statuses and the aging job that keeps them current.
+
+The grid used to derive a display status for every row in Python on every
+refresh (without writing it back), so the grid and the status summary could
+disagree. age_order_statuses() applies the same rules to `orders.status`
+with set-based UPDATEs; run it on a schedule and everything else just reads
+the stored value:
+
+- delivered orders are never touched
+- no tracking number          -> รอจัดส่ง
+- tracking number             -> อยู่ระหว่างการจัดส่ง
+- recorded AGING_DAYS+ days ago -> ตรวจสอบพัสดุ (whatever the tracking)
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Optional
+
+import clock
+from database import transaction
+
+WAITING = "รอจัดส่ง"
+IN_TRANSIT = "อยู่ระหว่างการจัดส่ง"
+CHECK_PARCEL = "ตรวจสอบพัสดุ"
+DELIVERED = "จัดส่งพัสดุสำเร็จ"
+
+# "older than 3 days" = more than AGING_DAYS whole days since date_recorded
+AGING_DAYS = 3
+
+AGING_INTERVAL_MS = 60_000
+
+_DERIVED_STATUS = f"""
+    CASE
+        WHEN date_recorded <= :cutoff THEN '{CHECK_PARCEL}'
+        WHEN TRIM(COALESCE(tracking, '')) = '' THEN '{WAITING}'
+        ELSE '{IN_TRANSIT}'
+    END
+"""
+
+
+def age_order_statuses(conn: sqlite3.Connection, now: Optional[datetime] = None) -> int:
+    """Write the derived status of every undelivered order whose stored one is
+    out of date; returns how many orders changed."""
+    now = now or clock.now()
+    params = {
+        # (now - recorded).days > AGING_DAYS  <=>  recorded <= now - (AGING_DAYS + 1) days
+        "cutoff": (now - timedelta(days=AGING_DAYS + 1)).strftime(clock.TIMESTAMP_FORMAT),
+        "now": now.strftime(clock.TIMESTAMP_FORMAT),
+    }
+    with transaction(conn, immediate=True) as tx:
+        # walks idx_orders_undelivered, not the delivered history
+        changed = tx.execute(
+            f"""
+            UPDATE orders SET status = {_DERIVED_STATUS}, status_updated_at = :now
+            WHERE status != '{DELIVERED}' AND status != {_DERIVED_STATUS}
+            """,
+            params,
+        ).rowcount
+        changed += tx.execute(
+            f"UPDATE orders SET status = {_DERIVED_STATUS}, status_updated_at = :now WHERE status IS NULL",
+            params,
+        ).rowcount
+    return changed
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""outbox.py
+
+Background upstream sync of orders through the `outbox` table.
+
+Triggers on `orders` (database migration v6) queue the id of every order
+that was inserted, deleted or had a synced column changed. OutboxSync runs a
+worker on its own thread that drains the queue on a schedule:
+
+- one batch = the oldest OUTBOX_BATCH_ROWS entries, coalesced per order;
+  the upstream receives the orders' *current* state (upserts) and the ids
+  that no longer exist (deletes), so a batch may be pushed any number of
+  times with the same result
+- entries are deleted only after the upstream accepted the batch; changes
+  made meanwhile get new entries and go out with a later batch
+- a failed push is retried after RETRY_BASE_MS, doubling up to RETRY_MAX_MS
+
+Where the orders go is an Upstream (sheets_sync.SheetsUpstream for Google
+Sheets; JsonFileUpstream and HttpUpstream as local/test stand-ins).
+
+Status updates (OutboxStatus) arrive on the GUI thread for the status bar.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import List
+
+from PyQt5.QtCore import QCoreApplication, QMetaObject, QObject, Qt, QThread, QTimer, pyqtSignal, pyqtSlot
+
+from database import close_connections, get_connection, transaction
+
+# same columns the outbox triggers watch, plus the id
+OUTBOX_COLUMNS = (
+    "id", "date_recorded", "product", "shop", "price", "payment", "shipping",
+    "status", "tracking", "user_id", "password", "f2a", "hidden",
+)
+
+OUTBOX_BATCH_ROWS = 500
+SYNC_INTERVAL_MS = 30_000
+RETRY_BASE_MS = 5_000
+RETRY_MAX_MS = 5 * 60_000
+
+
+class Upstream:
+    """Receiver of order changes. push() must be idempotent."""
+
+    def push(self, upserts: List[dict], deletes: List[int]) -> None:
+        """Store `upserts` (OUTBOX_COLUMNS dicts, keyed by "id") and drop `deletes` (order ids)."""
+        raise NotImplementedError
+
+
+class JsonFileUpstream(Upstream):
+    """Keeps the pushed orders in a local JSON file ({order id: record})."""
+
+    def __init__(self, path: os.PathLike | str):
+        self.path = path
+
+    def load(self) -> dict:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def push(self, upserts: List[dict], deletes: List[int]) -> None:
+        orders = self.load()
+        for record in upserts:
+            orders[str(record["id"])] = record
+        for order_id in deletes:
+            orders.pop(str(order_id), None)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(orders, f, ensure_ascii=False)
+        os.replace(tmp, self.path)  # readers never see a half-written file
+
+
+class HttpUpstream(Upstream):
+    """POSTs {"upserts": [...], "deletes": [...]} as JSON; any non-2xx reply is a failure."""
+
+    def __init__(self, url: str, timeout: float = 15):
+        import requests
+
+        self.url = url
+        self.timeout = timeout
+        self._session = requests.Session()  # keep-alive between batches
+
+    def push(self, upserts: List[dict], deletes: List[int]) -> None:
+        r = self._session.post(self.url, json={"upserts": upserts, "deletes": deletes}, timeout=self.timeout)
+        r.raise_for_status()
+
+
+def pending_count(conn) -> int:
+    return conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+
+def drain_batch(conn, upstream: Upstream, batch_rows: int = OUTBOX_BATCH_ROWS) -> int:
+    """Push the oldest `batch_rows` outbox entries; returns how many were consumed (0 = empty)."""
+    with transaction(conn) as tx:  # one read snapshot for the entries and the orders
+        entries = tx.execute("SELECT id, order_id FROM outbox ORDER BY id LIMIT ?", (batch_rows,)).fetchall()
+        if not entries:
+            return 0
+        order_ids = list(dict.fromkeys(order_id for _, order_id in entries))
+        cursor = tx.execute(
+            f"SELECT {', '.join(OUTBOX_COLUMNS)} FROM orders WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps(order_ids),),
+        )
+        upserts = [dict(zip(OUTBOX_COLUMNS, row)) for row in cursor]
+
+    found = {record["id"] for record in upserts}
+    upstream.push(upserts, [order_id for order_id in order_ids if order_id not in found])
+
+    with transaction(conn, immediate=True) as tx:
+        tx.execute("DELETE FROM outbox WHERE id <= ?", (entries[-1][0],))
+    return len(entries)
+
+
+def retry_delay_ms(failures: int) -> int:
+    """Back-off before the next attempt after `failures` failed pushes in a row."""
+    return min(RETRY_BASE_MS * 2 ** (failures - 1), RETRY_MAX_MS)
+
+
+@dataclass
+class OutboxStatus:
+    state: str  # "syncing" | "idle" | "retrying"
+    pending: int  # outbox entries still queued
+    pushed: int  # entries pushed since the app started
+    rate: float  # entries per second over the last run
+    error: str = ""
+    retry_in_ms: int = 0
+
+
+class _OutboxWorker(QObject):
+    status = pyqtSignal(object)
+
+    def __init__(self, upstream: Upstream, interval_ms: int, batch_rows: int):
+        super().__init__()
+        self._upstream = upstream
+        self._interval_ms = interval_ms
+        self._batch_rows = batch_rows
+        self._timer = None
+        self._failures = 0
+        self._pushed = 0
+        self._run_started = None
+        self._run_pushed = 0
+        self._rate = 0.0
+
+    @pyqtSlot()
+    def start(self) -> None:
+        # created here so the timer lives (and fires) on the worker thread
+        self._timer = QTimer()
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.run)
+        self._timer.start(0)
+
+    @pyqtSlot()
+    def sync_now(self) -> None:
+        """Skip the wait (also a pending retry back-off)."""
+        self._failures = 0
+        if self._timer is not None:
+            self._timer.start(0)
+
+    @pyqtSlot()
+    def stop(self) -> None:
+        if self._timer is not None:
+            self._timer.stop()
+        close_connections()  # this thread's connection; the thread ends after this
+
+    @pyqtSlot()
+    def run(self) -> None:
+        conn = get_connection()
+        if self._run_started is None:
+            self._run_started = time.monotonic()
+            self._run_pushed = 0
+        try:
+            consumed = drain_batch(conn, self._upstream, self._batch_rows)
+        except Exception as e:  # upstream errors have many types (network, auth, quota)
+            self._failures += 1
+            delay = retry_delay_ms(self._failures)
+            print(f"❌ ซิงค์ outbox ไม่สำเร็จ (ครั้งที่ {self._failures}) ลองใหม่ใน {delay // 1000} วินาที: {e!r}")
+            self._run_started = None
+            self._emit("retrying", conn, error=f"{type(e).__name__}: {e}", retry_in_ms=delay)
+            self._timer.start(delay)
+            return
+
+        self._failures = 0
+        self._pushed += consumed
+        self._run_pushed += consumed
+        elapsed = time.monotonic() - self._run_started
+        if self._run_pushed:
+            self._rate = self._run_pushed / elapsed if elapsed > 0 else 0.0
+
+        if consumed == self._batch_rows:
+            self._emit("syncing", conn)
+            self._timer.start(0)  # more queued: next batch right away (stop/sync_now still get through)
+        else:
+            self._run_started = None
+            self._emit("idle", conn)
+            self._timer.start(self._interval_ms)
+
+    def _emit(self, state: str, conn, error: str = "", retry_in_ms: int = 0) -> None:
+        try:
+            pending = pending_count(conn)
+        except Exception:
+            pending = -1
+        self.status.emit(OutboxStatus(state, pending, self._pushed, self._rate, error, retry_in_ms))
+
+
+class OutboxSync(QObject):
+    """Drain the order outbox to `upstream` on a background thread.
+
+    Runs every `interval_ms` (back to back while a backlog remains, with
+    exponential back-off after failures). `status(OutboxStatus)` arrives on
+    the GUI thread.
+    """
+
+    status = pyqtSignal(object)
+    _start = pyqtSignal()
+    _sync_now = pyqtSignal()
+
+    def __init__(self, upstream: Upstream, interval_ms: int = SYNC_INTERVAL_MS,
+                 batch_rows: int = OUTBOX_BATCH_ROWS, parent=None):
+        super().__init__(parent)
+        self._thread = QThread()
+        self._worker = _OutboxWorker(upstream, interval_ms, batch_rows)
+        self._worker.moveToThread(self._thread)
+        self._start.connect(self._worker.start)
+        self._sync_now.connect(self._worker.sync_now)
+        self._worker.status.connect(self.status)
+
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.shutdown)
+
+    def start(self) -> None:
+        self._thread.start()
+        self._start.emit()
+
+    def sync_now(self) -> None:
+        self._sync_now.emit()
+
+    def shutdown(self) -> None:
+        """Finish the batch being pushed, then stop the thread."""
+        if not self._thread.isRunning():
+            return
+        QMetaObject.invokeMethod(self._worker, "stop", Qt.BlockingQueuedConnection)
+        self._thread.quit()
+        self._thread.wait()
+
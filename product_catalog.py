@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""product_catalog.py
+
+In-memory product catalog for the SellWindow scan path.
+
+One load (two queries) builds dicts keyed by barcode and by product name, so
+a scan resolves barcode -> full record (prices, unit factors, stock on hand)
+with a dict lookup instead of a UNION over stock/product_categories plus
+three or four follow-up queries.
+
+The catalog remembers catalog_version (database migration v14), a counter
+that triggers on stock/product_categories bump on every relevant change, from
+any process. Each get_catalog() reads it (a primary-key lookup) and reloads
+when it moved, so the till also sees edits made in main.py. In-process
+writers still call invalidate_catalog() after committing; a load that was
+running at the time is then not kept.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from database import get_connection, transaction
+from product_units import ProductUnits
+
+DbPath = Optional[os.PathLike | str]
+
+
+@dataclass(frozen=True)
+class ProductRecord:
+    name: str
+    stock_id: Optional[int]  # None = in product_categories but never stocked
+    quantity: int  # on hand, in pieces
+    retail: float  # per piece
+    wholesale: float  # per piece
+    units: ProductUnits
+
+    def unit_factor(self, unit_type: str) -> int:
+        """Pieces per ชิ้น / แพ็ค / ลัง."""
+        return self.units.factor(unit_type)
+
+    def price(self, customer_type: str) -> float:
+        """Per-piece price for ลูกค้าปลีก / ลูกค้าส่ง."""
+        return self.retail if customer_type == "ลูกค้าปลีก" else self.wholesale
+
+
+class ProductCatalog:
+    def __init__(self, db_path: DbPath = None):
+        self.by_name: Dict[str, ProductRecord] = {}
+        self.by_barcode: Dict[str, ProductRecord] = {}
+        # one read transaction: the version matches the rows loaded
+        with transaction(db_path) as conn:
+            self.version = catalog_version(conn)
+            self._load(conn)
+
+    def _load(self, conn: sqlite3.Connection) -> None:
+
+        # one ProductUnits per distinct (pack, carton), shared by the records
+        units: Dict[tuple, ProductUnits] = {}
+
+        def units_of(per_pack, per_carton) -> ProductUnits:
+            key = (per_pack or 1, per_carton or 1)
+            if key not in units:
+                units[key] = ProductUnits(*key)
+            return units[key]
+
+        categories = {
+            name: (barcode, retail, wholesale, units_of(per_pack, per_carton))
+            for name, barcode, retail, wholesale, per_pack, per_carton in conn.execute(
+                """
+                SELECT product_name, barcode, sell_price_retail, sell_price_wholesale,
+                       units_per_pack, units_per_carton
+                FROM product_categories
+                """
+            )
+        }
+
+        barcodes: Dict[str, str] = {}
+        # stock.product is UNIQUE (v10), one record per row; ORDER BY id: a barcode
+        # shared by several products resolves to the oldest stock row
+        for stock_id, name, barcode, quantity, retail, wholesale, per_pack, per_carton in conn.execute(
+            """
+            SELECT id, product, barcode, quantity, sell_price_retail, sell_price_wholesale,
+                   units_per_pack, units_per_carton
+            FROM stock
+            ORDER BY id
+            """
+        ):
+            category = categories.get(name)
+            if category:
+                # product_categories is the source of truth for prices
+                retail, wholesale = category[1], category[2]
+            self.by_name[name] = ProductRecord(
+                name, stock_id, quantity or 0, retail or 0, wholesale or 0, units_of(per_pack, per_carton)
+            )
+            if barcode:
+                barcodes.setdefault(barcode, name)
+
+        for name, (barcode, retail, wholesale, category_units) in categories.items():
+            if name not in self.by_name:
+                self.by_name[name] = ProductRecord(name, None, 0, retail or 0, wholesale or 0, category_units)
+            if barcode:
+                barcodes.setdefault(barcode, name)
+
+        self.by_barcode = {barcode: self.by_name[name] for barcode, name in barcodes.items()}
+
+    def lookup_barcode(self, barcode: str) -> Optional[ProductRecord]:
+        return self.by_barcode.get(barcode.strip())
+
+    def lookup_name(self, name: str) -> Optional[ProductRecord]:
+        return self.by_name.get(name)
+
+
+def catalog_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT version FROM catalog_version WHERE id = 1").fetchone()[0]
+
+
+_catalog: Optional[ProductCatalog] = None
+_generation = 0  # bumped by invalidate_catalog()
+_lock = threading.Lock()
+
+
+def get_catalog(db_path: DbPath = None) -> ProductCatalog:
+    """Shared catalog, reloaded when catalog_version moved or after invalidation."""
+    global _catalog
+    with _lock:
+        catalog, generation = _catalog, _generation
+    if catalog is not None and catalog.version == catalog_version(get_connection(db_path)):
+        return catalog
+
+    catalog = ProductCatalog(db_path)
+    with _lock:
+        # an invalidate_catalog() during the load means it may predate that write
+        if _generation == generation:
+            _catalog = catalog
+    return catalog
+
+
+def invalidate_catalog() -> None:
+    global _catalog, _generation
+    with _lock:
+        _catalog = None
+        _generation += 1
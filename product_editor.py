@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QDoubleValidator
@@ -17,7 +17,10 @@ from PyQt5.QtWidgets import (
     QVBoxLayout,
 )
 
-from database import connect_db
+from database import transaction
+from db_worker import get_executor
+from product_catalog import invalidate_catalog
+from product_units import PIECE, ProductUnits
 
 
 @dataclass
@@ -28,6 +31,69 @@ class ProductFormData:
     retail: float
     wholesale: float
     unit_conversion: str
+    units: ProductUnits = field(init=False)
+
+    def __post_init__(self):
+        # parsed once here; the DB keeps the integers next to the (normalized) string
+        self.units = ProductUnits.parse(self.unit_conversion)
+
+
+def save_product(conn, data: ProductFormData) -> None:
+    """Upsert one product_categories row and sync its prices to stock (runs on the DB executor)."""
+    with transaction(conn) as tx:
+        cur = tx.cursor()
+
+        # Upsert by product_name
+        cur.execute("SELECT COUNT(*) FROM product_categories WHERE product_name = ?", (data.name,))
+        exists = cur.fetchone()[0] or 0
+
+        if exists:
+            cur.execute(
+                """
+                UPDATE product_categories
+                SET barcode = ?, sku_prefix = ?, sell_price_retail = ?, sell_price_wholesale = ?, unit_conversion = ?,
+                    units_per_pack = ?, units_per_carton = ?
+                WHERE product_name = ?
+                """,
+                (data.barcode, data.sku, data.retail, data.wholesale, data.units.conversion,
+                 data.units.per_pack, data.units.per_carton, data.name),
+            )
+        else:
+            cur.execute(
+                """
+                INSERT INTO product_categories (product_name, barcode, sku_prefix, sell_price_retail, sell_price_wholesale,
+                                                unit_conversion, units_per_pack, units_per_carton)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (data.name, data.barcode, data.sku, data.retail, data.wholesale, data.units.conversion,
+                 data.units.per_pack, data.units.per_carton),
+            )
+
+        # ✅ ซิงค์ราคากับ stock ด้วย (SellWindow ใช้ราคาจาก stock ตอนขายจริง)
+        cur.execute(
+            """
+            UPDATE stock
+            SET sell_price_retail = :retail,
+                sell_price_wholesale = :wholesale,
+                barcode = COALESCE(NULLIF(:barcode, ''), barcode),
+                unit_conversion = :unit_conversion,
+                units_per_pack = :per_pack,
+                units_per_carton = :per_carton
+            WHERE product = :name
+            """,
+            {
+                "retail": data.retail,
+                "wholesale": data.wholesale,
+                "barcode": data.barcode,
+                "unit_conversion": data.units.conversion,
+                "per_pack": data.units.per_pack,
+                "per_carton": data.units.per_carton,
+                "name": data.name,
+            },
+        )
+
+    # SellWindow อ่านราคา/บาร์โค้ดจาก catalog ในหน่วยความจำ
+    invalidate_catalog()
 
 
 class ProductEditorDialog(QDialog):
@@ -106,20 +172,18 @@ class ProductEditorDialog(QDialog):
 
     def _reload_product_names(self) -> None:
         """โหลดรายชื่อสินค้าในระบบมาให้เลือก/ค้นหาได้เร็ว"""
-        try:
-            conn = connect_db()
-            cur = conn.cursor()
-            cur.execute(
-                """
-                SELECT product_name
-                FROM product_categories
-                ORDER BY product_name COLLATE NOCASE ASC
-                """
-            )
-            names = [r[0] for r in cur.fetchall()]
-            conn.close()
-        except Exception:
-            names = []
+        get_executor().query(
+            """
+            SELECT product_name
+            FROM product_categories
+            ORDER BY product_name COLLATE NOCASE ASC
+            """,
+            on_result=self._set_product_names,
+            on_error=lambda _e: None,
+        )
+
+    def _set_product_names(self, rows) -> None:
+        names = [r[0] for r in rows]
 
         current = self.name.currentText().strip() if self.name.currentText() else ""
 
@@ -145,7 +209,7 @@ class ProductEditorDialog(QDialog):
         name = self.name.currentText().strip()
         barcode = self.barcode.text().strip()
         sku = self.sku.text().strip() or "-"
-        unit_conversion = self.unit.text().strip() or "1:1"
+        unit_conversion = self.unit.text().strip() or PIECE.conversion
 
         if not name:
             QMessageBox.warning(self, "แจ้งเตือน", "กรุณากรอก 'ชื่อสินค้า'")
@@ -158,15 +222,9 @@ class ProductEditorDialog(QDialog):
             QMessageBox.warning(self, "แจ้งเตือน", "ราคา (ปลีก/ส่ง) ต้องเป็นตัวเลข")
             return None
 
-        # Validate unit_conversion (allow 1:6:24 etc.)
-        try:
-            parts = [int(p) for p in unit_conversion.split(":") if p != ""]
-            if len(parts) < 2:
-                raise ValueError
-            if any(p <= 0 for p in parts):
-                raise ValueError
-        except Exception:
-            QMessageBox.warning(self, "แจ้งเตือน", "หน่วยต้องเป็นรูปแบบตัวเลขคั่นด้วย ':' เช่น 1:6:24")
+        # Validate unit_conversion: exactly 1:<pack>:<carton>, as ProductUnits reads it
+        if ProductUnits.parse(unit_conversion).conversion != unit_conversion:
+            QMessageBox.warning(self, "แจ้งเตือน", "หน่วยต้องเป็นรูปแบบ 1:แพ็ค:ลัง (ตัวเลขมากกว่า 0) เช่น 1:6:24")
             return None
 
         return ProductFormData(
@@ -184,19 +242,18 @@ class ProductEditorDialog(QDialog):
             QMessageBox.information(self, "แจ้งเตือน", "พิมพ์ชื่อสินค้าก่อน แล้วค่อยกด 'โหลดตามชื่อ'")
             return
 
-        conn = connect_db()
-        cur = conn.cursor()
-        cur.execute(
+        get_executor().query(
             """
             SELECT barcode, sku_prefix, sell_price_retail, sell_price_wholesale, unit_conversion
             FROM product_categories
             WHERE product_name = ?
             """,
             (name,),
+            on_result=self._fill_form,
         )
-        row = cur.fetchone()
-        conn.close()
 
+    def _fill_form(self, rows) -> None:
+        row = rows[0] if rows else None
         if not row:
             QMessageBox.information(self, "ไม่พบ", "ยังไม่มีสินค้านี้ในฐานข้อมูล (ถ้ากดบันทึก จะเป็นการเพิ่มใหม่)")
             return
@@ -206,55 +263,25 @@ class ProductEditorDialog(QDialog):
         self.sku.setText(sku or "")
         self.retail.setText(str(retail or 0))
         self.wholesale.setText(str(wholesale or 0))
-        self.unit.setText(unit_conversion or "1:1")
+        # ✅ แสดงตามที่ขายจริง (ค่าเก่าอย่าง "1:6" ขายเป็นชิ้น → 1:1:1)
+        self.unit.setText(ProductUnits.parse(unit_conversion).conversion)
 
     def save(self) -> None:
         data = self._read()
         if not data:
             return
 
-        conn = connect_db()
-        cur = conn.cursor()
-
-        # Upsert by product_name
-        cur.execute("SELECT COUNT(*) FROM product_categories WHERE product_name = ?", (data.name,))
-        exists = cur.fetchone()[0] or 0
-
-        if exists:
-            cur.execute(
-                """
-                UPDATE product_categories
-                SET barcode = ?, sku_prefix = ?, sell_price_retail = ?, sell_price_wholesale = ?, unit_conversion = ?
-                WHERE product_name = ?
-                """,
-                (data.barcode, data.sku, data.retail, data.wholesale, data.unit_conversion, data.name),
-            )
-        else:
-            cur.execute(
-                """
-                INSERT INTO product_categories (product_name, barcode, sku_prefix, sell_price_retail, sell_price_wholesale, unit_conversion)
-                VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                (data.name, data.barcode, data.sku, data.retail, data.wholesale, data.unit_conversion),
-            )
-
-        # ✅ ซิงค์ราคากับ stock ด้วย (SellWindow ใช้ราคาจาก stock ตอนขายจริง)
-        cur.execute(
-            """
-            UPDATE stock
-            SET sell_price_retail = ?,
-                sell_price_wholesale = ?,
-                barcode = COALESCE(NULLIF(?, ''), barcode),
-                unit_conversion = COALESCE(NULLIF(?, ''), unit_conversion)
-            WHERE product = ?
-            """,
-            (data.retail, data.wholesale, data.barcode, data.unit_conversion, data.name),
-        )
+        self.save_btn.setEnabled(False)
+        get_executor().write(save_product, data, on_result=self._saved, on_error=self._save_failed)
 
-        conn.commit()
-        conn.close()
+    def _saved(self, _result) -> None:
+        self.save_btn.setEnabled(True)
 
         # รีโหลดรายชื่อหลังบันทึก เผื่อเพิ่มสินค้าใหม่
         self._reload_product_names()
 
         QMessageBox.information(self, "สำเร็จ", "บันทึกสินค้าเรียบร้อย")
+
+    def _save_failed(self, error: Exception) -> None:
+        self.save_btn.setEnabled(True)
+        QMessageBox.critical(self, "ข้อผิดพลาด", f"บันทึกไม่สำเร็จ: {error}")
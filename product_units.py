@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""product_units.py
+
+Pieces per pack and per carton of a product.
+
+The user-facing format is the unit_conversion string "1:<pack>:<carton>"
+(e.g. "1:3:24"). It is parsed once, when a product is saved, into the
+integer columns units_per_pack / units_per_carton of product_categories and
+stock (database migration v12); everything that sells or receives reads the
+integers, never the string.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class ProductUnits:
+    per_pack: int = 1
+    per_carton: int = 1
+
+    @classmethod
+    def parse(cls, unit_conversion: Optional[str]) -> "ProductUnits":
+        """"1:3:24" -> ProductUnits(3, 24); anything else ("1:1", "", junk) sells by the piece."""
+        try:
+            values = [int(v) for v in (unit_conversion or "").split(":")]
+        except ValueError:
+            return PIECE
+        if len(values) != 3 or min(values) <= 0:
+            return PIECE
+        return cls(values[1], values[2])
+
+    @property
+    def conversion(self) -> str:
+        """The unit_conversion string stored alongside the columns."""
+        return f"1:{self.per_pack}:{self.per_carton}"
+
+    def factor(self, unit_type: str) -> int:
+        """Pieces per ชิ้น / แพ็ค / ลัง."""
+        if unit_type == "แพ็ค":
+            return self.per_pack
+        if unit_type == "ลัง":
+            return self.per_carton
+        return 1
+
+
+PIECE = ProductUnits()
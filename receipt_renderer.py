@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+"""receipt_renderer.py
+
+Till receipts, rendered off the GUI thread.
+
+The expensive parts of a receipt never change between sales: parsing the four
+THSarabunNew TTF files, the paragraph styles, the table styles and the fixed
+header cells. They are built once per process (ReceiptTemplate, on first use
+or by ReceiptPrinter.warm() at window start-up), so a receipt only lays out
+its own lines.
+
+Two outputs:
+
+- PDF (80 x 120 mm page, 70 mm table), saved under receipts/ and opened in
+  the default viewer
+- raw ESC/POS bytes for a thermal printer, written to a device or file path
+  or sent to tcp://host:port (port 9100 by default); Thai is encoded as
+  CP874 after selecting the printer's Thai code page (ESCPOS_THAI_CODEPAGE)
+
+Set MIMISTOCK_RECEIPT_PRINTER to a printer target to print ESC/POS instead
+of saving PDFs.
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import socket
+import subprocess
+import sys
+import threading
+import unicodedata
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Sequence, Tuple
+
+from PyQt5 import sip
+from PyQt5.QtCore import QCoreApplication, QObject, pyqtSignal
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import mm, portrait
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Table, TableStyle
+
+import clock
+from paths import resource_path
+
+SHOP_NAME = "ร้านค้า Mimee_shop"
+RECEIPTS_DIR = "receipts"
+
+PAGE_SIZE = portrait((80 * mm, 120 * mm))
+LINE_COL_WIDTHS = [30 * mm, 10 * mm, 15 * mm, 15 * mm]  # 70 mm
+
+# ESC/POS: characters per line (Font A on 80 mm paper) and the `ESC t n`
+# code page holding TIS-620/CP874 (21 = "Thai 11" on Epson-compatible printers).
+ESCPOS_COLUMNS = 42
+ESCPOS_THAI_CODEPAGE = 21
+DEFAULT_PRINTER_PORT = 9100
+
+PRINTER_ENV = "MIMISTOCK_RECEIPT_PRINTER"
+
+
+@dataclass(frozen=True)
+class ReceiptLine:
+    product: str
+    quantity_text: str  # e.g. "3 แพ็ค"
+    unit_price: float  # per unit of quantity_text
+    total: float
+
+
+@dataclass(frozen=True)
+class Receipt:
+    lines: Tuple[ReceiptLine, ...]
+    printed_at: str  # clock.timestamp()
+    receipt_id: Optional[str] = None
+    payment: Optional[str] = None  # checkout.PAYMENT_TYPES
+
+    @property
+    def total(self) -> float:
+        return sum(line.total for line in self.lines)
+
+
+def receipt_from_cart(cart: Sequence, receipt_id: Optional[str] = None, payment: Optional[str] = None) -> Receipt:
+    """Snapshot of checkout.CartLine objects (safe to hand to another thread)."""
+    return Receipt(
+        tuple(ReceiptLine(line.product, line.quantity_text, line.unit_price, line.total) for line in cart),
+        clock.timestamp(),
+        receipt_id,
+        payment,
+    )
+
+
+def _money(value: float) -> str:
+    return f"{value:,.2f}"
+
+
+# ---- PDF ---------------------------------------------------------------
+
+
+def _register_fonts() -> str:
+    """Register THSarabunNew (+ bold/italic for <b>/<i> in Paragraphs); returns
+    the family name, Helvetica when the TTF files are missing."""
+    regular = resource_path("THSarabunNew.ttf")
+    if not regular.exists():
+        # without a Thai font the text comes out as boxes
+        return "Helvetica"
+
+    faces = {"normal": ("THSarabunNew", regular)}
+    for face, suffix in (("bold", "Bold"), ("italic", "Italic"), ("boldItalic", "BoldItalic")):
+        path = resource_path(f"THSarabunNew {suffix}.ttf")
+        if path.exists():
+            faces[face] = (f"THSarabunNew-{suffix}", path)
+    for name, path in faces.values():
+        pdfmetrics.registerFont(TTFont(name, str(path)))
+    # missing faces fall back to regular
+    pdfmetrics.registerFontFamily(
+        "THSarabunNew", **{face: faces.get(face, faces["normal"])[0] for face in ("normal", "bold", "italic", "boldItalic")}
+    )
+    return "THSarabunNew"
+
+
+class ReceiptTemplate:
+    """The 70 mm receipt layout with everything but the sale precompiled."""
+
+    def __init__(self):
+        self.font = _register_fonts()
+        self.style = ParagraphStyle("receipt", fontName=self.font, fontSize=14, leading=16)
+        self.center = ParagraphStyle("receipt-center", parent=self.style, alignment=1)
+
+        self.title = Paragraph("<b>ใบเสร็จรับเงิน</b>", self.center)
+        self.shop = Paragraph(f"<b>{SHOP_NAME}</b>", self.style)
+        self.line_header = [
+            Paragraph(f"<b>{text}</b>", self.style) for text in ("สินค้า", "จำนวน", "ราคาต่อหน่วย", "ราคารวม")
+        ]
+
+        self.shop_date_style = TableStyle([
+            ("ALIGN", (0, 0), (0, 0), "LEFT"),
+            ("ALIGN", (1, 0), (1, 0), "RIGHT"),
+        ])
+        self.lines_style = TableStyle([
+            ("TEXTCOLOR", (0, 0), (-1, -1), colors.black),
+            ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+            ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+            ("FONTNAME", (0, 0), (-1, -1), self.font),
+            ("FONTSIZE", (0, 0), (-1, -1), 14),
+            ("BOTTOMPADDING", (0, 0), (-1, -1), 2),
+            ("TOPPADDING", (0, 0), (-1, -1), 2),
+            ("GRID", (0, 0), (-1, -1), 1, colors.black),
+            ("BOX", (0, 0), (-1, -1), 1, colors.black),
+        ])
+
+    def document(self, target, title: str = "ใบเสร็จรับเงิน") -> SimpleDocTemplate:
+        """A receipt-sized document writing to `target` (path or file object)."""
+        return SimpleDocTemplate(
+            target,
+            pagesize=PAGE_SIZE,
+            leftMargin=1 * mm,
+            rightMargin=1 * mm,
+            topMargin=0,
+            bottomMargin=0,
+            title=title,
+            pageCompression=0,  # zlib over the embedded font subset was half the render time
+        )
+
+    def flowables(self, receipt: Receipt) -> list:
+        """One receipt's content, for render() or a multi-receipt document."""
+        shop_date = Table(
+            [[self.shop, Paragraph(f"<b>วันที่:</b> {receipt.printed_at}", self.style)]],
+            colWidths=[35 * mm, 45 * mm],
+            style=self.shop_date_style,
+        )
+        rows = [self.line_header]
+        for line in receipt.lines:
+            rows.append([
+                Paragraph(line.product, self.style),
+                Paragraph(line.quantity_text, self.style),
+                f"฿{_money(line.unit_price)}",
+                f"฿{_money(line.total)}",
+            ])
+        lines = Table(rows, colWidths=LINE_COL_WIDTHS, style=self.lines_style)
+        total = Paragraph(f"<b>รวมทั้งหมด:</b> ฿{_money(receipt.total)}", self.center)
+
+        content = [self.title, shop_date, lines, total]
+        if receipt.payment:
+            content.append(Paragraph(f"ชำระโดย: {receipt.payment}", self.center))
+        if receipt.receipt_id:
+            content.append(Paragraph(f"เลขที่: {receipt.receipt_id}", self.center))
+        return content
+
+    def render(self, receipt: Receipt) -> bytes:
+        buffer = io.BytesIO()
+        self.document(buffer).build(self.flowables(receipt))
+        return buffer.getvalue()
+
+
+_template: Optional[ReceiptTemplate] = None
+_template_lock = threading.Lock()
+
+
+def get_template() -> ReceiptTemplate:
+    """Shared template (fonts are registered on the first call)."""
+    global _template
+    with _template_lock:
+        if _template is None:
+            _template = ReceiptTemplate()
+        return _template
+
+
+def render_pdf(receipt: Receipt) -> bytes:
+    return get_template().render(receipt)
+
+
+def save_pdf(receipt: Receipt, directory: os.PathLike | str = RECEIPTS_DIR) -> Path:
+    """Render and write receipts/ใบเสร็จ_YYYY-MM-DD_HH-MM-SS.pdf; returns the path."""
+    data = render_pdf(receipt)
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    # no ':' in Windows file names
+    stamp = receipt.printed_at.replace(" ", "_").replace(":", "-")
+    path = directory / f"ใบเสร็จ_{stamp}.pdf"
+    n = 1
+    while path.exists():  # two receipts within the same second
+        n += 1
+        path = directory / f"ใบเสร็จ_{stamp}_{n}.pdf"
+    path.write_bytes(data)
+    return path
+
+
+def open_file(path: os.PathLike | str) -> None:
+    """Open with the default viewer without going through a shell."""
+    if sys.platform == "win32":
+        os.startfile(str(path))
+    elif sys.platform == "darwin":
+        subprocess.Popen(["open", str(path)])
+    else:
+        subprocess.Popen(["xdg-open", str(path)])
+
+
+# ---- ESC/POS -----------------------------------------------------------
+
+ESC = b"\x1b"
+GS = b"\x1d"
+_INIT = ESC + b"@"
+_ALIGN_LEFT, _ALIGN_CENTER = ESC + b"a\x00", ESC + b"a\x01"
+_BOLD_ON, _BOLD_OFF = ESC + b"E\x01", ESC + b"E\x00"
+_DOUBLE_ON, _DOUBLE_OFF = GS + b"!\x11", GS + b"!\x00"
+_FEED_AND_CUT = ESC + b"d\x04" + GS + b"V\x01"
+
+
+def _width(text: str) -> int:
+    """Printed columns: Thai vowel and tone marks sit above/below the base letter."""
+    return sum(1 for ch in text if unicodedata.category(ch) != "Mn")
+
+
+def _fit(text: str, width: int) -> str:
+    """Cut to at most `width` printed columns."""
+    out, used = [], 0
+    for ch in text:
+        if unicodedata.category(ch) != "Mn":
+            if used == width:
+                break
+            used += 1
+        out.append(ch)
+    return "".join(out)
+
+
+def _columns(left: str, right: str, width: int) -> str:
+    left = _fit(left, max(width - _width(right) - 1, 0))
+    return left + " " * (width - _width(left) - _width(right)) + right
+
+
+def render_escpos(receipt: Receipt, columns: int = ESCPOS_COLUMNS,
+                  codepage: int = ESCPOS_THAI_CODEPAGE) -> bytes:
+    """The receipt as ESC/POS commands (init, Thai code page, text, feed + cut)."""
+
+    def text(s: str) -> bytes:
+        return s.encode("cp874", errors="replace") + b"\n"
+
+    rule = text("-" * columns)
+    out = [_INIT, ESC + b"t" + bytes([codepage])]
+    out += [_ALIGN_CENTER, _BOLD_ON, _DOUBLE_ON, text("ใบเสร็จรับเงิน"), _DOUBLE_OFF, text(SHOP_NAME), _BOLD_OFF]
+    out += [_ALIGN_LEFT, text(_columns("วันที่:", receipt.printed_at, columns))]
+    if receipt.receipt_id:
+        out.append(text(_columns("เลขที่:", receipt.receipt_id, columns)))
+    out.append(rule)
+    for line in receipt.lines:
+        out.append(text(_fit(line.product, columns)))
+        out.append(text(_columns(f"  {line.quantity_text} x {_money(line.unit_price)}", _money(line.total), columns)))
+    out += [rule, _BOLD_ON, text(_columns("รวมทั้งหมด", f"฿{_money(receipt.total)}", columns)), _BOLD_OFF]
+    if receipt.payment:
+        out.append(text(_columns("ชำระโดย", receipt.payment, columns)))
+    out.append(_FEED_AND_CUT)
+    return b"".join(out)
+
+
+def send_to_printer(data: bytes, target: str) -> None:
+    """Write raw bytes to `target`: tcp://host[:port] for network printers,
+    otherwise a device or file path (/dev/usb/lp0, \\\\pc\\printer, out.bin)."""
+    if target.startswith("tcp://"):
+        host, _, port = target[len("tcp://"):].partition(":")
+        with socket.create_connection((host, int(port or DEFAULT_PRINTER_PORT)), timeout=10) as sock:
+            sock.sendall(data)
+        return
+    with open(target, "wb") as f:
+        f.write(data)
+
+
+def print_escpos(receipt: Receipt, target: str) -> str:
+    send_to_printer(render_escpos(receipt), target)
+    return target
+
+
+# ---- background worker -------------------------------------------------
+
+
+def _report_error(error: BaseException) -> None:
+    print(f"❌ พิมพ์ใบเสร็จไม่สำเร็จ: {error!r}")
+
+
+class ReceiptPrinter(QObject):
+    """Renders and prints receipts on one background thread; callbacks run on
+    the GUI thread.
+
+    `printer` is an ESC/POS target (see send_to_printer); without one,
+    receipts are saved as PDF and the result is the file path.
+    """
+
+    # callback, value (result or exception)
+    _finished = pyqtSignal(object, object)
+
+    def __init__(self, printer: Optional[str] = None, parent=None):
+        super().__init__(parent)
+        if printer is None:
+            printer = os.environ.get(PRINTER_ENV, "")
+        self.printer = printer.strip() or None
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="receipt")
+        self._finished.connect(self._deliver)
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.shutdown)
+
+    def warm(self) -> None:
+        """Load fonts and styles now, so the first receipt is as fast as the rest."""
+        if self.printer is None:
+            self._pool.submit(get_template)
+
+    def print_receipt(self, receipt: Receipt, on_result=None, on_error=None) -> Future:
+        if self.printer is None:
+            return self._submit(save_pdf, (receipt,), on_result, on_error)
+        return self._submit(print_escpos, (receipt, self.printer), on_result, on_error)
+
+    def submit(self, fn, *args, on_result=None, on_error=None) -> Future:
+        """Run other PDF work (e.g. reports.build_sales_report) on the same thread,
+        so reportlab's shared fonts are only ever used by one thread at a time."""
+        return self._submit(fn, args, on_result, on_error)
+
+    def _submit(self, fn, args, on_result, on_error) -> Future:
+        def task():
+            try:
+                result = fn(*args)
+            except Exception as e:
+                self._finished.emit(on_error or _report_error, e)
+                raise
+            if on_result is not None:
+                self._finished.emit(on_result, result)
+            return result
+
+        return self._pool.submit(task)
+
+    def _deliver(self, callback, value) -> None:
+        owner = getattr(callback, "__self__", None)
+        if isinstance(owner, QObject) and sip.isdeleted(owner):
+            return  # window closed while the receipt was rendering
+        callback(value)
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""reports.py
+
+Batch receipt reprints and the end-of-day (Z) report, as one PDF.
+
+The Z-report totals come from aggregates: per product and per day from
+sales_daily_summary (sales_ledger), per payment type from one GROUP BY over
+the idx_sales_date range. With receipts, the sales lines of the range are
+read by one range query on idx_sales_date, already in (date, id) order, so
+the lines of a receipt arrive together and the cursor is consumed as a
+stream into each receipt's flowables (receipt_renderer's cached fonts,
+styles and layout). The Z-report pages go in front and everything goes
+through a single doc.build.
+
+Runs off the GUI thread (ReceiptPrinter.submit), next to receipt printing.
+"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass, field
+from datetime import date
+from itertools import groupby
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from reportlab.lib.pagesizes import mm
+from reportlab.platypus import PageBreak, Paragraph, Table
+
+import clock
+from database import get_connection
+from receipt_renderer import Receipt, ReceiptLine, get_template
+from sales_ledger import daily_totals, product_totals
+
+DbPath = Optional[os.PathLike | str]
+
+REPORTS_DIR = "reports"
+UNKNOWN_PAYMENT = "ไม่ระบุ"  # sales recorded before sales.payment existed
+
+PRODUCT_COL_WIDTHS = [36 * mm, 14 * mm, 20 * mm]
+PAYMENT_COL_WIDTHS = [30 * mm, 15 * mm, 25 * mm]
+DAY_COL_WIDTHS = [30 * mm, 15 * mm, 25 * mm]
+
+
+@dataclass
+class SalesReport:
+    first: date
+    last: date
+    receipts: int = 0
+    lines: int = 0
+    revenue: float = 0.0
+    by_payment: List[Tuple[str, int, float]] = field(default_factory=list)  # (payment, receipts, revenue)
+    by_product: List[Tuple[str, int, float]] = field(default_factory=list)  # (product, units, revenue)
+    by_day: List[Tuple[str, int, float]] = field(default_factory=list)  # (day, units, revenue)
+    path: Optional[Path] = None
+
+
+def _range(first: date, last: date) -> Tuple[str, str]:
+    start, _ = clock.day_range(first)
+    _, end = clock.day_range(last)
+    return start, end
+
+
+def sales_totals(first: date, last: date, db_path: DbPath = None) -> SalesReport:
+    """Z-report totals of first..last inclusive, without reading line by line."""
+    report = SalesReport(first, last)
+    first_day, last_day = clock.day_str(first), clock.day_str(last)
+    report.by_product = product_totals(first_day, last_day, db_path)
+    report.by_day = daily_totals(first_day, last_day, db_path)
+
+    # lines saved without a receipt id (before receipts existed) count one receipt each
+    report.by_payment = get_connection(db_path).execute(
+        """
+        SELECT COALESCE(payment, ?), COUNT(DISTINCT COALESCE(receipt_id, '#' || id)),
+               SUM(total_price), COUNT(*)
+        FROM sales
+        WHERE date >= ? AND date < ?
+        GROUP BY 1
+        ORDER BY 3 DESC
+        """,
+        (UNKNOWN_PAYMENT, *_range(first, last)),
+    ).fetchall()
+    report.receipts = sum(receipts for _, receipts, _, _ in report.by_payment)
+    report.revenue = sum(revenue for _, _, revenue, _ in report.by_payment)
+    report.lines = sum(lines for *_, lines in report.by_payment)
+    report.by_payment = [(payment, receipts, revenue) for payment, receipts, revenue, _ in report.by_payment]
+    return report
+
+
+def iter_receipts(first: date, last: date, db_path: DbPath = None) -> Iterator[Receipt]:
+    """Receipts sold first..last inclusive, oldest first; lines saved without
+    a receipt id (before receipts existed) come out one receipt each."""
+    rows = get_connection(db_path).execute(
+        """
+        SELECT id, receipt_id, date, payment, product, quantity, unit_type, price_per_unit, total_price
+        FROM sales
+        WHERE date >= ? AND date < ?
+        ORDER BY date, id
+        """,
+        _range(first, last),
+    )
+    for _, group in groupby(rows, key=lambda row: row[1] or f"#{row[0]}"):
+        group = list(group)
+        _, receipt_id, sold_at, payment, *_ = group[0]
+        yield Receipt(
+            tuple(
+                ReceiptLine(product, f"{quantity} {unit_type or 'ชิ้น'}", price, total)
+                for *_, product, quantity, unit_type, price, total in group
+            ),
+            sold_at,
+            receipt_id,
+            payment,
+        )
+
+
+def _money(value: float) -> str:
+    return f"{value:,.2f}"
+
+
+def _z_report(report: SalesReport) -> list:
+    template = get_template()
+    style, center = template.style, template.center
+    period = clock.day_str(report.first)
+    if report.last != report.first:
+        period += f" ถึง {clock.day_str(report.last)}"
+
+    payments = [["ชำระโดย", "ใบเสร็จ", "ยอดเงิน"]] + [
+        [payment, f"{receipts:,}", _money(revenue)] for payment, receipts, revenue in report.by_payment
+    ]
+    products = [["สินค้า", "ชิ้น", "ยอดเงิน"]] + [
+        [Paragraph(product, style), f"{units:,}", _money(revenue)] for product, units, revenue in report.by_product
+    ]
+    flowables = [
+        Paragraph("<b>รายงานสรุปยอดขาย (Z-Report)</b>", center),
+        Paragraph(f"วันที่ขาย: {period}", style),
+        Paragraph(f"พิมพ์เมื่อ: {clock.timestamp()}", style),
+        Paragraph(f"ใบเสร็จ {report.receipts:,} ใบ | {report.lines:,} รายการ", style),
+        Paragraph(f"<b>ยอดขายรวม: ฿{_money(report.revenue)}</b>", style),
+        Table(payments, colWidths=PAYMENT_COL_WIDTHS, style=template.lines_style, repeatRows=1),
+    ]
+    if len(report.by_day) > 1:
+        days = [["วันที่", "ชิ้น", "ยอดเงิน"]] + [
+            [day, f"{units:,}", _money(revenue)] for day, units, revenue in report.by_day
+        ]
+        flowables += [
+            Paragraph("<b>ยอดขายรายวัน</b>", center),
+            Table(days, colWidths=DAY_COL_WIDTHS, style=template.lines_style, repeatRows=1),
+        ]
+    return flowables + [
+        Paragraph("<b>ยอดขายตามสินค้า</b>", center),
+        Table(products, colWidths=PRODUCT_COL_WIDTHS, style=template.lines_style, repeatRows=1),
+    ]
+
+
+def build_sales_report(first: date, last: date, include_receipts: bool = True,
+                       directory: os.PathLike | str = REPORTS_DIR, db_path: DbPath = None) -> SalesReport:
+    """Write reports/รายงานขาย_<first>_<last>_<time>.pdf: the Z-report, then
+    (include_receipts) every receipt of the period on its own page."""
+    template = get_template()
+    report = sales_totals(first, last, db_path)
+
+    story = _z_report(report)
+    if include_receipts:
+        for receipt in iter_receipts(first, last, db_path):
+            story.append(PageBreak())
+            story.extend(template.flowables(receipt))
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    stamp = clock.now().strftime("%H-%M-%S")  # a new file each run: the last one may still be open
+    report.path = directory / f"รายงานขาย_{clock.day_str(first)}_{clock.day_str(last)}_{stamp}.pdf"
+    template.document(str(report.path), title="รายงานยอดขาย").build(story)
+    return report
+
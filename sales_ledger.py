@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""sales_ledger.py
+
+Read side of the sales ledger written by checkout.commit_cart.
+
+Period queries go to `sales_daily_summary` (one row per day/product, kept in
+step by triggers on `sales`), so they are range scans over the summary's
+primary key / product index instead of aggregations over every line item.
+Dates are "YYYY-MM-DD" strings, both ends inclusive.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import List, Optional, Tuple
+
+from database import get_connection
+
+DbPath = Optional[os.PathLike | str]
+
+
+def daily_totals(date_from: str, date_to: str, db_path: DbPath = None) -> List[Tuple[str, int, float]]:
+    """[(sale_date, units, revenue)] per day."""
+    return get_connection(db_path).execute(
+        """
+        SELECT sale_date, SUM(units), SUM(revenue)
+        FROM sales_daily_summary
+        WHERE sale_date BETWEEN ? AND ?
+        GROUP BY sale_date
+        ORDER BY sale_date
+        """,
+        (date_from, date_to),
+    ).fetchall()
+
+
+def product_totals(date_from: str, date_to: str, db_path: DbPath = None) -> List[Tuple[str, int, float]]:
+    """[(product, units, revenue)] for the period, best sellers first."""
+    return get_connection(db_path).execute(
+        """
+        SELECT product, SUM(units), SUM(revenue)
+        FROM sales_daily_summary
+        WHERE sale_date BETWEEN ? AND ?
+        GROUP BY product
+        ORDER BY SUM(revenue) DESC
+        """,
+        (date_from, date_to),
+    ).fetchall()
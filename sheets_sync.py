@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""sheets_sync.py
+
+Google Sheet upstream for the order outbox (outbox.py).
+
+Every order keeps one fixed sheet row, recorded in `sheets_sync`. Each pushed
+batch is written with batched range updates:
+
+- new visible order        -> the lowest freed row, else the row below the last one
+- changed visible order    -> its own row, rewritten in place
+- hidden / deleted order   -> its row is blanked and freed (sheets_free_rows)
+
+Rows are recorded in `sheets_sync` before the sheet is written, so pushing
+the same batch twice (e.g. after a failed write) writes the same cells and a
+retried batch is harmless. Reusing freed rows keeps the sheet as long as the orders visible
+at once, not the whole history. The first push (no rows known yet) clears
+the sheet.
+
+The sheet itself is behind a small backend interface (reset + update_rows), so
+GspreadBackend can be swapped for MemorySheetsBackend in tests.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+from typing import Dict, List, Sequence
+
+from database import DbTarget, get_connection, transaction
+from outbox import Upstream
+
+CREDENTIALS_FILE = "gen-lang-client-0301147324-8f1c9d568355.json"
+SHEET_ID = "1T-wLeIpBrm75PfV7O7eOUJY5dxlUPp_AbCSMNuYyFZ4"
+SHEET_NAME = "ฐานข้อมูล"
+
+SHEET_COLUMNS = ("product", "shop", "price", "payment", "tracking", "status", "user_id", "password", "f2a")
+SHEET_HEADER = ["สินค้า", "ร้านค้า", "ราคา", "ชำระผ่าน", "เลขพัสดุ", "สถานะ", "ID", "รหัสผ่าน", "F2A"]
+
+# sheet row 1 is the header
+FIRST_DATA_ROW = 2
+
+_BLANK_ROW = [""] * len(SHEET_COLUMNS)
+
+
+class SheetsBackend:
+    """Where synced rows go. Rows are 1-based sheet rows (row 1 = header)."""
+
+    def reset(self, header: Sequence[str]) -> None:
+        """Clear the sheet and write the header row."""
+        raise NotImplementedError
+
+    def update_rows(self, rows: Dict[int, Sequence]) -> None:
+        """Overwrite whole rows: {sheet_row: values}."""
+        raise NotImplementedError
+
+
+def _column_letter(n: int) -> str:
+    letters = ""
+    while n:
+        n, rem = divmod(n - 1, 26)
+        letters = chr(ord("A") + rem) + letters
+    return letters
+
+
+def _row_ranges(rows: Dict[int, Sequence]) -> List[tuple]:
+    """Group {row: values} into runs of consecutive rows: [(first_row, [values, ...])]."""
+    runs: List[tuple] = []
+    for row in sorted(rows):
+        if runs and runs[-1][0] + len(runs[-1][1]) == row:
+            runs[-1][1].append(list(rows[row]))
+        else:
+            runs.append((row, [list(rows[row])]))
+    return runs
+
+
+class GspreadBackend(SheetsBackend):
+    """Google Sheets through gspread.
+
+    The authorized client and the worksheet are opened on first use and kept,
+    so only the first sync pays for the OAuth handshake (google-auth refreshes
+    the token by itself afterwards).
+    """
+
+    def __init__(self, credentials_file: str = CREDENTIALS_FILE, sheet_id: str = SHEET_ID,
+                 sheet_name: str = SHEET_NAME):
+        self._credentials_file = credentials_file
+        self._sheet_id = sheet_id
+        self._sheet_name = sheet_name
+        self._worksheet = None
+        self._row_count = 0
+        self._lock = threading.Lock()
+
+    def worksheet(self):
+        with self._lock:
+            if self._worksheet is None:
+                import gspread
+
+                print("🔄 เชื่อมต่อ Google Sheets...")  # ✅ Debug Log
+                client = gspread.service_account(filename=self._credentials_file)
+                self._worksheet = client.open_by_key(self._sheet_id).worksheet(self._sheet_name)
+                self._row_count = self._worksheet.row_count
+                print("✅ เชื่อมต่อ Google Sheets สำเร็จ!")  # ✅ Debug Log
+            return self._worksheet
+
+    def reset(self, header: Sequence[str]) -> None:
+        ws = self.worksheet()
+        ws.clear()
+        self.update_rows({1: header})
+
+    def update_rows(self, rows: Dict[int, Sequence]) -> None:
+        if not rows:
+            return
+        ws = self.worksheet()
+        last_row = max(rows)
+        if last_row > self._row_count:
+            # writes outside the grid are rejected, grow it first
+            ws.add_rows(last_row - self._row_count)
+            self._row_count = last_row
+        last_col = _column_letter(max(len(v) for v in rows.values()))
+        ws.batch_update(
+            [
+                {"range": f"A{first}:{last_col}{first + len(values) - 1}", "values": values}
+                for first, values in _row_ranges(rows)
+            ],
+            value_input_option="RAW",
+        )
+
+    def invalidate(self) -> None:
+        """Forget the cached client (e.g. after the credentials file changed)."""
+        with self._lock:
+            self._worksheet = None
+
+
+class MemorySheetsBackend(SheetsBackend):
+    """In-memory stand-in for a worksheet: `rows` maps sheet row -> values."""
+
+    def __init__(self):
+        self.rows: Dict[int, list] = {}
+        self.updates: List[Dict[int, list]] = []  # every update_rows() call, for tests
+
+    def reset(self, header: Sequence[str]) -> None:
+        self.rows = {1: list(header)}
+
+    def update_rows(self, rows: Dict[int, Sequence]) -> None:
+        self.updates.append({r: list(v) for r, v in rows.items()})
+        for row, values in rows.items():
+            self.rows[row] = list(values)
+
+    def data_rows(self) -> List[list]:
+        """Non-blank rows below the header, top to bottom."""
+        return [self.rows[r] for r in sorted(self.rows) if r > 1 and any(v != "" for v in self.rows[r])]
+
+
+def _cell(value):
+    return "" if value is None else value
+
+
+class SheetsUpstream(Upstream):
+    """Outbox upstream that keeps the visible orders on a Google Sheet."""
+
+    def __init__(self, backend: SheetsBackend, db_path: DbTarget = None):
+        self.backend = backend
+        self.db_path = db_path
+
+    def push(self, upserts: List[dict], deletes: List[int]) -> None:
+        visible = [r for r in upserts if not r["hidden"]]
+        gone = list(deletes) + [r["id"] for r in upserts if r["hidden"]]
+
+        if get_connection(self.db_path).execute(
+            "SELECT NOT EXISTS (SELECT 1 FROM sheets_sync) AND NOT EXISTS (SELECT 1 FROM sheets_free_rows)"
+        ).fetchone()[0]:
+            self.backend.reset(SHEET_HEADER)  # first push: drop whatever the sheet held before
+
+        # Rows are recorded before the sheet is written: if the write (or
+        # anything after it) fails, the retried batch finds every order on the
+        # row it was given and rewrites the same cells instead of appending.
+        with transaction(self.db_path, immediate=True) as tx:
+            ids = json.dumps([r["id"] for r in visible] + gone)
+            assigned = dict(
+                tx.execute(
+                    "SELECT order_id, sheet_row FROM sheets_sync WHERE order_id IN (SELECT value FROM json_each(?))",
+                    (ids,),
+                )
+            )
+            last_row = tx.execute(
+                "SELECT MAX(r) FROM (SELECT MAX(sheet_row) AS r FROM sheets_sync "
+                "UNION ALL SELECT MAX(sheet_row) FROM sheets_free_rows)"
+            ).fetchone()[0] or FIRST_DATA_ROW - 1
+
+            new_ids = [r["id"] for r in visible if r["id"] not in assigned]
+            # rows of gone orders go straight to new orders, then the lowest free rows,
+            # then below the last row
+            handed_over = {assigned[i]: i for i in gone if i in assigned}
+            free = sorted(handed_over)[:len(new_ids)]
+            reused = [r for (r,) in tx.execute(
+                "SELECT sheet_row FROM sheets_free_rows ORDER BY sheet_row LIMIT ?", (len(new_ids) - len(free),)
+            )]
+            free = sorted(free + reused)
+            while len(free) < len(new_ids):
+                last_row += 1
+                free.append(last_row)
+            new_rows = list(zip(new_ids, free))
+
+            tx.executemany("DELETE FROM sheets_sync WHERE order_id = ?",
+                           [(handed_over[r],) for r in free if r in handed_over])
+            tx.executemany("DELETE FROM sheets_free_rows WHERE sheet_row = ?", [(r,) for r in reused])
+            tx.executemany("INSERT INTO sheets_sync (order_id, sheet_row) VALUES (?, ?)", new_rows)
+
+        assigned.update(new_rows)
+        # gone orders whose row nobody took: blank it, then free it
+        blanked = {assigned[i]: i for i in gone if i in assigned and assigned[i] not in free}
+
+        updates: Dict[int, Sequence] = {row: _BLANK_ROW for row in blanked}
+        for record in visible:
+            updates[assigned[record["id"]]] = [_cell(record[c]) for c in SHEET_COLUMNS]
+        self.backend.update_rows(updates)
+
+        if blanked:
+            with transaction(self.db_path, immediate=True) as tx:
+                tx.executemany("DELETE FROM sheets_sync WHERE order_id = ?", [(i,) for i in blanked.values()])
+                tx.executemany("INSERT OR IGNORE INTO sheets_free_rows (sheet_row) VALUES (?)",
+                               [(r,) for r in blanked])
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""stock_ledger.py
+
+Why stock.quantity changed: the append-only `stock_movements` table and the
+end-of-day `stock_snapshots` (database migration v11).
+
+Every path that changes stock.quantity writes its movements in the same
+transaction, as signed pieces:
+
+- receipt     delivered orders added to stock (source 'order', order id)
+- sale        checkout deductions (source 'receipt', receipt id)
+- adjustment  anything else: opening balances, manual corrections, new
+              products created with 0 pieces
+
+A snapshot is a product's quantity at the end of a (Bangkok) day. The
+quantity on any day is then the latest snapshot up to that day plus the sum
+of the movements after it, both read from indexes; take_snapshot() only
+needs the previous snapshot and one day range of movements, so nothing here
+replays the whole history.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from datetime import date, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from clock import day_range, day_str, timestamp, today
+from database import transaction
+
+RECEIPT = "receipt"
+SALE = "sale"
+ADJUSTMENT = "adjustment"
+
+# (product, stock_id, kind, qty, source_type, source_id)
+Movement = Tuple[str, Optional[int], str, int, Optional[str], Optional[str]]
+
+
+def record_movements(conn: sqlite3.Connection, movements: Iterable[Movement],
+                     moved_at: Optional[str] = None) -> None:
+    """Append movements in one executemany; call inside the transaction that
+    changes stock.quantity."""
+    moved_at = moved_at or timestamp()
+    conn.executemany(
+        """
+        INSERT INTO stock_movements (product, stock_id, kind, qty, source_type, source_id, moved_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        [(*m, moved_at) for m in movements],
+    )
+
+
+def adjust_stock(conn: sqlite3.Connection, product: str, quantity: int,
+                 source_type: str = "manual", source_id: Optional[str] = None) -> int:
+    """Set a product's on-hand quantity (e.g. after a count) and record the
+    difference as an adjustment. Returns the difference."""
+    with transaction(conn, immediate=True) as tx:
+        row = tx.execute("SELECT id, COALESCE(quantity, 0) FROM stock WHERE product = ?", (product,)).fetchone()
+        if row is None:
+            raise KeyError(product)
+        stock_id, on_hand = row
+        delta = quantity - on_hand
+        if delta:
+            tx.execute("UPDATE stock SET quantity = ? WHERE id = ?", (quantity, stock_id))
+            record_movements(tx, [(product, stock_id, ADJUSTMENT, delta, source_type, source_id)])
+    return delta
+
+
+def take_snapshot(conn: sqlite3.Connection, day: Optional[date] = None) -> int:
+    """Store every product's quantity at the end of `day` (default: yesterday).
+
+    Built from each product's previous snapshot plus that product's movements
+    since, so the cost grows with the products and the days since the last
+    snapshot, not with the history. Returns the number of products stored.
+    """
+    day = day or today() - timedelta(days=1)
+    _, end = day_range(day)
+    with transaction(conn, immediate=True) as tx:
+        prev = tx.execute(
+            "SELECT MAX(snapshot_date) FROM stock_snapshots WHERE snapshot_date < ?", (day_str(day),)
+        ).fetchone()[0]
+        start = day_str(date.fromisoformat(prev) + timedelta(days=1)) if prev else ""
+        return tx.execute(
+            """
+            INSERT OR REPLACE INTO stock_snapshots (product, snapshot_date, quantity)
+            SELECT p.product, :day,
+                   COALESCE((SELECT quantity FROM stock_snapshots s
+                             WHERE s.product = p.product AND s.snapshot_date = :prev), 0)
+                   + COALESCE((SELECT SUM(qty) FROM stock_movements m
+                               WHERE m.product = p.product AND m.moved_at >= :start AND m.moved_at < :end), 0)
+            FROM (
+                SELECT product FROM stock
+                UNION SELECT product FROM stock_snapshots WHERE snapshot_date = :prev
+            ) p
+            """,
+            {"day": day_str(day), "prev": prev, "start": start, "end": end},
+        ).rowcount
+
+
+def snapshot_due(conn: sqlite3.Connection) -> bool:
+    """True when yesterday has no snapshot yet."""
+    yesterday = day_str(today() - timedelta(days=1))
+    return conn.execute(
+        "SELECT NOT EXISTS (SELECT 1 FROM stock_snapshots WHERE snapshot_date >= ?)", (yesterday,)
+    ).fetchone()[0] == 1
+
+
+def take_due_snapshot(conn: sqlite3.Connection) -> int:
+    """take_snapshot() of yesterday unless it exists; 0 when nothing was due."""
+    return take_snapshot(conn) if snapshot_due(conn) else 0
+
+
+def _base(conn: sqlite3.Connection, product: str, day: date) -> Tuple[int, str]:
+    """(quantity of the latest snapshot up to `day`, where its movements stop)."""
+    row = conn.execute(
+        """
+        SELECT snapshot_date, quantity FROM stock_snapshots
+        WHERE product = ? AND snapshot_date <= ?
+        ORDER BY snapshot_date DESC LIMIT 1
+        """,
+        (product, day_str(day)),
+    ).fetchone()
+    if row is None:
+        return 0, ""
+    return row[1], day_str(date.fromisoformat(row[0]) + timedelta(days=1))
+
+
+def quantity_on(conn: sqlite3.Connection, product: str, day: date) -> int:
+    """Quantity of `product` at the end of `day`."""
+    base, start = _base(conn, product, day)
+    _, end = day_range(day)
+    moved = conn.execute(
+        "SELECT COALESCE(SUM(qty), 0) FROM stock_movements WHERE product = ? AND moved_at >= ? AND moved_at < ?",
+        (product, start, end),
+    ).fetchone()[0]
+    return base + moved
+
+
+def movements_for(conn: sqlite3.Connection, product: str, first: date, last: date) -> List[tuple]:
+    """[(moved_at, kind, qty, balance, source_type, source_id)] of first..last
+    inclusive, newest first; balance is the quantity after each movement."""
+    start, _ = day_range(first)
+    _, end = day_range(last)
+    rows = conn.execute(
+        """
+        SELECT moved_at, kind, qty, source_type, source_id FROM stock_movements
+        WHERE product = ? AND moved_at >= ? AND moved_at < ?
+        ORDER BY moved_at, id
+        """,
+        (product, start, end),
+    ).fetchall()
+    balance = quantity_on(conn, product, first - timedelta(days=1))
+    out = []
+    for moved_at, kind, qty, source_type, source_id in rows:
+        balance += qty
+        out.append((moved_at, kind, qty, balance, source_type, source_id))
+    out.reverse()
+    return out
+
+
+def audit_stock(conn: sqlite3.Connection) -> List[Tuple[str, int, int]]:
+    """[(product, stock.quantity, ledger quantity)] for products whose on-hand
+    quantity does not match their latest snapshot plus the movements since."""
+    return conn.execute(
+        """
+        SELECT product, on_hand, ledger FROM (
+            SELECT st.product, COALESCE(st.quantity, 0) AS on_hand,
+                   COALESCE(sn.quantity, 0) + COALESCE((
+                       SELECT SUM(m.qty) FROM stock_movements m
+                       WHERE m.product = st.product
+                       AND m.moved_at >= COALESCE(date(sn.snapshot_date, '+1 day'), '')
+                   ), 0) AS ledger
+            FROM stock st
+            LEFT JOIN stock_snapshots sn ON sn.product = st.product AND sn.snapshot_date = (
+                SELECT MAX(snapshot_date) FROM stock_snapshots WHERE product = st.product
+            )
+        )
+        WHERE on_hand != ledger
+        ORDER BY product
+        """
+    ).fetchall()
@@ -0,0 +1,281 @@
+"""table_models.py
+
+Shared model/view grid layer for the orders / stock tables.
+
+Rows live in a compact list of tuples (one tuple per row, one slot per column)
+and cells are formatted lazily in `data()`, so Qt only materializes what the
+viewport actually paints. Refreshes diff against the stored tuples and emit
+`dataChanged` only for the ranges that really changed.
+"""
+
+from __future__ import annotations
+
+from typing import Callable, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt, pyqtSignal
+
+KEY_ROLE = Qt.UserRole  # row key (e.g. orders.id) for any cell in the row
+
+# formatter(value, column) -> display text
+CellFormatter = Callable[[object, int], str]
+# styler(row, column) -> (background, foreground) QColor pair, or None
+CellStyler = Callable[[tuple, int], Optional[tuple]]
+
+
+def default_formatter(value: object, column: int) -> str:
+    return "" if value is None else str(value)
+
+
+def _ranges(indexes: Iterable[int]) -> List[Tuple[int, int]]:
+    """Collapse sorted row indexes into inclusive (first, last) runs."""
+    runs: List[Tuple[int, int]] = []
+    for i in indexes:
+        if runs and runs[-1][1] == i - 1:
+            runs[-1] = (runs[-1][0], i)
+        else:
+            runs.append((i, i))
+    return runs
+
+
+class RowTableModel(QAbstractTableModel):
+    """Tuple-backed table model keyed by a hashable row key."""
+
+    # key, column, new text (emitted after an in-grid edit)
+    cellEdited = pyqtSignal(object, int, str)
+
+    def __init__(
+        self,
+        headers: Sequence[str],
+        formatter: CellFormatter = default_formatter,
+        styler: Optional[CellStyler] = None,
+        editable_columns: Iterable[int] = (),
+        parent=None,
+    ):
+        super().__init__(parent)
+        self._headers = list(headers)
+        self._formatter = formatter
+        self._styler = styler
+        self._editable = frozenset(editable_columns)
+        self._rows: List[tuple] = []
+        self._keys: List[Hashable] = []
+        self._row_of: dict = {}
+
+    # ---- Qt model API -------------------------------------------------
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal and section < len(self._headers):
+            return self._headers[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self._rows[index.row()]
+        column = index.column()
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return self._formatter(row[column], column)
+        if role == KEY_ROLE:
+            return self._keys[index.row()]
+        if self._styler is not None and role in (Qt.BackgroundRole, Qt.ForegroundRole):
+            colors = self._styler(row, column)
+            if colors:
+                return colors[0] if role == Qt.BackgroundRole else colors[1]
+        return None
+
+    def flags(self, index):
+        flags = super().flags(index)
+        if index.isValid() and index.column() in self._editable:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.EditRole or not index.isValid() or index.column() not in self._editable:
+            return False
+        text = str(value)
+        r, column = index.row(), index.column()
+        row = list(self._rows[r])
+        if self._formatter(row[column], column) == text:
+            return False
+        row[column] = text
+        self._rows[r] = tuple(row)
+        self.dataChanged.emit(index, index)
+        self.cellEdited.emit(self._keys[r], column, text)
+        return True
+
+    # ---- row store ----------------------------------------------------
+
+    def row(self, r: int) -> tuple:
+        return self._rows[r]
+
+    def key(self, r: int) -> Hashable:
+        return self._keys[r]
+
+    def row_for_key(self, key: Hashable) -> Optional[int]:
+        return self._row_of.get(key)
+
+    def rows(self) -> List[tuple]:
+        return list(self._rows)
+
+    def set_rows(self, rows: Sequence[tuple], keys: Optional[Sequence[Hashable]] = None) -> None:
+        """Replace the content. Same keys in the same order -> diff in place."""
+        rows = [tuple(r) for r in rows]
+        keys = list(keys) if keys is not None else list(range(len(rows)))
+
+        if keys != self._keys:
+            self.beginResetModel()
+            self._rows = rows
+            self._keys = keys
+            self._reindex()
+            self.endResetModel()
+            return
+
+        changed = [i for i, (old, new) in enumerate(zip(self._rows, rows)) if old != new]
+        self._rows = rows
+        self._emit_changed(changed)
+
+    def upsert_rows(self, items: Iterable[Tuple[Hashable, tuple]], insert_at: int = 0) -> None:
+        """Update rows whose key exists, insert the rest (in order) at `insert_at`."""
+        changed: List[int] = []
+        new_keys: List[Hashable] = []
+        new_rows: List[tuple] = []
+        for key, row in items:
+            row = tuple(row)
+            r = self._row_of.get(key)
+            if r is None:
+                new_keys.append(key)
+                new_rows.append(row)
+            elif self._rows[r] != row:
+                self._rows[r] = row
+                changed.append(r)
+        self._emit_changed(sorted(changed))
+
+        if new_rows:
+            insert_at = max(0, min(insert_at, len(self._rows)))
+            self.beginInsertRows(QModelIndex(), insert_at, insert_at + len(new_rows) - 1)
+            self._rows[insert_at:insert_at] = new_rows
+            self._keys[insert_at:insert_at] = new_keys
+            self._reindex()
+            self.endInsertRows()
+
+    def append_rows(self, rows: Sequence[tuple], keys: Sequence[Hashable]) -> None:
+        self.upsert_rows(zip(keys, rows), insert_at=len(self._rows))
+
+    def remove_keys(self, keys: Iterable[Hashable]) -> None:
+        doomed = sorted({self._row_of[k] for k in keys if k in self._row_of})
+        if not doomed:
+            return
+        for first, last in reversed(_ranges(doomed)):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self._rows[first:last + 1]
+            del self._keys[first:last + 1]
+            self.endRemoveRows()
+        self._reindex()
+
+    def clear(self) -> None:
+        self.set_rows([], [])
+
+    # ---- helpers ------------------------------------------------------
+
+    def _reindex(self) -> None:
+        self._row_of = {k: i for i, k in enumerate(self._keys)}
+
+    def _emit_changed(self, changed_rows: Sequence[int]) -> None:
+        last_col = len(self._headers) - 1
+        for first, last in _ranges(changed_rows):
+            self.dataChanged.emit(self.index(first, 0), self.index(last, last_col))
+
+
+# Page = [(key, row), ...] in display order.
+# request_page(after, limit, on_page, on_error) fetches the rows after `after`
+# (the last loaded (key, row), or None for the first page) off the GUI thread
+# and calls on_page((after, page)) with the very `after` object it was given,
+# or on_error(exception).
+Page = List[Tuple[Hashable, tuple]]
+PageRequester = Callable[[Optional[Tuple[Hashable, tuple]], int, Callable, Callable], None]
+
+
+class PagedRowTableModel(RowTableModel):
+    """RowTableModel that loads its rows a page at a time.
+
+    Views pull further pages through canFetchMore()/fetchMore() as the user
+    scrolls, so the first paint costs one page regardless of table size.
+    fetchMore() only sends the request; the page is appended when it comes
+    back, so no query runs on the GUI thread. The requester is expected to
+    use keyset pagination (continue after the last loaded row), not OFFSET.
+
+    The first page comes from load_first_page() (the owner fetches it, e.g.
+    together with a change-tracking seq). set_rows() shows a fixed result set
+    (e.g. search results) and turns paging off until the next first page.
+
+    Sorting the loaded rows client-side is only meaningful once every row is
+    loaded; `completeChanged(bool)` fires when has_more() flips, so views can
+    turn header sorting off while more pages may follow.
+    """
+
+    # True when every row is loaded (not has_more())
+    completeChanged = pyqtSignal(bool)
+
+    def __init__(self, headers: Sequence[str], request_page: PageRequester, page_size: int = 200, **kwargs):
+        super().__init__(headers, **kwargs)
+        self._request_page = request_page
+        self.page_size = page_size
+        self._paging = False
+        self._exhausted = True
+        self._pending_after = None  # `after` of the page request in flight
+
+    def reload_limit(self) -> int:
+        """Rows a reload fetches: at least as many as are loaded now."""
+        return max(self.page_size, len(self._rows)) if self._paging else self.page_size
+
+    def load_first_page(self, items: Page, limit: int) -> None:
+        """Show the first `limit` rows fetched elsewhere (e.g. on a DbExecutor
+        thread) and resume paging; a page request still in flight is dropped."""
+        self._pending_after = None
+        super().set_rows([row for _, row in items], [key for key, _ in items])
+        self._set_paging(True, len(items) < limit)
+
+    def set_rows(self, rows: Sequence[tuple], keys: Optional[Sequence[Hashable]] = None) -> None:
+        self._pending_after = None
+        super().set_rows(rows, keys)
+        self._set_paging(False, True)
+
+    def _set_paging(self, paging: bool, exhausted: bool) -> None:
+        had_more = self.has_more()
+        self._paging, self._exhausted = paging, exhausted
+        if self.has_more() != had_more:
+            self.completeChanged.emit(not self.has_more())
+
+    def last_loaded(self) -> Optional[Tuple[Hashable, tuple]]:
+        return (self._keys[-1], self._rows[-1]) if self._rows else None
+
+    def has_more(self) -> bool:
+        """True while rows past the loaded window may exist in the DB."""
+        return self._paging and not self._exhausted
+
+    def canFetchMore(self, parent=QModelIndex()) -> bool:
+        return not parent.isValid() and self.has_more() and self._pending_after is None
+
+    def fetchMore(self, parent=QModelIndex()) -> None:
+        if not self.canFetchMore(parent):
+            return
+        self._pending_after = self.last_loaded()
+        self._request_page(self._pending_after, self.page_size, self.page_loaded, self.page_failed)
+
+    def page_loaded(self, result: Tuple[Optional[Tuple[Hashable, tuple]], Page]) -> None:
+        after, items = result
+        if after is None or after is not self._pending_after:
+            return  # reloaded / replaced by search results meanwhile
+        self._pending_after = None
+        # a row patched in meanwhile may already be loaded; upsert skips it
+        self.upsert_rows(items, insert_at=len(self._rows))
+        self._set_paging(True, len(items) < self.page_size)
+
+    def page_failed(self, error: BaseException) -> None:
+        self._pending_after = None  # the next scroll asks again
+        print(f"❌ โหลดหน้าถัดไปไม่สำเร็จ: {error!r}")
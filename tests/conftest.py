@@ -0,0 +1,19 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# the app modules live flat in the repo root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import database  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """A freshly migrated DB, also used as the app's default DB."""
+    path = tmp_path / "test.db"
+    monkeypatch.setattr(database, "get_db_path", lambda: path)
+    database.init_db(path)
+    yield path
+    database.close_connections()
@@ -0,0 +1,115 @@
+"""Outbox drain, retry and back-off, against JsonFileUpstream."""
+
+import pytest
+from PyQt5.QtCore import QCoreApplication
+
+from database import get_connection, transaction
+from outbox import (
+    RETRY_BASE_MS, RETRY_MAX_MS, JsonFileUpstream, _OutboxWorker, drain_batch, pending_count,
+    retry_delay_ms,
+)
+
+
+class FlakyUpstream(JsonFileUpstream):
+    """Fails the next `fail` pushes."""
+
+    def __init__(self, path, fail: int = 0):
+        super().__init__(path)
+        self.fail = fail
+
+    def push(self, upserts, deletes):
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionError("upstream down")
+        super().push(upserts, deletes)
+
+
+def add_orders(db_path, n: int) -> None:
+    with transaction(db_path) as tx:
+        tx.executemany(
+            "INSERT INTO orders (product, shop, price, payment) VALUES (?, 'shop', 10, 'โอน')",
+            [(f"p{i}",) for i in range(n)],
+        )
+
+
+@pytest.fixture
+def conn(db_path):
+    return get_connection(db_path)
+
+
+@pytest.fixture
+def upstream(tmp_path):
+    return FlakyUpstream(tmp_path / "orders.json")
+
+
+def test_drain_pushes_current_state_in_batches(conn, db_path, upstream):
+    add_orders(db_path, 3)
+    with transaction(db_path) as tx:
+        tx.execute("UPDATE orders SET status = 'จัดส่งแล้ว' WHERE id = 1")
+        tx.execute("DELETE FROM orders WHERE id = 3")
+    assert pending_count(conn) == 5
+
+    assert drain_batch(conn, upstream, batch_rows=2) == 2
+    assert set(upstream.load()) == {"1", "2"}
+    assert drain_batch(conn, upstream, batch_rows=2) == 2
+    assert drain_batch(conn, upstream, batch_rows=2) == 1
+    assert drain_batch(conn, upstream, batch_rows=2) == 0
+
+    orders = upstream.load()
+    assert set(orders) == {"1", "2"}  # order 3 was pushed, then deleted
+    assert orders["1"]["status"] == "จัดส่งแล้ว"
+    assert pending_count(conn) == 0
+
+
+def test_failed_push_keeps_entries(conn, db_path, upstream):
+    add_orders(db_path, 2)
+    upstream.fail = 1
+
+    with pytest.raises(ConnectionError):
+        drain_batch(conn, upstream)
+    assert pending_count(conn) == 2
+    assert upstream.load() == {}
+
+    assert drain_batch(conn, upstream) == 2
+    assert set(upstream.load()) == {"1", "2"}
+
+
+def test_retry_delay_doubles_up_to_max():
+    assert [retry_delay_ms(n) for n in (1, 2, 3)] == [RETRY_BASE_MS, 2 * RETRY_BASE_MS, 4 * RETRY_BASE_MS]
+    assert retry_delay_ms(50) == RETRY_MAX_MS
+
+
+@pytest.fixture(scope="module")
+def qapp():
+    # QTimer needs an application object (no event loop is run)
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def worker(qapp, db_path, upstream):
+    worker = _OutboxWorker(upstream, interval_ms=30_000, batch_rows=500)
+    statuses = []
+    worker.status.connect(statuses.append)
+    worker.start()  # creates the timer; run() is called by hand below
+    worker.statuses = statuses
+    yield worker
+    worker._timer.stop()
+
+
+def test_worker_backs_off_then_recovers(worker, db_path, upstream):
+    add_orders(db_path, 3)
+    upstream.fail = 2
+
+    worker.run()
+    worker.run()
+    assert [(s.state, s.retry_in_ms, s.pending) for s in worker.statuses] == [
+        ("retrying", RETRY_BASE_MS, 3),
+        ("retrying", 2 * RETRY_BASE_MS, 3),
+    ]
+    assert worker._timer.interval() == 2 * RETRY_BASE_MS
+
+    worker.run()
+    last = worker.statuses[-1]
+    assert (last.state, last.pending, last.pushed) == ("idle", 0, 3)
+    assert worker._timer.interval() == 30_000
+    assert set(upstream.load()) == {"1", "2", "3"}
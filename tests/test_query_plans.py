@@ -0,0 +1,117 @@
+"""EXPLAIN QUERY PLAN regression test for the hot queries.
+
+Every query below runs on a timer, per scan or per keystroke. Each must be
+answered from an index on a freshly migrated DB: no plain `SCAN <table>`,
+and no temp b-tree to sort for ORDER BY.
+"""
+
+import sqlite3
+
+import pytest
+
+from database import close_connections, get_connection, init_db
+
+# name -> (sql, params)
+HOT_QUERIES = {
+    "tracking lookup": ("SELECT status, payment, price FROM orders WHERE tracking = ?", ("x",)),
+    "visible orders": (
+        "SELECT id, product FROM orders WHERE hidden = 0 ORDER BY date_recorded DESC, id DESC LIMIT 200",
+        (),
+    ),
+    "visible orders next page": (
+        "SELECT id, product FROM orders WHERE hidden = 0 AND (date_recorded, id) < (?, ?) "
+        "ORDER BY date_recorded DESC, id DESC LIMIT 200",
+        ("2000-01-01 00:00:00", 1),
+    ),
+    "status summary": (
+        "SELECT status, n FROM order_status_counts WHERE status IN (?, ?, ?)",
+        ("รอจัดส่ง", "อยู่ระหว่างการจัดส่ง", "จัดส่งพัสดุสำเร็จ"),
+    ),
+    "daily COD": ("SELECT SUM(total) FROM cod_ledger WHERE day = ?", ("2000-01-01",)),
+    "COD by courier": (
+        "SELECT courier, SUM(total), SUM(orders) FROM cod_ledger WHERE day BETWEEN ? AND ? GROUP BY courier",
+        ("2000-01-01", "2000-01-31"),
+    ),
+    "COD reset": (
+        "SELECT id FROM orders WHERE status = 'จัดส่งพัสดุสำเร็จ' AND payment = 'COD' "
+        "AND date_recorded >= ? AND date_recorded < ?",
+        ("2000-01-01", "2000-01-02"),
+    ),
+    "catalog version": ("SELECT version FROM catalog_version WHERE id = 1", ()),
+    "stock by product": ("SELECT quantity FROM stock WHERE product = ?", ("x",)),
+    "barcode scan": (
+        "SELECT product FROM stock WHERE barcode = ? "
+        "UNION SELECT product_name FROM product_categories WHERE barcode = ?",
+        ("x", "x"),
+    ),
+    "order by id": ("SELECT status FROM orders WHERE id = ?", (1,)),
+    "stock receiving": (
+        "SELECT product, SUM(unit_per_item) FROM orders WHERE status = 'จัดส่งพัสดุสำเร็จ' "
+        "AND processed = 0 AND tracking IS NOT NULL GROUP BY product",
+        (),
+    ),
+    "status aging": (
+        "SELECT id FROM orders WHERE status != 'จัดส่งพัสดุสำเร็จ' AND date_recorded <= ?",
+        ("2000-01-01 00:00:00",),
+    ),
+    "stock snapshot lookup": (
+        "SELECT snapshot_date, quantity FROM stock_snapshots WHERE product = ? AND snapshot_date <= ? "
+        "ORDER BY snapshot_date DESC LIMIT 1",
+        ("x", "2000-01-01"),
+    ),
+    "sales by payment": (
+        "SELECT payment, COUNT(*), SUM(total_price) FROM sales WHERE date >= ? AND date < ? GROUP BY payment",
+        ("2000-01-01", "2000-01-02"),
+    ),
+    "sales summary by product": (
+        "SELECT product, SUM(units), SUM(revenue) FROM sales_daily_summary "
+        "WHERE sale_date BETWEEN ? AND ? GROUP BY product",
+        ("2000-01-01", "2000-01-31"),
+    ),
+    "sales report": (
+        "SELECT id, receipt_id, date FROM sales WHERE date >= ? AND date < ? ORDER BY date, id",
+        ("2000-01-01", "2000-01-02"),
+    ),
+    "stock snapshot due": (
+        "SELECT 1 FROM stock_snapshots WHERE snapshot_date >= ?",
+        ("2000-01-01",),
+    ),
+    "stock movement range": (
+        "SELECT SUM(qty) FROM stock_movements WHERE product = ? AND moved_at >= ? AND moved_at < ?",
+        ("x", "2000-01-01", "2000-01-02"),
+    ),
+    "stock movements of product": (
+        "SELECT id, kind, qty FROM stock_movements WHERE product = ? AND moved_at >= ? "
+        "ORDER BY moved_at DESC LIMIT 200",
+        ("x", "2000-01-01"),
+    ),
+}
+
+
+@pytest.fixture(scope="module")
+def conn(tmp_path_factory):
+    path = tmp_path_factory.mktemp("db") / "plans.db"
+    init_db(path)
+    yield get_connection(path)
+    close_connections()
+
+
+def _plan(conn: sqlite3.Connection, sql: str, params) -> list:
+    return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def test_migrated_to_latest(conn):
+    from database import SCHEMA_VERSION
+
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+
+
+@pytest.mark.parametrize("name", HOT_QUERIES)
+def test_hot_query_uses_index(conn, name):
+    sql, params = HOT_QUERIES[name]
+    plan = _plan(conn, sql, params)
+    # e.g. "SCAN orders" (a full table scan) vs "SCAN orders USING INDEX ..."
+    full_scans = [step for step in plan if step.startswith("SCAN") and "INDEX" not in step]
+    assert not full_scans, plan
+    assert not any("TEMP B-TREE FOR ORDER BY" in step for step in plan), plan
+
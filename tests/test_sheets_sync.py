@@ -0,0 +1,143 @@
+"""SheetsUpstream row bookkeeping, against MemorySheetsBackend."""
+
+import pytest
+
+from database import get_connection
+from sheets_sync import FIRST_DATA_ROW, SHEET_HEADER, MemorySheetsBackend, SheetsUpstream
+
+
+class FailingBackend(MemorySheetsBackend):
+    """Fails the next `fail` update_rows() calls, before writing anything or
+    (`after_write`) once the rows are written, like a timed-out request."""
+
+    def __init__(self, fail: int = 0, after_write: bool = False):
+        super().__init__()
+        self.fail = fail
+        self.after_write = after_write
+
+    def update_rows(self, rows):
+        if self.fail and not self.after_write:
+            self.fail -= 1
+            raise ConnectionError("sheet unreachable")
+        super().update_rows(rows)
+        if self.fail:
+            self.fail -= 1
+            raise TimeoutError("no reply")
+
+
+def order(order_id: int, hidden: int = 0, **fields) -> dict:
+    record = {
+        "id": order_id, "date_recorded": "2024-01-01 10:00:00", "product": f"p{order_id}", "shop": "shop",
+        "price": 10.0, "payment": "โอน", "shipping": "", "status": "รอดำเนินการ", "tracking": f"T{order_id}",
+        "user_id": "", "password": "", "f2a": "", "hidden": hidden,
+    }
+    record.update(fields)
+    return record
+
+
+def sheet_rows(db_path) -> dict:
+    return dict(get_connection(db_path).execute("SELECT order_id, sheet_row FROM sheets_sync"))
+
+
+def free_rows(db_path) -> list:
+    return [r for (r,) in get_connection(db_path).execute("SELECT sheet_row FROM sheets_free_rows ORDER BY sheet_row")]
+
+
+@pytest.fixture
+def backend():
+    return MemorySheetsBackend()
+
+
+@pytest.fixture
+def upstream(backend, db_path):
+    return SheetsUpstream(backend, db_path)
+
+
+def test_first_push_resets_sheet_and_appends(backend, upstream, db_path):
+    backend.rows = {1: ["old header"], 7: ["stale"]}
+    upstream.push([order(1), order(2), order(3)], [])
+
+    assert backend.rows[1] == SHEET_HEADER
+    assert 7 not in backend.rows
+    assert sheet_rows(db_path) == {1: FIRST_DATA_ROW, 2: FIRST_DATA_ROW + 1, 3: FIRST_DATA_ROW + 2}
+    assert [r[0] for r in backend.data_rows()] == ["p1", "p2", "p3"]
+
+
+def test_changed_order_rewritten_in_place(backend, upstream, db_path):
+    upstream.push([order(1), order(2)], [])
+    upstream.push([order(1, product="renamed")], [])
+
+    assert sheet_rows(db_path) == {1: 2, 2: 3}
+    assert backend.updates[-1] == {2: ["renamed"] + backend.rows[2][1:]}
+    assert backend.rows[1] == SHEET_HEADER  # no second reset
+
+
+def test_freed_rows_reused_lowest_first(backend, upstream, db_path):
+    upstream.push([order(i) for i in range(1, 6)], [])  # rows 2..6
+    upstream.push([order(2, hidden=1)], [4])  # frees rows 3 and 5
+
+    assert free_rows(db_path) == [3, 5]
+    assert backend.rows[3] == [""] * len(SHEET_HEADER)
+    assert backend.rows[5] == [""] * len(SHEET_HEADER)
+
+    upstream.push([order(6), order(7), order(8)], [])
+
+    assert sheet_rows(db_path) == {1: 2, 3: 4, 5: 6, 6: 3, 7: 5, 8: 7}
+    assert free_rows(db_path) == []
+    assert [r[0] for r in backend.data_rows()] == ["p1", "p6", "p3", "p7", "p5", "p8"]
+
+
+def test_gone_row_handed_to_new_order_in_same_batch(backend, upstream, db_path):
+    upstream.push([order(1), order(2)], [])
+    upstream.push([order(3)], [1])
+
+    assert sheet_rows(db_path) == {2: 3, 3: 2}
+    assert free_rows(db_path) == []
+    assert backend.updates[-1] == {2: backend.rows[2]}  # overwritten, not blanked first
+
+
+def test_retry_after_failed_write_does_not_duplicate(db_path):
+    backend = FailingBackend()
+    upstream = SheetsUpstream(backend, db_path)
+    upstream.push([order(1), order(2)], [])
+
+    backend.fail = 1
+    with pytest.raises(ConnectionError):
+        upstream.push([order(3), order(4)], [2])
+    upstream.push([order(3), order(4)], [2])  # the outbox retries the same batch
+    upstream.push([order(3), order(4)], [2])
+
+    assert sheet_rows(db_path) == {1: 2, 3: 3, 4: 4}
+    assert free_rows(db_path) == []
+    assert [r[0] for r in backend.data_rows()] == ["p1", "p3", "p4"]
+
+
+def test_retry_after_unacknowledged_write_does_not_duplicate(db_path):
+    backend = FailingBackend(after_write=True)
+    upstream = SheetsUpstream(backend, db_path)
+    upstream.push([order(1)], [])
+
+    backend.fail = 1
+    with pytest.raises(TimeoutError):
+        upstream.push([order(2)], [])
+    # retried together with a newer change that frees a lower row
+    upstream.push([order(2)], [1])
+
+    assert sheet_rows(db_path) == {2: 3}
+    assert [r[0] for r in backend.data_rows()] == ["p2"]
+
+
+def test_retry_blanks_row_of_gone_order(db_path):
+    backend = FailingBackend()
+    upstream = SheetsUpstream(backend, db_path)
+    upstream.push([order(1), order(2)], [])
+
+    backend.fail = 1
+    with pytest.raises(ConnectionError):
+        upstream.push([], [1])
+    assert sheet_rows(db_path) == {1: 2, 2: 3}  # still known, so the retry blanks it
+
+    upstream.push([], [1])
+    assert sheet_rows(db_path) == {2: 3}
+    assert free_rows(db_path) == [2]
+    assert [r[0] for r in backend.data_rows()] == ["p2"]